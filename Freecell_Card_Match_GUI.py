@@ -2,7 +2,6 @@ import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import os
 import cv2
-import numpy as np
 import threading
 import time
 from PIL import Image, ImageTk, ImageGrab
@@ -12,6 +11,9 @@ import re
 from card_splitter import CardSplitter
 import extract_numbers
 import match_numbers
+import card_pipeline
+from recognition_server import RecognitionClient
+from result_cache import ResultCache, pixel_hash
 
 class FreecellOCRApp:
     def __init__(self, root):
@@ -28,8 +30,20 @@ class FreecellOCRApp:
         self.status_var = tk.StringVar()
         self.status_var.set("就绪")
         self.processing = False
+        # 当前图像的内存 BGR 缓冲区（读取剪贴板/选择文件时解码一次，识别直接使用）
         self.current_image = None
+        self.current_image_path = None
         self.template_set = tk.StringVar()
+        # 是否在后台把当前图像保存为 Freecell_Layout.png（查看图片和创建模板使用该文件）
+        self.save_layout = tk.BooleanVar(value=True)
+        # 识别结果缓存：同一截图重复识别时直接返回
+        self.result_cache = ResultCache()
+        # 最近一次写入 Freecell_Layout.png 的像素哈希
+        self.layout_hash = None
+        # 中间图像目录当前对应截图的像素哈希（缓存命中时据此判断是否需要重新写出）
+        self.debug_image_hash = None
+        # 设置了 FREECELL_SERVER 时把识别交给常驻识别服务
+        self.recognition_client = RecognitionClient.from_env()
         
         # 创建界面组件
         self.create_widgets()
@@ -41,8 +55,8 @@ class FreecellOCRApp:
         self.load_template_sets()
     def create_template(self):
         try:
-            image_path = self.image_path.get()
-            if not image_path or not os.path.exists(image_path):
+            image = self.get_current_image()
+            if image is None:
                 messagebox.showinfo("提示", "请先选择有效的图像文件")
                 return
                 
@@ -52,9 +66,6 @@ class FreecellOCRApp:
             self.result_text.insert(tk.END, "正在准备模板创建...\n")
             
             self.update_status("准备模板: 分割纸牌...")
-            image = cv2.imdecode(np.fromfile(image_path, dtype=np.uint8), cv2.IMREAD_COLOR)
-            if image is None:
-                raise Exception("无法读取图像")
             
             splitter = CardSplitter()
             splitter.split_cards(image)
@@ -130,49 +141,6 @@ class FreecellOCRApp:
             # 更新下拉菜单
             self.template_combo['values'] = template_sets
             
-    def check_card_size_and_select_template(self):
-        """根据单张纸牌尺寸选择合适的模板集"""
-        card_dir = "Single_Card_Images"
-        if not os.path.exists(card_dir) or not os.listdir(card_dir):
-            return "set_1"  # 默认模板集
-        
-        # 获取第一张卡片的尺寸
-        card_files = [f for f in os.listdir(card_dir) if f.endswith('.png')]
-        if not card_files:
-            return "set_1"
-            
-        first_card = os.path.join(card_dir, card_files[0])
-        img = cv2.imread(first_card)
-        if img is None:
-            return "set_1"
-        
-        height, width = img.shape[:2]
-        self.update_result(f"检测到单张纸牌尺寸: {width}x{height}\n")
-        
-        # 根据单张纸牌尺寸选择模板集
-        if width >= 200 or height >= 80:  # 高分辨率卡片 (约2880x1440分辨率)
-            template_set = "set_2880x1800"
-        else:  # 标准分辨率卡片 (约1920x1080分辨率)
-            template_set = "set_1920x1080"
-        
-        # 检查选择的模板集是否存在，如果不存在则使用可用的模板集
-        template_dir = os.path.join('Card_Rank_Templates', template_set)
-        if not os.path.exists(template_dir) or not os.listdir(template_dir):
-            # 查找可用的模板集
-            available_sets = []
-            for d in os.listdir('Card_Rank_Templates'):
-                dir_path = os.path.join('Card_Rank_Templates', d)
-                if d.startswith('set_') and os.path.isdir(dir_path) and os.listdir(dir_path):
-                    available_sets.append(d)
-            
-            if available_sets:
-                template_set = available_sets[0]  # 使用第一个可用的模板集
-            else:
-                template_set = "set_1"  # 如果没有可用的模板集，使用默认值
-        
-        self.update_result(f"自动选择模板集: {template_set}\n")
-        return template_set
-
     def create_widgets(self):
         """创建界面组件"""
         # 创建主框架
@@ -218,6 +186,11 @@ class FreecellOCRApp:
         right_template_frame = ttk.Frame(template_frame)
         right_template_frame.pack(side=tk.RIGHT)
         
+        # 保存为 Freecell_Layout.png 选项（后台写入，不阻塞识别）
+        save_layout_check = ttk.Checkbutton(right_template_frame, text="保存为Freecell_Layout.png",
+                                            variable=self.save_layout)
+        save_layout_check.pack(side=tk.LEFT, padx=5, pady=2)
+        
         # 查看图片按钮
         view_btn = ttk.Button(right_template_frame, text="查看图片", command=self.view_image)
         view_btn.pack(side=tk.LEFT, padx=5, pady=2)
@@ -268,21 +241,20 @@ class FreecellOCRApp:
         # 配置滚动条与文本框的关联
         v_scrollbar.config(command=self.result_text.yview)
         h_scrollbar.config(command=self.result_text.xview)
-    def load_preview(self, image_path):
-        """加载并显示图像预览"""
+    def load_preview(self, image):
+        """显示图像预览（image 为内存中的 BGR 数组，先缩小再转换颜色，不重新解码文件）"""
         try:
-            # 读取图像
-            image = Image.open(image_path)
-            
             # 计算缩放比例以适应预览区域
             preview_width = 460  # 留出一些边距
             preview_height = 280  # 留出一些边距
-            ratio = min(preview_width/image.width, preview_height/image.height)
-            new_width = int(image.width * ratio)
-            new_height = int(image.height * ratio)
+            height, width = image.shape[:2]
+            ratio = min(preview_width/width, preview_height/height)
+            new_width = int(width * ratio)
+            new_height = int(height * ratio)
             
             # 调整图像大小
-            image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+            small = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
+            image = Image.fromarray(cv2.cvtColor(small, cv2.COLOR_BGR2RGB))
             # 转换为PhotoImage对象
             photo = ImageTk.PhotoImage(image)
             # 更新预览标签
@@ -303,22 +275,16 @@ class FreecellOCRApp:
         except Exception as e:
             print(f"复制到剪贴板失败: {str(e)}")
 
-    def run_processing(self, image_path):
-        """在后台线程中运行图像处理"""
+    def run_processing(self, image):
+        """在后台线程中运行图像处理（image 为内存中的 BGR 数组）"""
         try:
+            start_time = time.time()
             # 获取选择的模板集
             template_set = self.template_set.get()
             
             # 创建日志文件，但暂不写入内容
             log_file = None
             
-            # 步骤1: 分割纸牌
-            self.update_status("步骤1/3: 分割纸牌...")
-            # 使用numpy读取图像以支持中文路径
-            image = cv2.imdecode(np.fromfile(image_path, dtype=np.uint8), cv2.IMREAD_COLOR)
-            if image is None:
-                raise Exception("无法读取图像")
-            
             # 重定向print输出到GUI
             import sys
             original_stdout = sys.stdout
@@ -336,40 +302,38 @@ class FreecellOCRApp:
             sys.stdout = GuiOutput(self.result_text)
             
             try:
-                # 步骤1: 分割纸牌
-                splitter = CardSplitter()
-                splitter.split_cards(image)
-                self.update_result("✓ 纸牌分割完成，已保存到Single_Card_Images目录\n")
-                
-                # 如果选择了"自动"，根据单张纸牌尺寸自动选择模板集
-                if template_set == "自动":
-                    template_set = self.check_card_size_and_select_template()
-                
-                template_dir = os.path.join('Card_Rank_Templates', template_set)
-                if not os.path.exists(template_dir):
-                    raise Exception(f"模板目录不存在: {template_dir}")
-                
-                self.update_status("步骤2/3: 提取数字和花色...")
-                extract_numbers.process_cards_legacy()
-                self.update_result("✓ 数字和花色提取完成\n")
-                
-                self.update_status("步骤3/3: 识别数字和花色并生成布局...")
+                template_set = 'auto' if template_set == "自动" else template_set
                 
                 log_file = open("Card_Match_Result.log", "w", encoding="utf-8")
                 log_file.write("识别结果,文件名,点数,花色,匹配度,用时\n")
                 
-                # 使用统一模板管理器批量匹配
-                rank_dir, suit_dir = match_numbers.resolve_template_dirs(template_set)
-                if rank_dir is None:
-                    raise Exception(f"未找到可用的点数模板集")
-                
-                self.update_result(f"模板集: rank={os.path.basename(rank_dir)}, suit={os.path.basename(suit_dir or 'N/A')}\n")
-                
-                results_v2, batch_time = match_numbers.process_all_cards_v2_legacy(
-                    rank_dir, suit_dir or '')
+                provisional = {}
+                client = self.recognition_client
+                if client is not None and client.available():
+                    # 交给常驻识别服务（模板集和缓存已预热），发送原始像素免编码
+                    # 识别服务不写出中间图像
+                    self.clear_image_directories()
+                    self.debug_image_hash = None
+                    self.update_status("识别服务处理中...")
+                    record = client.recognize_image(image, template_set=template_set)
+                    if 'error' in record:
+                        raise Exception(f"识别服务: {record['error']}")
+                    self.update_result(f"✓ 已由识别服务完成，服务端用时 {record['timings']['server']}ms\n")
+                    card_results = [{
+                        'number': c['label'][0],
+                        'suit': c['label'][1:],
+                        'color': '_r' if '_r.' in c['filename'] else '_b',
+                        'filename': c['filename'],
+                        'rank_confidence': c['rank_confidence'],
+                        'time_ms': 0,
+                        **({'margin': c['margin']} if 'margin' in c else {}),
+                    } for c in record['cards']]
+                else:
+                    card_results = self._recognize_locally(image, template_set, provisional)
                 
+                # 有花色模板时流结束后在整副牌上做一对一指派（就地修正结果），避免出现重复牌
                 results = []
-                for r in results_v2:
+                for r in card_results:
                     number = r['number']
                     suit = r['suit']
                     color_simple = r['color']
@@ -377,15 +341,17 @@ class FreecellOCRApp:
                     confidence = r['rank_confidence']
                     card_time = r['time_ms']
                     
+                    if provisional and provisional.get(filename) != f"{number}{suit}":
+                        self.update_result(f"整副牌指派修正: {filename} {provisional.get(filename)} → {number}{suit}\n")
+                    
                     log_line = f"识别成功: {filename} , {number}{suit} , [{confidence:.1f}%] , [{card_time}ms]\n"
-                    if number is None:
+                    if number == '?':
                         log_line = f"识别失败: {filename} , FAIL , [0.0%] , [{card_time}ms]\n"
                     
                     log_file.write(log_line)
-                    self.update_result(log_line.strip() + "\n")
                     
                     results.append({
-                        'number': number if number else '?',
+                        'number': number,
                         'suit': suit,
                         'color': color_simple,
                         'filename': filename,
@@ -393,7 +359,8 @@ class FreecellOCRApp:
                 
                 if results:
                     columns = match_numbers.results_to_columns(results)
-                    layout_lines, is_valid, errors = match_numbers.format_columns_to_text(columns)
+                    layout_lines, is_valid, errors = match_numbers.format_columns_to_text(
+                        columns, extra_errors=match_numbers.deck_confidence_errors(card_results))
                     
                     # 显示在GUI中
                     self.update_result("\nFreecell Layout:\n")
@@ -448,6 +415,38 @@ class FreecellOCRApp:
             # 完成处理
             self.root.after(0, self.finish_processing)
 
+    def _recognize_locally(self, image, template_set, provisional):
+        """分割 → 提取 → 匹配 流式串联：每张卡片切出后立即识别并显示。
+        中间图像仍写入 Single_Card_Images / Card_Rank_Images / Card_Suit_Images 供查看。
+        provisional 记录流式阶段的结果，返回整副牌指派修正后的结果列表"""
+        self.update_status("分割、提取并识别纸牌...")
+        stream = card_pipeline.recognize_stream(image, template_set=template_set,
+                                                debug_dir='.', cache=self.result_cache)
+        # 命中缓存时不写出中间图像：目录中已是这张截图的图像则保留，
+        # 否则不查缓存重新识别一次，以便查看卡片
+        hit = stream.cache_hit()
+        image_hash = pixel_hash(image)
+        if not hit or image_hash != self.debug_image_hash:
+            self.clear_image_directories()
+            self.debug_image_hash = None
+            if hit:
+                stream = card_pipeline.recognize_stream(image, template_set=template_set,
+                                                        debug_dir='.')
+        for r in stream:
+            if not provisional:
+                if stream.cached:
+                    self.update_result("✓ 命中识别缓存，跳过分割和匹配\n")
+                # 第一张结果产出时卡片尺寸和模板集已确定
+                card_w, card_h = stream.card_size
+                rank_dir, suit_dir = stream.template_dirs
+                self.update_result(f"检测到单张纸牌尺寸: {card_w}x{card_h}\n")
+                self.update_result(f"模板集: rank={os.path.basename(rank_dir)}, suit={os.path.basename(suit_dir or 'N/A')}\n")
+            provisional[r['filename']] = f"{r['number']}{r['suit']}"
+            self.update_status(f"已识别 {len(provisional)} 张纸牌...")
+            self.update_result(f"{r['filename']} , {r['number']}{r['suit']} , [{r['rank_confidence']:.1f}%]\n")
+        self.debug_image_hash = image_hash
+        return stream.results
+    
     def update_status(self, message):
         """更新状态信息（线程安全）"""
         self.root.after(0, lambda: self.status_var.set(message))
@@ -474,17 +473,37 @@ class FreecellOCRApp:
             else:
                 os.makedirs(dir_name, exist_ok=True)
                 
+    def get_current_image(self):
+        """返回当前图像的 BGR 缓冲区；路径输入框被手动修改时按新路径解码一次"""
+        image_path = self.image_path.get()
+        if image_path and image_path != self.current_image_path and os.path.isfile(image_path):
+            image = card_pipeline.load_image(image_path)
+            if image is None:
+                return None
+            self.set_current_image(image, image_path)
+        return self.current_image
+    
+    def set_current_image(self, image, image_path):
+        """设置当前图像缓冲区；图像就是 Freecell_Layout.png 本身时记下其哈希，之后不再重写"""
+        self.current_image = image
+        self.current_image_path = image_path
+        layout_path = "Freecell_Layout.png"
+        if os.path.exists(layout_path) and os.path.samefile(image_path, layout_path):
+            self.layout_hash = pixel_hash(image)
+    
     def save_current_image_as_layout(self):
-        """将当前载入的图像保存为Freecell_Layout.png"""
+        """在后台线程中把当前图像保存为Freecell_Layout.png（未勾选保存选项时跳过）"""
+        if not self.save_layout.get() or self.current_image is None:
+            return
         try:
-            image_path = self.image_path.get()
-            if image_path and os.path.exists(image_path):
-                # 读取原始图像
-                image = Image.open(image_path)
-                # 保存为Freecell_Layout.png，覆盖已有文件
-                layout_path = "Freecell_Layout.png"
-                image.save(layout_path)
-                self.update_result(f"已保存当前图像为 {layout_path}\n")
+            layout_path = "Freecell_Layout.png"
+            # 内容与 Freecell_Layout.png 上次写入（或读取）的相同时不重写
+            image_hash = pixel_hash(self.current_image)
+            if image_hash == self.layout_hash and os.path.exists(layout_path):
+                return
+            self.layout_hash = image_hash
+            card_pipeline.save_image_async(self.current_image, layout_path)
+            self.update_result(f"已在后台保存当前图像为 {layout_path}\n")
         except Exception as e:
             self.update_result(f"保存图像失败: {str(e)}\n")
     
@@ -494,16 +513,13 @@ class FreecellOCRApp:
             messagebox.showinfo("提示", "正在处理中，请稍候...")
             return
         
-        image_path = self.image_path.get()
-        if not image_path or not os.path.exists(image_path):
+        image = self.get_current_image()
+        if image is None:
             messagebox.showinfo("提示", "请先选择有效的图像文件")
             return
             
-        # 保存当前图像为Freecell_Layout.png
+        # 保存当前图像为Freecell_Layout.png（后台写入）
         self.save_current_image_as_layout()
-            
-        # 开始处理前先清空目录
-        self.clear_image_directories()
         
         # 开始处理
         self.processing = True
@@ -512,7 +528,7 @@ class FreecellOCRApp:
         self.result_text.delete(1.0, tk.END)
         self.result_text.insert(tk.END, "开始处理图像...\n")
         # 在新线程中运行处理过程
-        thread = threading.Thread(target=self.run_processing, args=(image_path,))
+        thread = threading.Thread(target=self.run_processing, args=(image,))
         thread.daemon = True
         thread.start()
     # 在 create_widgets 方法后添加 browse_file 方法
@@ -525,8 +541,14 @@ class FreecellOCRApp:
             ]
             filename = filedialog.askopenfilename(title="选择FreeCell游戏截图", filetypes=filetypes)
             if filename:
+                # 只解码一次，预览和识别共用同一个缓冲区
+                image = card_pipeline.load_image(filename)
+                if image is None:
+                    messagebox.showerror("错误", "无法读取图像")
+                    return
+                self.set_current_image(image, filename)
                 self.image_path.set(filename)
-                self.load_preview(filename)
+                self.load_preview(image)
         except Exception as e:
             messagebox.showerror("错误", f"选择文件时出错: {str(e)}")
     def read_clipboard(self):
@@ -538,13 +560,16 @@ class FreecellOCRApp:
                 messagebox.showerror("错误", "剪贴板中没有图像")
                 return
             
-            # 直接保存为Freecell_Layout.png
-            layout_path = "Freecell_Layout.png"
-            image.save(layout_path)
+            # 直接转换为内存 BGR 缓冲区，不经过 PNG 编码/解码
+            self.current_image = card_pipeline.pil_to_bgr(image)
+            layout_path = os.path.abspath("Freecell_Layout.png")
+            self.current_image_path = layout_path
+            # 需要时在后台保存为Freecell_Layout.png（与上次写入相同时不重写）
+            self.save_current_image_as_layout()
             
             # 设置路径并预览
-            self.image_path.set(os.path.abspath(layout_path))
-            self.load_preview(layout_path)
+            self.image_path.set(layout_path)
+            self.load_preview(self.current_image)
             self.status_var.set("已从剪贴板读取图像")
             
         except Exception as e:
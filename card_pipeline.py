@@ -0,0 +1,539 @@
+"""
+FreeCell纸牌识别流水线（内存版）
+
+截图 → 分割 → 提取 → 匹配 全程在内存中完成：
+- CardSplitter.split_boxes() 返回卡片区域，卡片即截图的 NumPy 视图
+- ColorPlanes 每张截图只做一次 HSV 转换和颜色掩码，分割与提取共用
+- extract_numbers.*_from_card() 直接处理卡片数组
+- match_numbers.match_*_images() 直接匹配图像数组
+中间图像目录（Single_Card_Images 等）只在指定 debug_dir 时写出。
+
+各阶段都是生成器（split_stage / extract_*_stage / match_numbers.iter_match_*），
+RecognitionStream 把它们串联起来，每张卡片切出后立即提取、匹配并产出结果。
+
+传入 ResultCache 时，同一截图（像素相同、参数和模板集未变）直接返回缓存结果。
+"""
+
+import itertools
+import os
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from card_splitter import CardSplitter
+from color_planes import ColorPlanes
+from result_cache import ResultCache
+import extract_numbers
+import match_numbers
+
+RECOGNIZE_MODES = ('legacy', 'combined')
+
+
+def load_image(image_path: str) -> Optional[np.ndarray]:
+    """读取 BGR 图像（支持中文路径）"""
+    return cv2.imdecode(np.fromfile(image_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def pil_to_bgr(image) -> np.ndarray:
+    """PIL 图像（如剪贴板截图）→ BGR 数组
+    直接读取 PIL 像素缓冲区并做一次颜色转换，不经过 PNG 编码/解码"""
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGB')
+    code = cv2.COLOR_RGBA2BGR if image.mode == 'RGBA' else cv2.COLOR_RGB2BGR
+    return cv2.cvtColor(np.asarray(image), code)
+
+
+def save_image(image: np.ndarray, path: str) -> bool:
+    """保存 BGR 图像（支持中文路径），先写临时文件再替换，读者不会看到半写的文件"""
+    ext = os.path.splitext(path)[1] or '.png'
+    ok, data = cv2.imencode(ext, image)
+    if not ok:
+        return False
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    data.tofile(tmp_path)
+    os.replace(tmp_path, path)
+    return True
+
+
+def save_image_async(image: np.ndarray, path: str) -> threading.Thread:
+    """在后台线程中保存图像，不阻塞识别（调用方之后不应再修改 image）"""
+    thread = threading.Thread(target=save_image, args=(image, path), daemon=True)
+    thread.start()
+    return thread
+
+
+def _tee_debug(items: Iterable[Tuple], debug_dir: str,
+               outputs: List[Tuple[str, int]]) -> Iterator[Tuple]:
+    """调试输出：逐项透传，同时把 item[index] 写到 debug_dir/subdir/{名称}.png
+    名称取 item[0] 去掉扩展名
+    """
+    for subdir, _ in outputs:
+        os.makedirs(os.path.join(debug_dir, subdir), exist_ok=True)
+    for item in items:
+        name = os.path.splitext(item[0])[0]
+        for subdir, index in outputs:
+            # 惰性花色（无参函数）尚未提取，不写出
+            if item[index] is not None and not callable(item[index]):
+                cv2.imwrite(os.path.join(debug_dir, subdir, f"{name}.png"), item[index])
+        yield item
+
+
+def _union_box(boxes: List[Tuple[int, int, int, int]]) -> Tuple[int, int, int, int]:
+    """多个 (y0, y1, x0, x1) 区域的外接框"""
+    if not boxes:
+        return 0, 0, 0, 0
+    return (min(b[0] for b in boxes), max(b[1] for b in boxes),
+            min(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+# ============================================================
+# 流水线阶段（生成器）
+# ============================================================
+
+def split_stage(image: np.ndarray,
+                planes: Optional[ColorPlanes] = None,
+                column_detector: str = 'contour',
+                segmentation: str = 'deal') -> Iterator[Tuple[str, np.ndarray, ColorPlanes]]:
+    """分割阶段：检测完列后逐张产出 (列号行号, 卡片视图, 卡片 ColorPlanes 视图)
+    column_detector: 'contour' 轮廓法 / 'projection' 投影法（见 CardSplitter）
+    segmentation: 'deal' 开局布局 / 'profile' 行边界检测（牌局中途，每列 0-19 张）"""
+    if planes is None:
+        planes = ColorPlanes(image)
+    splitter = CardSplitter(output_dir=None, column_detector=column_detector, segmentation=segmentation)
+    boxes = splitter.split_boxes(image, planes)
+    if not boxes:
+        return
+    # 颜色掩码只在牌桌区域（所有卡片的外接框）内计算一次，各卡片取其切片
+    ty0, ty1, tx0, tx1 = _union_box([box for _, box in boxes])
+    table = planes.roi(ty0, ty1, tx0, tx1)
+    # 分割器在缩小图上检测时整图 HSV 未计算，这里只转换牌桌区域，各卡片切片复用
+    table.hsv
+    for name, (y0, y1, x0, x1) in boxes:
+        yield name, image[y0:y1, x0:x1], table.roi(y0 - ty0, y1 - ty0, x0 - tx0, x1 - tx0)
+
+
+def extract_legacy_stage(cards: Iterable[Tuple[str, np.ndarray, ColorPlanes]],
+                         lazy_suit: bool = False
+                         ) -> Iterator[Tuple[str, str, np.ndarray, Optional[np.ndarray]]]:
+    """点数+花色提取阶段：产出 (filename, color, number_img, suit_img)，提取失败的卡片跳过
+    lazy_suit: suit_img 为调用时才裁切花色的无参函数，由匹配阶段决定是否调用"""
+    for name, card, card_planes in cards:
+        item = extract_numbers.extract_legacy_from_card(card, planes=card_planes, lazy_suit=lazy_suit)
+        if item is None:
+            continue
+        number_img, suit_img, color_type = item
+        yield f"{name}{color_type}.png", color_type, number_img, suit_img
+
+
+def extract_info_stage(cards: Iterable[Tuple[str, np.ndarray, ColorPlanes]]
+                       ) -> Iterator[Tuple[str, np.ndarray]]:
+    """整体信息提取阶段：产出 (filename, info_img)"""
+    for name, card, card_planes in cards:
+        info_img, color_type = extract_numbers.extract_info_from_card(card, card_planes)
+        yield f"{name}{color_type}.png", info_img
+
+
+def extract_info_batch_stage(cards: List[Tuple[str, np.ndarray, ColorPlanes]]
+                             ) -> List[Tuple[str, np.ndarray]]:
+    """extract_info_stage 的整批版本：整副牌的信息区域拼成一张图一次二值化（非流式调用使用）"""
+    extracted = extract_numbers.extract_info_from_cards(
+        [(card, card_planes) for _, card, card_planes in cards])
+    return [(f"{name}{color_type}.png", info_img)
+            for (name, _, _), (info_img, color_type) in zip(cards, extracted)]
+
+
+def _probe_samples(mode: str, extracted: List[Tuple]) -> List[Tuple[np.ndarray, str]]:
+    """探测模板集用的样本（最先提取的 PROBE_SAMPLE_COUNT 张）：
+    legacy 为 (点数图像, 颜色)，combined 为 (信息图像, '')"""
+    extracted = extracted[:match_numbers.PROBE_SAMPLE_COUNT]
+    if mode == 'legacy':
+        return [(number_img, color) for _, color, number_img, _ in extracted]
+    return [(info_img, '') for _, info_img in extracted]
+
+
+def _resolve_templates(mode: str, template_set: str, card_w: int, card_h: int,
+                       deck_constraint: Optional[bool],
+                       samples: Optional[List[Tuple[np.ndarray, str]]] = None) -> Tuple[Tuple, bool]:
+    """按模式解析模板集目录和是否启用整副牌指派，返回 (template_dirs, deck_constraint)
+    samples: 'auto' 时用于探测式选择模板集（同尺寸已记忆时不使用）；None 时 'auto' 即规范化模板集"""
+    if mode not in RECOGNIZE_MODES:
+        raise ValueError(f"未知的识别模式: {mode}，可选: {', '.join(RECOGNIZE_MODES)}")
+    if template_set == 'auto' and samples is not None:
+        template_set = match_numbers.select_template_set(mode, (card_w, card_h), samples)
+    if mode == 'legacy':
+        rank_dir, suit_dir = match_numbers.resolve_template_dirs(template_set)
+        if rank_dir is None:
+            raise ValueError("未找到可用的点数模板集")
+        if deck_constraint is None:
+            deck_constraint = suit_dir is not None
+        return (rank_dir, suit_dir), deck_constraint
+    info_dir = match_numbers.resolve_info_template_dir(template_set)
+    if info_dir is None:
+        raise ValueError("未找到可用的整体模板集")
+    if deck_constraint is None:
+        deck_constraint = True
+    return (info_dir,), deck_constraint
+
+
+def _summarize(results: List[Dict]) -> Tuple[List[str], bool, List[str]]:
+    """未识别的点数记为 '?'，生成布局文本；整副牌指派中的低置信度卡片记为错误"""
+    for result in results:
+        if result['number'] is None:
+            result['number'] = '?'
+    columns = match_numbers.results_to_columns(results)
+    return match_numbers.format_columns_to_text(
+        columns, extra_errors=match_numbers.deck_confidence_errors(results))
+
+
+def _count_suit_skipped(results: List[Dict]) -> int:
+    """惰性花色模式下跳过花色提取的卡片数"""
+    return sum(1 for result in results if result.get('suit_skipped'))
+
+
+def _timed(items: Iterable, spent: Dict[str, float], key: str) -> Iterator:
+    """包装阶段迭代器，把每次取下一项的用时（含上游阶段）累计到 spent[key]（秒）"""
+    spent.setdefault(key, 0.0)
+    return _timed_iter(iter(items), spent, key)
+
+
+def _timed_iter(iterator: Iterator, spent: Dict[str, float], key: str) -> Iterator:
+    while True:
+        start = time.time()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            spent[key] += time.time() - start
+            return
+        spent[key] += time.time() - start
+        yield item
+
+
+# ============================================================
+# 流式识别
+# ============================================================
+
+class RecognitionStream:
+    """
+    流式识别一张截图：迭代时逐张产出结果字典（格式同 recognize()['results'] 的元素）。
+    
+    - 第一张结果产出时 card_size / template_dirs 已可用
+    - 迭代结束后 results / layout / valid / errors / timings 可用
+      （timings 与 recognize() 相同的 split/extract/match/total，另有首张结果用时 first）
+    - 整副牌一对一指派需要全部卡片，在最后一张产出后进行，
+      并就地改写已产出的结果字典（调用方持有的引用随之更新）
+    - 指定 cache 且命中时直接产出缓存的结果（cached 为 True，不写调试图像）
+    """
+    
+    def __init__(self, image: np.ndarray, template_set: str = 'auto', mode: str = 'legacy',
+                 deck_constraint: Optional[bool] = None, debug_dir: Optional[str] = None,
+                 cache: Optional[ResultCache] = None,
+                 glyph_cache: Optional[match_numbers.GlyphCache] = None,
+                 column_detector: str = 'contour', segmentation: str = 'deal',
+                 lazy_suit: bool = False):
+        if mode not in RECOGNIZE_MODES:
+            raise ValueError(f"未知的识别模式: {mode}，可选: {', '.join(RECOGNIZE_MODES)}")
+        self.image = image
+        self.template_set = template_set
+        self.mode = mode
+        self.deck_constraint = deck_constraint
+        self.debug_dir = debug_dir
+        self.cache = cache
+        self.glyph_cache = glyph_cache
+        self.column_detector = column_detector
+        self.segmentation = segmentation
+        self.lazy_suit = lazy_suit
+        
+        self.cached = False
+        self.card_size: Tuple[int, int] = (0, 0)
+        self.template_dirs: Tuple = ()
+        self.results: List[Dict] = []
+        self.layout: List[str] = []
+        self.valid = False
+        self.errors: List[str] = []
+        self.timings: Dict[str, int] = {}
+    
+    def as_dict(self) -> Dict:
+        """迭代结束后的结果，格式同 recognize()"""
+        return {
+            'results': self.results,
+            'layout': self.layout,
+            'valid': self.valid,
+            'errors': self.errors,
+            'card_size': self.card_size,
+            'template_dirs': self.template_dirs,
+            'suit_skipped': _count_suit_skipped(self.results),
+            'timings': self.timings,
+            'cached': self.cached,
+        }
+    
+    def _cache_key(self) -> str:
+        return self.cache.key(self.image, template_set=self.template_set, mode=self.mode,
+                              deck_constraint=self.deck_constraint,
+                              column_detector=self.column_detector,
+                              segmentation=self.segmentation, lazy_suit=self.lazy_suit)
+    
+    def cache_hit(self) -> bool:
+        """迭代前检查结果缓存是否命中（命中时迭代不分割截图，也不写调试图像）"""
+        return self.cache is not None and self.cache.get(self._cache_key()) is not None
+    
+    def __iter__(self) -> Iterator[Dict]:
+        start_time = time.time()
+        self.results = []
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self._cache_key()
+            outcome = self.cache.get(cache_key)
+            if outcome is not None:
+                self.cached = True
+                self.card_size = outcome['card_size']
+                self.template_dirs = outcome['template_dirs']
+                self.layout, self.valid, self.errors = outcome['layout'], outcome['valid'], outcome['errors']
+                for result in outcome['results']:
+                    self.results.append(result)
+                    yield result
+                elapsed = int((time.time() - start_time) * 1000)
+                self.timings = {'split': 0, 'extract': 0, 'match': 0, 'first': elapsed, 'total': elapsed}
+                return
+        
+        # 各阶段交错执行，分别累计每个阶段迭代器（含其上游阶段）的用时，结束时相减得到各阶段用时
+        spent: Dict[str, float] = {}
+        cards = _timed(split_stage(self.image, column_detector=self.column_detector,
+                                   segmentation=self.segmentation), spent, 'split')
+        first = next(cards, None)
+        if first is None:
+            return
+        card_h, card_w = first[1].shape[:2]
+        self.card_size = (card_w, card_h)
+        
+        cards = itertools.chain([first], cards)
+        if self.debug_dir:
+            cards = _tee_debug(cards, self.debug_dir, [('Single_Card_Images', 1)])
+        
+        if self.mode == 'legacy':
+            extracted = extract_legacy_stage(cards, self.lazy_suit)
+            if self.debug_dir:
+                extracted = _tee_debug(extracted, self.debug_dir,
+                                       [('Card_Rank_Images', 2), ('Card_Suit_Images', 3)])
+        else:
+            extracted = extract_info_stage(cards)
+            if self.debug_dir:
+                extracted = _tee_debug(extracted, self.debug_dir, [('Card_Info_Images', 1)])
+        extracted = _timed(extracted, spent, 'extract')
+        split_before = spent['split']  # 第一张卡片（含列检测）已在提取开始前分割
+        
+        # 'auto' 且该尺寸未探测过时，先取出最先提取的几张卡片探测模板集，再接回流中
+        # （每个卡片尺寸只发生一次，之后的截图直接流式匹配）
+        head = []
+        if self.template_set == 'auto':
+            template_base = 'Card_Rank_Templates' if self.mode == 'legacy' else 'Card_Info_Templates'
+            if match_numbers.TemplateSetSelector.lookup(template_base, self.card_size) is None:
+                head = list(itertools.islice(extracted, match_numbers.PROBE_SAMPLE_COUNT))
+                extracted = itertools.chain(head, extracted)
+        resolve_start = time.time()
+        self.template_dirs, deck_constraint = _resolve_templates(
+            self.mode, self.template_set, card_w, card_h, self.deck_constraint,
+            _probe_samples(self.mode, head))
+        spent['resolve'] = time.time() - resolve_start
+        
+        if self.mode == 'legacy':
+            rank_dir, suit_dir = self.template_dirs
+            matched = match_numbers.iter_match_rank_suit_images(
+                extracted, rank_dir, suit_dir or '', deck_constraint, self.lazy_suit)
+        else:
+            matched = match_numbers.iter_match_info_images(
+                extracted, self.template_dirs[0], deck_constraint, self.glyph_cache)
+        
+        first_time = None
+        extract_before = spent['extract']  # 探测样本已在匹配开始前提取
+        for result in _timed(matched, spent, 'match'):
+            if result['number'] is None:
+                result['number'] = '?'
+            self.results.append(result)
+            if first_time is None:
+                first_time = time.time()
+            yield result
+        
+        self.layout, self.valid, self.errors = _summarize(self.results)
+        end_time = time.time()
+        split_time = spent['split']
+        # 各阶段扣除其间拉取上游阶段的用时
+        extract_time = spent['extract'] - (split_time - split_before)
+        # match 含模板集解析（探测）
+        match_time = spent['match'] - (spent['extract'] - extract_before) + spent['resolve']
+        self.timings = {
+            'split': int(split_time * 1000),
+            'extract': int(extract_time * 1000),
+            'match': int(match_time * 1000),
+            'first': int(((first_time or end_time) - start_time) * 1000),
+            'total': int((end_time - start_time) * 1000),
+        }
+        if cache_key is not None:
+            self.cache.put(cache_key, self.as_dict())
+
+
+def recognize_stream(image: np.ndarray, template_set: str = 'auto', mode: str = 'legacy',
+                     deck_constraint: Optional[bool] = None,
+                     debug_dir: Optional[str] = None,
+                     cache: Optional[ResultCache] = None,
+                     glyph_cache: Optional[match_numbers.GlyphCache] = None,
+                     column_detector: str = 'contour',
+                     segmentation: str = 'deal',
+                     lazy_suit: bool = False) -> RecognitionStream:
+    """流式版 recognize()，参数相同；返回可迭代的 RecognitionStream"""
+    return RecognitionStream(image, template_set, mode, deck_constraint, debug_dir, cache,
+                             glyph_cache, column_detector, segmentation, lazy_suit)
+
+
+# ============================================================
+# 整张识别
+# ============================================================
+
+def recognize(image: np.ndarray, template_set: str = 'auto', mode: str = 'legacy',
+              deck_constraint: Optional[bool] = None,
+              debug_dir: Optional[str] = None,
+              cache: Optional[ResultCache] = None,
+              glyph_cache: Optional[match_numbers.GlyphCache] = None,
+              column_detector: str = 'contour',
+              segmentation: str = 'deal',
+              lazy_suit: bool = False) -> Dict:
+    """
+    识别一张 FreeCell 截图。
+    
+    image: BGR 截图
+    template_set: 模板集名称或 'auto'（用最先提取的几张卡片探测各模板集，按卡片尺寸记忆选择结果）
+    mode: 'legacy' 点数+花色分离匹配（Card_Rank/Suit_Templates）；
+          'combined' 整体模板匹配（Card_Info_Templates）
+    deck_constraint: 整副牌一对一指派；None 时 legacy 模式在有花色模板时启用，
+                     combined 模式始终启用
+    debug_dir: 指定时把中间图像按原目录结构写到该目录下
+    cache: 结果缓存；命中时直接返回（不写调试图像），未命中时识别后写入
+    glyph_cache: 字形缓存（combined 模式），重复出现的牌面跳过模板匹配
+    column_detector: 列检测方式，'contour' 轮廓法 / 'projection' 投影法
+    segmentation: 'deal' 开局布局（前4列7张、后4列6张）；'profile' 按行边界检测每列张数（牌局中途）
+    lazy_suit: legacy 模式下惰性提取花色：点数可信且同色只剩一个未用花色时跳过花色提取和匹配
+    
+    返回: {
+        'results': [...],          # 同 process_all_cards_* 的结果
+        'layout': [...],           # format_columns_to_text 的布局行
+        'valid': bool, 'errors': [...],
+        'card_size': (w, h), 'template_dirs': (dir, ...),
+        'suit_skipped': int,       # lazy_suit 跳过的花色提取数
+        'timings': {'split': ms, 'extract': ms, 'match': ms, 'total': ms},
+        'cached': bool,            # 是否来自结果缓存
+    }
+    """
+    if mode not in RECOGNIZE_MODES:
+        raise ValueError(f"未知的识别模式: {mode}，可选: {', '.join(RECOGNIZE_MODES)}")
+    start_time = time.time()
+    
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.key(image, template_set=template_set, mode=mode,
+                              deck_constraint=deck_constraint, column_detector=column_detector,
+                              segmentation=segmentation, lazy_suit=lazy_suit)
+        outcome = cache.get(cache_key)
+        if outcome is not None:
+            elapsed = int((time.time() - start_time) * 1000)
+            outcome['timings'] = {'split': 0, 'extract': 0, 'match': 0, 'total': elapsed}
+            outcome['cached'] = True
+            return outcome
+    
+    cards: Iterable = split_stage(image, column_detector=column_detector, segmentation=segmentation)
+    if debug_dir:
+        cards = _tee_debug(cards, debug_dir, [('Single_Card_Images', 1)])
+    cards = list(cards)
+    split_done = time.time()
+    
+    card_h, card_w = cards[0][1].shape[:2] if cards else (0, 0)
+    
+    if mode == 'legacy':
+        extracted: Iterable = extract_legacy_stage(cards, lazy_suit)
+        if debug_dir:
+            extracted = _tee_debug(extracted, debug_dir,
+                                   [('Card_Rank_Images', 2), ('Card_Suit_Images', 3)])
+        extracted = list(extracted)
+        extract_done = time.time()
+        
+        template_dirs, deck_constraint = _resolve_templates(
+            mode, template_set, card_w, card_h, deck_constraint,
+            _probe_samples(mode, extracted))
+        rank_dir, suit_dir = template_dirs
+        results = match_numbers.match_rank_suit_images(
+            extracted, rank_dir, suit_dir or '', deck_constraint, lazy_suit)
+    else:
+        extracted = extract_info_batch_stage(cards)
+        if debug_dir:
+            extracted = list(_tee_debug(extracted, debug_dir, [('Card_Info_Images', 1)]))
+        extract_done = time.time()
+        
+        template_dirs, deck_constraint = _resolve_templates(
+            mode, template_set, card_w, card_h, deck_constraint,
+            _probe_samples(mode, extracted))
+        # 整体模板按整副牌一次矩阵运算，比逐张匹配更快
+        results = match_numbers.match_info_images(extracted, template_dirs[0], deck_constraint,
+                                                  glyph_cache)
+    match_done = time.time()
+    
+    layout_lines, is_valid, errors = _summarize(results)
+    
+    outcome = {
+        'results': results,
+        'layout': layout_lines,
+        'valid': is_valid,
+        'errors': errors,
+        'card_size': (card_w, card_h),
+        'template_dirs': template_dirs,
+        'suit_skipped': _count_suit_skipped(results),
+        'timings': {
+            'split': int((split_done - start_time) * 1000),
+            'extract': int((extract_done - split_done) * 1000),
+            'match': int((match_done - extract_done) * 1000),
+            'total': int((match_done - start_time) * 1000),
+        },
+        'cached': False,
+    }
+    if cache_key is not None:
+        cache.put(cache_key, outcome)
+    return outcome
+
+
+def outcome_to_record(outcome: Dict) -> Dict:
+    """recognize() 的结果 → 可 JSON 序列化的记录（CLI / 识别服务共用）"""
+    cards = []
+    for r in outcome['results']:
+        card = {
+            'card': r['filename'].split('_')[0].split('.')[0],
+            'filename': r['filename'],
+            'label': f"{r['number']}{r['suit']}",
+            'rank_confidence': round(float(r['rank_confidence']), 2),
+            'suit_confidence': round(float(r['suit_confidence']), 2),
+        }
+        if 'margin' in r:
+            card['margin'] = round(float(r['margin']), 2)
+        cards.append(card)
+    return {
+        'valid': outcome['valid'],
+        'errors': outcome['errors'],
+        'layout': outcome['layout'],
+        'card_size': list(outcome['card_size']),
+        'template_dirs': [d for d in outcome['template_dirs'] if d],
+        'suit_skipped': outcome.get('suit_skipped', 0),
+        'cards': cards,
+        'timings': dict(outcome['timings']),
+        'cached': outcome.get('cached', False),
+    }
+
+
+if __name__ == "__main__":
+    layout_path = "Freecell_Layout.png"
+    image = load_image(layout_path)
+    if image is None:
+        print(f"错误: 无法读取图像{layout_path}")
+        exit(1)
+    outcome = recognize(image)
+    for line in outcome['layout']:
+        print(line)
+    print(f"\n用时: {outcome['timings']}")
@@ -14,83 +14,504 @@ FreeCell纸牌图像裁切模块
    - 应用形态学闭运算去除噪点
    - 通过轮廓检测识别纸牌列
    - 使用面积、高度比等条件过滤有效列
+   - 可选投影法（column_detector='projection'）：对非绿色掩码做列/行占用投影，
+     用一维游程分析找出8列区间和列高度，不做闭运算和轮廓检测；
+     发光或遮挡只连接相邻列的一小段时，该处投影低于阈值，两列不会合并
+   - 低分辨率检测（detect_scale > 1）：在缩小 detect_scale 倍的图上检测列，
+     再在全分辨率图上每条边缘附近的小窗口内精确定位左右边缘和上下边缘（即列高和牌高），
+     判定条件与所用列检测方式的全分辨率检测相同，结果逐像素一致，
+     整图 HSV 转换和掩码只在缩小图上进行
 
 2. 高度计算
    - 获取第一列(7张牌)和第五列(6张牌)的高度
    - 计算高度差得到单张纸牌高度
    - 根据列号确定每列纸牌数量(前4列7张，后4列6张)
+   - 可选行边界检测（segmentation='profile'，适用于牌局中途）：
+     每列 0-19 张牌，列按间距和截图水平居中对齐到 8 个列位（空列也占位）；
+     一次灰度化牌桌区域，用 np.add.reduceat 同时得到 8 列每行的边框线像素数，
+     边框线（灰度约 212）横贯整列宽度的行即一张牌的上边缘，单张牌高取相邻上边缘间距的中位数
 
 3. 单牌分割
    - 从上到下按计算得到的高度裁切
    - 保持原始图像质量不缩放
-   - 使用"列号行号.png"格式保存
+   - split() 返回原图的 NumPy 视图，不复制像素
+   - split_cards() 额外使用"列号行号.png"格式保存（output_dir 为 None 时不落盘）
+   - iter_split()/iter_boxes() 为生成器版本，检测完列后逐张产出，供流式流水线使用
+
+4. 布局几何缓存（LayoutCache）
+   - 同一显示器、同一游戏窗口的截图列位置和牌高完全相同
+   - geometry() 按截图尺寸和检测参数（分割方式、列检测方式、检测缩小倍数）缓存列区域、牌高、卡片尺寸
+   - 新截图只在每列四条边缘内外两侧采样少量像素，与缓存时的颜色（绿色/非绿色）比对，
+     全部一致即跳过列检测；不一致（窗口移动、牌局变化）时重新检测并覆盖缓存
 """
 
 import cv2
 import numpy as np
-from typing import List, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 import os
+import threading
+
+from color_planes import ColorPlanes
+
+COLUMN_DETECTORS = ('contour', 'projection')
+SEGMENTATION_MODES = ('deal', 'profile')
+
+MAX_COLUMN_CARDS = 19             # 一列最多 19 张（6 张发牌 + K 到 A 的 13 张）
+BORDER_GRAY_RANGE = (190, 235)    # 纸牌边框线灰度（白色牌面约 250，绿色背景约 90）
+COLUMN_PITCH_RATIO = 1.4          # 列间距 / 列宽（用于空列定位）
+CARD_STRIDE_RATIO = 0.39          # 单张牌露出高度 / 列宽（每列只有一张牌时的估计值）
+STRIDE_TOLERANCE = 0.05           # 列内上边缘间距与整体间距的相对差不超过此值视为未压缩
+
+
+def _runs(flags: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """一维布尔序列中连续 True 段的 [起点, 终点) 数组"""
+    edges = np.diff(np.concatenate(([0], flags.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+class LayoutCache:
+    """布局几何缓存：(截图尺寸 (h, w), 检测参数) → CardSplitter.geometry() 的结果（进程内共享）
+    检测参数为 (分割方式, 列检测方式, 检测缩小倍数)，不同参数的检测结果互不复用。
+    识别服务的线程池和 GUI 工作线程共用，查找、写入和计数都在锁内进行"""
+    _cache: Dict[Tuple[Tuple[int, int], Tuple], Dict] = {}
+    _lock = threading.Lock()
+    hits = 0
+    misses = 0
+    
+    @classmethod
+    def get(cls, image: np.ndarray, params: Tuple = ('deal',)) -> Optional[Dict]:
+        """返回与 image 尺寸和检测参数相同且采样验证通过的几何信息，否则 None"""
+        with cls._lock:
+            geometry = cls._cache.get((image.shape[:2], params))
+        # 几何信息写入后不再修改，采样验证无需持锁
+        verified = False
+        if geometry is not None:
+            ys, xs, expected = geometry['probes']
+            verified = np.array_equal(_is_green(image, ys, xs), expected)
+        with cls._lock:
+            if verified:
+                cls.hits += 1
+            else:
+                cls.misses += 1
+        return geometry if verified else None
+    
+    @classmethod
+    def put(cls, image: np.ndarray, geometry: Dict, params: Tuple = ('deal',)):
+        """缓存几何信息，并记录采样点在这张截图上的颜色作为之后的验证基准"""
+        ys, xs = cls._probes(geometry['contours'], image.shape[:2])
+        geometry['probes'] = (ys, xs, _is_green(image, ys, xs))
+        with cls._lock:
+            cls._cache[(image.shape[:2], params)] = geometry
+    
+    @staticmethod
+    def _probes(contours: List[Tuple[int, int, int, int]],
+                shape: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+        """每列上下左右边缘中点紧邻边缘的内外两个像素 (ys, xs)，窗口平移 1 像素即不一致"""
+        img_h, img_w = shape
+        points = []
+        for x, y, w, h in contours:
+            cx, cy = x + w // 2, y + h // 2
+            points += [(y, cx), (y - 1, cx),                    # 上边缘
+                       (y + h - 1, cx), (y + h, cx),            # 下边缘（牌高）
+                       (cy, x), (cy, x - 1),                    # 左边缘
+                       (cy, x + w - 1), (cy, x + w)]            # 右边缘
+        points = [p for p in points if 0 <= p[0] < img_h and 0 <= p[1] < img_w]
+        ys, xs = zip(*points)
+        return np.array(ys), np.array(xs)
+    
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._cache.clear()
+            cls.hits = cls.misses = 0
+
+
+def _is_green(image: np.ndarray, ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+    """只对采样像素做颜色转换，判断是否为绿色背景"""
+    pixels = np.ascontiguousarray(image[ys, xs]).reshape(-1, 1, 3)
+    return ColorPlanes(pixels).green.ravel() > 0
+
+
+def auto_detect_scale(image_height: int) -> int:
+    """按截图高度选择检测缩小倍数：缩小后高度不低于约 200 像素（列宽仍有十几像素）"""
+    if image_height >= 1600:
+        return 8
+    if image_height >= 800:
+        return 4
+    return 1
+
 
 class CardSplitter:
-    def __init__(self):
-        self.output_dir = "Single_Card_Images"
-        os.makedirs(self.output_dir, exist_ok=True)
+    def __init__(self, output_dir: Optional[str] = "Single_Card_Images",
+                 column_detector: str = 'contour',
+                 detect_scale: Optional[int] = None,
+                 layout_cache: bool = True,
+                 segmentation: str = 'deal'):
+        """
+        column_detector: 'contour' 轮廓法 / 'projection' 投影法
+        detect_scale: 列检测时的缩小倍数，1 为全分辨率检测，None 按截图高度自动选择
+        layout_cache: 使用布局几何缓存（LayoutCache），同尺寸截图采样验证通过时跳过列检测
+        segmentation: 'deal' 按开局布局（前4列7张、后4列6张）等高切分；
+                      'profile' 按行边界检测每列 0-19 张牌（牌局中途截图）
+        """
+        if column_detector not in COLUMN_DETECTORS:
+            raise ValueError(f"未知的列检测方式: {column_detector}，可选: {', '.join(COLUMN_DETECTORS)}")
+        if segmentation not in SEGMENTATION_MODES:
+            raise ValueError(f"未知的分割方式: {segmentation}，可选: {', '.join(SEGMENTATION_MODES)}")
+        if detect_scale is not None and detect_scale < 1:
+            raise ValueError(f"detect_scale 应为正整数: {detect_scale}")
+        self.output_dir = output_dir
+        self.column_detector = column_detector
+        self.detect_scale = detect_scale
+        self.layout_cache = layout_cache
+        self.segmentation = segmentation
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+    
+    def _split_columns(self, image: np.ndarray,
+                       planes: Optional[ColorPlanes] = None) -> Tuple[List[np.ndarray], List[Tuple[int, int, int, int]]]:
+        boxes, contours = self._column_boxes(image, planes)
+        columns = [image[y0:y1, x0:x1] for y0, y1, x0, x1 in boxes]
+        return columns, contours
+    
+    def _column_boxes(self, image: np.ndarray,
+                      planes: Optional[ColorPlanes] = None) -> Tuple[List[Tuple[int, int, int, int]], List[Tuple[int, int, int, int]]]:
+        """检测8列，返回 ([(y0, y1, x0, x1), ...] 列裁切区域, 原始轮廓 (x, y, w, h))
+        低分辨率检测时 planes 不参与检测（整图平面不会被计算）"""
+        scale = self.detect_scale or auto_detect_scale(image.shape[0])
+        if scale > 1:
+            valid_contours = self._coarse_columns(image, scale)
+        else:
+            if planes is None:
+                planes = ColorPlanes(image)
+            valid_contours = self._detect_columns(cv2.bitwise_not(planes.green))
+        
+        valid_contours.sort(key=lambda x: x[0])
+        if self.segmentation == 'profile':
+            valid_contours = self._assign_slots(valid_contours, image.shape[1])
+        elif len(valid_contours) != 8:
+            raise ValueError(f"检测到 {len(valid_contours)} 列，应为8列")
+        
+        # 统一列宽度：使用中位数宽度，消除发光效果导致的宽度不一致
+        widths = [c[2] for c in valid_contours[:8]]
+        median_w = int(np.median(widths))
+        
+        boxes = []
+        for x, y, w, h in valid_contours[:8]:
+            # 使用统一宽度居中裁切，避免发光边缘干扰
+            center_x = x + w // 2
+            crop_x = max(0, center_x - median_w // 2)
+            crop_x_end = min(image.shape[1], crop_x + median_w)
+            boxes.append((y, y+h, crop_x, crop_x_end))
+            
+        return boxes, valid_contours[:8]
+    
+    def _assign_slots(self, rects: List[Tuple[int, int, int, int]],
+                      img_width: int) -> List[Tuple[int, int, int, int]]:
+        """把检测到的非空列对齐到 8 个列位，空列补一个高度为 0 的外接框。
+        列间距取相邻检测列中心距（按最接近的整数倍折算）的中位数，
+        8 列整体相对截图水平居中"""
+        if not 1 <= len(rects) <= 8:
+            raise ValueError(f"检测到 {len(rects)} 列，应为1到8列")
+        if len(rects) == 8:
+            return rects
+        median_w = float(np.median([w for _, _, w, _ in rects]))
+        centers = np.array([x + w / 2 for x, _, w, _ in rects])
+        gaps = np.diff(centers)
+        if len(gaps):
+            steps = np.maximum(1, np.round(gaps / (median_w * COLUMN_PITCH_RATIO)))
+            pitch = float(np.median(gaps / steps))
+        else:
+            pitch = median_w * COLUMN_PITCH_RATIO
+        slots = np.round((centers - img_width / 2) / pitch + 3.5).astype(int)
+        if slots.min() < 0 or slots.max() > 7 or len(set(slots.tolist())) != len(slots):
+            raise ValueError(f"无法确定 {len(rects)} 个非空列的列位")
+        
+        top = min(y for _, y, _, _ in rects)
+        by_slot = dict(zip(slots.tolist(), rects))
+        return [by_slot.get(slot, (int(round(img_width / 2 + (slot - 3.5) * pitch - median_w / 2)),
+                                   top, int(median_w), 0))
+                for slot in range(8)]
+    
+    def _card_rows(self, image: np.ndarray,
+                   boxes: List[Tuple[int, int, int, int]]) -> Tuple[List[List[Tuple[int, int]]], int]:
+        """行边界检测：返回 (每列各张牌的 (y0, y1), 单张牌露出高度)
+        一次灰度化牌桌区域，np.add.reduceat 同时统计 8 列每行的边框线像素数"""
+        ty0 = min(b[0] for b in boxes)
+        ty1 = max(b[1] for b in boxes)
+        width = boxes[0][3] - boxes[0][2]
+        inset = max(2, width // 16)  # 避开圆角
+        edges = [x for _, _, x0, x1 in boxes for x in (x0 + inset, x1 - inset)]
+        
+        gray = cv2.cvtColor(image[ty0:ty1, edges[0]:edges[-1]], cv2.COLOR_BGR2GRAY)
+        border = cv2.inRange(gray, *BORDER_GRAY_RANGE) // 255
+        counts = np.add.reduceat(border, np.array(edges[:-1]) - edges[0], axis=1, dtype=np.int32)[:, ::2]
+        spans = np.diff(edges)[::2]
+        is_border = counts > spans * 0.6  # (行, 8 列)
+        
+        # 每列上边缘：边框线行段的起点，相距不足 min_gap 的合并；底边（最后一张牌的下边框）不计
+        min_gap = max(3, width // 8)
+        tops = []
+        for col, (y0, y1, _, _) in enumerate(boxes):
+            if y1 <= y0:
+                tops.append([])
+                continue
+            starts, _ = _runs(is_border[y0 - ty0:y1 - ty0, col])
+            col_tops = [0]
+            for start in starts.tolist():
+                if start - col_tops[-1] >= min_gap and start < (y1 - y0) - min_gap:
+                    col_tops.append(start)
+            tops.append(col_tops)
+        
+        strides = [np.diff(t) for t in tops if len(t) > 1]
+        if strides:
+            stride = float(np.median(np.concatenate(strides)))
+        else:
+            stride = width * CARD_STRIDE_RATIO
+        
+        # 缩放后的截图边框线可能只横贯部分列宽，个别上边缘低于阈值而漏检：
+        # 张数不能只看检出的上边缘数。相邻上边缘相距约 k 倍间距时在其间补 k-1 个；
+        # 最后一个上边缘到列底即最下方整张牌的高度，各列相同，超出的部分按间距补齐
+        for col_tops in tops:
+            filled = col_tops[:1]
+            for top in col_tops[1:]:
+                k = int(round((top - filled[-1]) / stride))
+                filled += [filled[-1] + (top - filled[-1]) * j / k for j in range(1, k)] + [top]
+            col_tops[:] = filled
+        tails = [(y1 - y0) - col_tops[-1] for (y0, y1, _, _), col_tops in zip(boxes, tops) if col_tops]
+        if tails:
+            full_height = float(np.median(tails))
+            for (y0, y1, _, _), col_tops in zip(boxes, tops):
+                if col_tops:
+                    missing = int(round(((y1 - y0) - col_tops[-1] - full_height) / stride))
+                    col_tops += [col_tops[-1] + stride * j for j in range(1, missing + 1)]
+        
+        # 裁切间距与开局布局的牌高一致：开局布局取 7 张列与 6 张列的高度差，
+        # 这里对各列 (张数 - 1, 列高) 做直线拟合取斜率（各列张数相同时退回上边缘间距中位数）。
+        # 缩放后的截图间距不是整数，逐张取整，误差不随行数累积
+        tops = [col_tops[:MAX_COLUMN_CARDS] for col_tops in tops]
+        spacings = [col_tops[-1] / (len(col_tops) - 1) if len(col_tops) > 1 else stride
+                    for col_tops in tops]
+        fit = [(len(col_tops) - 1, y1 - y0) for (y0, y1, _, _), col_tops, spacing
+               in zip(boxes, tops, spacings) if col_tops and abs(spacing - stride) <= stride * STRIDE_TOLERANCE]
+        uniform = stride * STRIDE_TOLERANCE
+        if len({n for n, _ in fit}) > 1:
+            stride = float(np.polyfit(*zip(*fit), 1)[0])
+        
+        rows = []
+        for (y0, y1, _, _), col_tops, spacing in zip(boxes, tops, spacings):
+            # 检测到的上边缘决定张数；边框线抗锯齿造成的 ±1 像素抖动不进入裁切位置（模板按开局布局的切法制作）。
+            # 长列露出高度可能被压缩（本列间距与整体相差超过 STRIDE_TOLERANCE），按本列自己的间距切分
+            step = stride if abs(spacing - stride) <= uniform else spacing
+            cuts = [y0 + int(round(k * step)) for k in range(len(col_tops) + 1)]
+            rows.append([(cuts[k], min(cuts[k + 1], y1)) for k in range(len(col_tops))])
+        return rows, int(round(stride))
     
-    def _split_columns(self, image: np.ndarray) -> Tuple[List[np.ndarray], List[Tuple[int, int, int, int]]]:
-        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-        mask = cv2.inRange(hsv, np.array([35, 30, 30]), np.array([85, 255, 255]))
-        mask = cv2.bitwise_not(mask)
+    def _detect_columns(self, mask: np.ndarray, scale: int = 1) -> List[Tuple[int, int, int, int]]:
+        """在非绿色掩码上检测列外接框；scale 为掩码相对原图的缩小倍数（用于换算尺寸阈值）"""
+        if self.segmentation == 'profile':
+            return self._variable_columns(mask, scale)
+        if self.column_detector == 'projection':
+            return self._projection_columns(mask, scale)
+        return self._contour_columns(mask, scale)
+    
+    def _coarse_columns(self, image: np.ndarray, scale: int) -> List[Tuple[int, int, int, int]]:
+        """在缩小 scale 倍的图上检测列，再逐列在全分辨率下精确定位边缘"""
+        img_h, img_w = image.shape[:2]
+        small = cv2.resize(image, (img_w // scale, img_h // scale), interpolation=cv2.INTER_NEAREST)
+        coarse = self._detect_columns(cv2.bitwise_not(ColorPlanes(small).green), scale)
+        return [self._refine_column(image, (x * scale, y * scale, w * scale, h * scale), scale)
+                for x, y, w, h in coarse]
+    
+    def _refine_column(self, image: np.ndarray, rect: Tuple[int, int, int, int],
+                       scale: int) -> Tuple[int, int, int, int]:
+        """在粗略外接框每条边缘 ±2*scale 的全分辨率窗口内重新定位边缘，判定条件与全分辨率检测相同：
+        轮廓法取外接框（窗口内出现非绿色像素即属于该列）；投影法左右边缘按整图高度的 30%
+        （行边界检测 10%）、上下边缘按列宽一半判定。条件不同时缩放截图的抗锯齿边缘会差 1 像素，
+        开局布局的牌高（列高差）随之偏差，逐行累积"""
+        img_h, img_w = image.shape[:2]
+        x, y, w, h = rect
+        margin = 2 * scale
+        if self.segmentation == 'profile':
+            x_ratio, y_ratio = 0.1, 0.5
+        elif self.column_detector == 'projection':
+            x_ratio, y_ratio = 0.3, 0.5
+        else:
+            x_ratio, y_ratio = 0.0, 0.0
+        
+        def non_green(y0, y1, x0, x1, axis):
+            strip = ColorPlanes(image[y0:y1, x0:x1]).green
+            profile = cv2.reduce(cv2.bitwise_not(strip), axis, cv2.REDUCE_SUM, dtype=cv2.CV_32S)
+            return profile.ravel() // 255
+        
+        def edge(profile, threshold, offset, last):
+            hits = np.flatnonzero(profile > threshold)
+            if len(hits) == 0:
+                return None
+            return offset + (int(hits[-1]) + 1 if last else int(hits[0]))
+        
+        # 左右边缘：投影法统计整图高度（同列投影），轮廓法只统计该列上下边缘之间的行
+        if x_ratio:
+            rows0, rows1 = 0, img_h
+        else:
+            rows0, rows1 = max(0, y - margin), min(img_h, y + h + margin)
+        x0 = max(0, x - margin)
+        left = edge(non_green(rows0, rows1, x0, x + margin, 0), img_h * x_ratio, x0, False)
+        x1 = min(img_w, x + w + margin)
+        right = edge(non_green(rows0, rows1, x + w - margin, x1, 0), img_h * x_ratio,
+                     x + w - margin, True)
+        left = x if left is None else left
+        right = x + w if right is None else right
         
+        # 上下边缘：统计整个列宽（同行投影）
+        y0 = max(0, y - margin)
+        top = edge(non_green(y0, y + margin, left, right, 1), (right - left) * y_ratio, y0, False)
+        y1 = min(img_h, y + h + margin)
+        bottom = edge(non_green(y + h - margin, y1, left, right, 1), (right - left) * y_ratio,
+                      y + h - margin, True)
+        top = y if top is None else top
+        bottom = y + h if bottom is None else bottom
+        return left, top, right - left, bottom - top
+    
+    def _contour_columns(self, mask: np.ndarray, scale: int = 1) -> List[Tuple[int, int, int, int]]:
+        """轮廓法：闭运算后检测外轮廓，按面积、高度比过滤，返回列外接框 (x, y, w, h)"""
         kernel = np.ones((3,3), np.uint8)
         mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
         
         contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         
         valid_contours = []
-        img_height = image.shape[0]
+        img_height = mask.shape[0]
         for cnt in contours:
             area = cv2.contourArea(cnt)
             x, y, w, h = cv2.boundingRect(cnt)
             aspect_ratio = h/w
             
-            if (area > 2000 and 
+            if (area > 2000 / scale**2 and 
                 h > img_height * 0.3 and 
                 aspect_ratio > 1.5 and 
-                w > 30):
+                w > 30 / scale):
                 valid_contours.append((x, y, w, h))
+        return valid_contours
+    
+    def _projection_columns(self, mask: np.ndarray, scale: int = 1) -> List[Tuple[int, int, int, int]]:
+        """投影法：返回列外接框 (x, y, w, h)
+        - 列投影：每个 x 上非绿色像素数超过图像高度 30% 的连续区间即一列
+        - 行投影：列区间内每行非绿色像素超过列宽一半的最长连续段即该列纵向范围
+        过滤条件与轮廓法相同（高度 > 30% 图像高度、高宽比 > 1.5、宽度 > 30）"""
+        img_height = mask.shape[0]
+        column_profile = cv2.reduce(mask, 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S)[0] // 255
+        starts, ends = _runs(column_profile > img_height * 0.3)
         
-        valid_contours.sort(key=lambda x: x[0])
-        if len(valid_contours) != 8:
-            raise ValueError(f"检测到 {len(valid_contours)} 列，应为8列")
-        
-        # 统一列宽度：使用中位数宽度，消除发光效果导致的宽度不一致
-        widths = [c[2] for c in valid_contours[:8]]
-        median_w = int(np.median(widths))
+        valid_contours = []
+        for x0, x1 in zip(starts, ends):
+            w = int(x1 - x0)
+            if w <= 30 / scale:
+                continue
+            row_profile = cv2.reduce(mask[:, x0:x1], 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S)[:, 0] // 255
+            row_starts, row_ends = _runs(row_profile > w * 0.5)
+            if len(row_starts) == 0:
+                continue
+            longest = int(np.argmax(row_ends - row_starts))
+            y, h = int(row_starts[longest]), int(row_ends[longest] - row_starts[longest])
+            if h > img_height * 0.3 and h / w > 1.5:
+                valid_contours.append((int(x0), y, w, h))
+        return valid_contours
+    
+    def _variable_columns(self, mask: np.ndarray, scale: int = 1) -> List[Tuple[int, int, int, int]]:
+        """牌局中途的列检测（投影法，放宽开局布局的条件）：
+        列投影超过图像高度 10%（至少一张完整纸牌）的区间为一列，
+        纵向范围取最下方一段高度不小于列宽的连续行（避开上方空当/收牌区的纸牌）"""
+        img_height = mask.shape[0]
+        column_profile = cv2.reduce(mask, 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S)[0] // 255
+        starts, ends = _runs(column_profile > img_height * 0.1)
         
-        columns = []
-        for x, y, w, h in valid_contours[:8]:
-            # 使用统一宽度居中裁切，避免发光边缘干扰
-            center_x = x + w // 2
-            crop_x = max(0, center_x - median_w // 2)
-            crop_x_end = min(image.shape[1], crop_x + median_w)
-            column = image[y:y+h, crop_x:crop_x_end]
-            columns.append(column)
-            
-        return columns, valid_contours[:8]
+        valid_contours = []
+        for x0, x1 in zip(starts, ends):
+            w = int(x1 - x0)
+            if w <= 30 / scale:
+                continue
+            row_profile = cv2.reduce(mask[:, x0:x1], 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S)[:, 0] // 255
+            row_starts, row_ends = _runs(row_profile > w * 0.5)
+            tall = np.flatnonzero(row_ends - row_starts >= w)
+            if len(tall) == 0:
+                continue
+            y, y_end = int(row_starts[tall[-1]]), int(row_ends[tall[-1]])
+            valid_contours.append((int(x0), y, w, y_end - y))
+        return valid_contours
+    
+    def split(self, image: np.ndarray,
+              planes: Optional[ColorPlanes] = None) -> List[Tuple[str, np.ndarray]]:
+        """分割纸牌，返回 [(列号行号, 卡片图像视图), ...]，不写文件"""
+        return list(self.iter_split(image, planes))
     
-    def split_cards(self, image: np.ndarray) -> None:
+    def iter_split(self, image: np.ndarray,
+                   planes: Optional[ColorPlanes] = None) -> Iterator[Tuple[str, np.ndarray]]:
+        """生成器版 split()：逐张产出 (列号行号, 卡片图像视图)"""
+        for name, (y0, y1, x0, x1) in self.iter_boxes(image, planes):
+            yield name, image[y0:y1, x0:x1]
+    
+    def split_boxes(self, image: np.ndarray,
+                    planes: Optional[ColorPlanes] = None) -> List[Tuple[str, Tuple[int, int, int, int]]]:
+        """分割纸牌，返回 [(列号行号, (y0, y1, x0, x1)), ...] 截图坐标
+        planes: 整张截图的 ColorPlanes，传入后可与提取阶段共用同一次 HSV 转换
+        """
+        return list(self.iter_boxes(image, planes))
+    
+    def _cache_params(self, image: np.ndarray) -> Tuple[str, str, int]:
+        """布局几何缓存的检测参数：(分割方式, 列检测方式, 实际使用的检测缩小倍数)"""
+        return (self.segmentation, self.column_detector,
+                self.detect_scale or auto_detect_scale(image.shape[0]))
+    
+    def geometry(self, image: np.ndarray, planes: Optional[ColorPlanes] = None) -> Dict:
+        """布局几何：{'boxes': 列裁切区域, 'contours': 列外接框, 'card_height': 牌高,
+        'card_size': (宽, 高), 'rows': 行边界检测时每列各张牌的 (y0, y1)，开局布局为 None}；启用 layout_cache 时命中缓存则跳过列检测。
+        模板集的选择按卡片尺寸记忆在 match_numbers.TemplateSetSelector 中，不写入几何条目"""
+        if self.layout_cache:
+            geometry = LayoutCache.get(image, self._cache_params(image))
+            if geometry is not None:
+                return geometry
+        
         # 分割列并获取轮廓信息
-        columns, contours = self._split_columns(image)
+        boxes, contours = self._column_boxes(image, planes)
         
-        # 计算单张纸牌高度
-        first_column_height = contours[0][3]  # 第一列高度
-        fifth_column_height = contours[4][3]  # 第五列高度
-        card_height = first_column_height - fifth_column_height
+        rows = None
+        if self.segmentation == 'profile':
+            rows, card_height = self._card_rows(image, boxes)
+        else:
+            # 计算单张纸牌高度
+            first_column_height = contours[0][3]  # 第一列高度
+            fifth_column_height = contours[4][3]  # 第五列高度
+            card_height = first_column_height - fifth_column_height
+        
+        geometry = {
+            'boxes': boxes,
+            'contours': contours,
+            'rows': rows,
+            'card_height': card_height,
+            'card_size': (boxes[0][3] - boxes[0][2], card_height),
+        }
+        if self.layout_cache:
+            LayoutCache.put(image, geometry, self._cache_params(image))
+        return geometry
+    
+    def iter_boxes(self, image: np.ndarray,
+                   planes: Optional[ColorPlanes] = None) -> Iterator[Tuple[str, Tuple[int, int, int, int]]]:
+        """生成器版 split_boxes()：按列、行顺序逐张产出卡片区域"""
+        geometry = self.geometry(image, planes)
+        boxes, card_height = geometry['boxes'], geometry['card_height']
+        
+        if geometry['rows'] is not None:
+            # 行边界检测：每列张数不定，名称为 列号 + 行号（行号可能两位）
+            for col_idx, (col_rows, (_, _, col_x0, col_x1)) in enumerate(zip(geometry['rows'], boxes)):
+                for row_idx, (y0, y1) in enumerate(col_rows):
+                    yield f"{col_idx+1}{row_idx+1}", (y0, y1, col_x0, col_x1)
+            return
         
         # 从每列中提取单张纸牌
-        for col_idx, column in enumerate(columns):
+        for col_idx, (col_y0, col_y1, col_x0, col_x1) in enumerate(boxes):
             num_cards = 7 if col_idx < 4 else 6
-            column_height = column.shape[0]
+            column_height = col_y1 - col_y0
             
             for row_idx in range(num_cards):
                 # 计算当前纸牌的位置
@@ -101,13 +522,18 @@ class CardSplitter:
                 if end_y > column_height:
                     end_y = column_height
                 
-                # 提取单张纸牌
-                card = column[start_y:end_y, :]
-                
+                yield (f"{col_idx+1}{row_idx+1}",
+                       (col_y0 + start_y, col_y0 + end_y, col_x0, col_x1))
+    
+    def split_cards(self, image: np.ndarray) -> List[Tuple[str, np.ndarray]]:
+        """分割纸牌并保存到 output_dir（调试/模板创建用），返回同 split()"""
+        cards = self.split(image)
+        if self.output_dir:
+            for name, card in cards:
                 # 保存图像，使用无损压缩
-                filename = f"{col_idx+1}{row_idx+1}.png"
-                cv2.imwrite(os.path.join(self.output_dir, filename), card, 
-                          [cv2.IMWRITE_PNG_COMPRESSION, 0])
+                cv2.imwrite(os.path.join(self.output_dir, f"{name}.png"), card,
+                            [cv2.IMWRITE_PNG_COMPRESSION, 0])
+        return cards
 
 # 添加主函数，使模块可以单独运行
 if __name__ == "__main__":
@@ -0,0 +1,90 @@
+"""
+截图颜色平面模块
+
+每张截图只做一次 HSV 转换，并按需（各一次）生成全分辨率颜色掩码：
+- green: 绿色背景掩码（纸牌分割用）
+- glow:  黄色/金色发光掩码
+- red:   红色掩码（已去除发光像素）
+- black: 黑色掩码
+分割器和提取器通过 roi() 取得零拷贝的区域视图，不再逐张卡片重复转换颜色。
+区域视图上首次请求的平面（HSV 或掩码）若上级未算过，只在该区域内计算并缓存（如牌桌区域），
+子视图直接切片复用；分割器在缩小图上检测时整图 HSV 不会被计算。
+"""
+
+import cv2
+import numpy as np
+from typing import Optional, Tuple
+
+# HSV 颜色范围
+GREEN_RANGE = (np.array([35, 30, 30]), np.array([85, 255, 255]))
+RED_RANGE_1 = (np.array([0, 100, 100]), np.array([10, 255, 255]))
+RED_RANGE_2 = (np.array([170, 100, 100]), np.array([180, 255, 255]))
+GLOW_RANGE = (np.array([15, 50, 150]), np.array([35, 255, 255]))
+BLACK_RANGE = (np.array([0, 0, 0]), np.array([180, 255, 50]))
+
+
+class ColorPlanes:
+    """一张截图的 HSV 与颜色掩码（惰性计算，每种只算一次）"""
+    
+    def __init__(self, image: np.ndarray,
+                 _parent: Optional['ColorPlanes'] = None,
+                 _region: Optional[Tuple[slice, slice]] = None):
+        self.image = image
+        self._parent = _parent
+        self._region = _region
+        self._planes = {}
+    
+    def roi(self, y0: int, y1: int, x0: int, x1: int) -> 'ColorPlanes':
+        """返回区域视图，所有平面都是父平面的切片（不复制像素）"""
+        region = (slice(y0, y1), slice(x0, x1))
+        return ColorPlanes(self.image[region], _parent=self, _region=region)
+    
+    def _has(self, name: str) -> bool:
+        return name in self._planes or (self._parent is not None and self._parent._has(name))
+    
+    def _get(self, name: str) -> np.ndarray:
+        plane = self._planes.get(name)
+        if plane is None:
+            # 上级已算过则切片复用，否则只在本区域内计算
+            if self._parent is not None and self._parent._has(name):
+                plane = getattr(self._parent, name)[self._region]
+            else:
+                plane = getattr(self, f'_compute_{name}')()
+            self._planes[name] = plane
+        return plane
+    
+    def _compute_hsv(self) -> np.ndarray:
+        return cv2.cvtColor(self.image, cv2.COLOR_BGR2HSV)
+    
+    def _compute_green(self) -> np.ndarray:
+        return cv2.inRange(self.hsv, *GREEN_RANGE)
+    
+    def _compute_glow(self) -> np.ndarray:
+        return cv2.inRange(self.hsv, *GLOW_RANGE)
+    
+    def _compute_red(self) -> np.ndarray:
+        red = cv2.inRange(self.hsv, *RED_RANGE_1) + cv2.inRange(self.hsv, *RED_RANGE_2)
+        return cv2.bitwise_and(red, cv2.bitwise_not(self.glow))
+    
+    def _compute_black(self) -> np.ndarray:
+        return cv2.inRange(self.hsv, *BLACK_RANGE)
+    
+    @property
+    def hsv(self) -> np.ndarray:
+        return self._get('hsv')
+    
+    @property
+    def green(self) -> np.ndarray:
+        return self._get('green')
+    
+    @property
+    def glow(self) -> np.ndarray:
+        return self._get('glow')
+    
+    @property
+    def red(self) -> np.ndarray:
+        return self._get('red')
+    
+    @property
+    def black(self) -> np.ndarray:
+        return self._get('black')
@@ -3,26 +3,27 @@ FreeCell纸牌信息提取模块 (v3.0 - 整体裁切)
 
 裁切卡片左上角信息区域（点数+花色），输出到单一目录。
 匹配时从整体图像中分割点数和花色分别匹配。
+*_from_card 系列函数直接处理内存中的卡片图像，供无落盘流水线使用。
+颜色掩码来自 ColorPlanes：传入整张截图的平面视图时不再逐卡转换 HSV。
 """
 
 import cv2
 import numpy as np
 import os
+from functools import partial
 
+from color_planes import ColorPlanes
 
-def _detect_color(img):
-    """检测卡片颜色类型（红/黑）"""
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+
+def _detect_color(img, planes=None):
+    """检测卡片颜色类型（红/黑）
+    planes: 卡片区域的 ColorPlanes 视图，缺省时按卡片单独计算
+    """
+    if planes is None:
+        planes = ColorPlanes(img)
     h, w = img.shape[:2]
-    roi = hsv[0:int(h*0.5), 0:int(w*0.25)]
-    
-    red1 = cv2.inRange(roi, np.array([0, 100, 100]), np.array([10, 255, 255]))
-    red2 = cv2.inRange(roi, np.array([170, 100, 100]), np.array([180, 255, 255]))
-    red_mask = red1 + red2
-    glow = cv2.inRange(roi, np.array([15, 50, 150]), np.array([35, 255, 255]))
-    red_mask = cv2.bitwise_and(red_mask, cv2.bitwise_not(glow))
-    black_mask = cv2.inRange(roi, np.array([0, 0, 0]), np.array([180, 255, 50]))
-    return '_r' if cv2.countNonZero(red_mask) > cv2.countNonZero(black_mask) else '_b'
+    roi = planes.roi(0, int(h*0.5), 0, int(w*0.25))
+    return '_r' if cv2.countNonZero(roi.red) > cv2.countNonZero(roi.black) else '_b'
 
 
 def _binarize(region):
@@ -38,6 +39,41 @@ def _binarize(region):
     return output
 
 
+_MORPH_KERNEL = np.ones((2, 2), np.uint8)
+
+
+def binarize_batch(regions):
+    """批量版 _binarize：结果与逐张调用逐字节相同，返回各区域二值图（同一缓冲区上的视图）。
+    同宽区域竖直拼成一张图，相邻区域之间隔 1 行白色填充，灰度化/阈值/膨胀/腐蚀/取反各只调用一次。
+    2x2 核的锚点在右下角，每个像素只读取本行和上一行：填充行膨胀前为 0、腐蚀前置为 255，
+    等效于单张图上边界外的默认取值，区域之间互不影响。
+    """
+    if not regions:
+        return []
+    widths = {region.shape[1] for region in regions}
+    if len(widths) > 1:
+        outputs = [None] * len(regions)
+        for width in widths:
+            indices = [i for i, region in enumerate(regions) if region.shape[1] == width]
+            for i, output in zip(indices, binarize_batch([regions[i] for i in indices])):
+                outputs[i] = output
+        return outputs
+    
+    pad = np.full((1, regions[0].shape[1], 3), 255, np.uint8)
+    parts, offsets, y = [], [], 0
+    for region in regions:
+        parts += [pad, region]
+        offsets.append(y + 1)
+        y += region.shape[0] + 1
+    mosaic = cv2.cvtColor(np.concatenate(parts), cv2.COLOR_BGR2GRAY)
+    cv2.threshold(mosaic, 128, 255, cv2.THRESH_BINARY_INV, dst=mosaic)
+    dilated = cv2.dilate(mosaic, _MORPH_KERNEL, iterations=1)
+    dilated[np.array(offsets) - 1] = 255
+    cv2.erode(dilated, _MORPH_KERNEL, dst=mosaic, iterations=1)
+    cv2.bitwise_not(mosaic, dst=mosaic)
+    return [mosaic[y0:y0 + region.shape[0]] for y0, region in zip(offsets, regions)]
+
+
 def extract_info_region(image_path):
     """裁切卡片左上角信息区域（点数+花色整体）。
     返回: (info_img, color_type) 或 None
@@ -45,13 +81,31 @@ def extract_info_region(image_path):
     img = cv2.imread(image_path)
     if img is None:
         return None
+    return extract_info_from_card(img)
+
+
+def extract_info_from_card(img, planes=None):
+    """同 extract_info_region，输入为内存中的 BGR 卡片图像。
+    planes: 卡片区域的 ColorPlanes 视图（可选）
+    返回: (info_img, color_type)
+    """
     h, w = img.shape[:2]
-    color_type = _detect_color(img)
+    color_type = _detect_color(img, planes)
     crop_w = int(w * 0.25)
     region = img[0:h, 0:crop_w]
     return _binarize(region), color_type
 
 
+def extract_info_from_cards(cards):
+    """批量版 extract_info_from_card，整副牌的信息区域一次二值化（见 binarize_batch）。
+    cards: [(img, planes), ...]，planes 可为 None
+    返回: [(info_img, color_type), ...]
+    """
+    regions = [img[:, :int(img.shape[1] * 0.25)] for img, _ in cards]
+    color_types = [_detect_color(img, planes) for img, planes in cards]
+    return list(zip(binarize_batch(regions), color_types))
+
+
 def process_cards():
     """处理所有卡片，提取信息区域到 Card_Info_Images（匹配用）"""
     output_dir = 'Card_Info_Images'
@@ -82,49 +136,51 @@ def _extract_number_legacy(image_path, padding=2):
     img = cv2.imread(image_path)
     if img is None:
         return None
-    
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    return extract_legacy_from_card(img, padding)
+
+
+def extract_legacy_from_card(img, padding=2, planes=None, lazy_suit=False):
+    """旧版点数+花色提取，输入为内存中的 BGR 卡片图像。
+    卡片左侧 1/4 宽度的整列掩码上只做一次连通域标记（connectedComponentsWithStats），
+    点数框、左侧相邻字形（如 "10" 的 "1"）、点数底边和花色框都从统计表得出。
+    planes: 卡片区域的 ColorPlanes 视图（可选）
+    lazy_suit: 为 True 时 suit_img 是无参函数，调用时才裁切花色（惰性花色模式，不需要花色的卡片省去裁切）
+    返回: (number_img, suit_img, color_type) 或 None
+    """
+    if planes is None:
+        planes = ColorPlanes(img)
     height, width = img.shape[:2]
     roi_height = int(height/1.5)
     roi_width = int(width/4)
-    roi = hsv[0:roi_height, 0:roi_width]
-    
-    lower_red1 = np.array([0, 100, 100])
-    upper_red1 = np.array([10, 255, 255])
-    lower_red2 = np.array([170, 100, 100])
-    upper_red2 = np.array([180, 255, 255])
-    red_mask1 = cv2.inRange(roi, lower_red1, upper_red1)
-    red_mask2 = cv2.inRange(roi, lower_red2, upper_red2)
-    red_mask = red_mask1 + red_mask2
-
-    lower_glow = np.array([15, 50, 150])
-    upper_glow = np.array([35, 255, 255])
-    glow_mask = cv2.inRange(roi, lower_glow, upper_glow)
-    red_mask = cv2.bitwise_and(red_mask, cv2.bitwise_not(glow_mask))
-
-    lower_black = np.array([0, 0, 0])
-    upper_black = np.array([180, 255, 50])
-    black_mask = cv2.inRange(roi, lower_black, upper_black)
-
-    red_pixels = cv2.countNonZero(red_mask)
-    black_pixels = cv2.countNonZero(black_mask)
+    strip = planes.roi(0, height, 0, roi_width)
+    
+    red_mask = strip.red
+    black_mask = strip.black
+    
+    red_pixels = cv2.countNonZero(red_mask[:roi_height])
+    black_pixels = cv2.countNonZero(black_mask[:roi_height])
     color_type = '_r' if red_pixels > black_pixels else '_b'
-
+    
     combined_mask = cv2.bitwise_or(red_mask, black_mask)
-    combined_mask = cv2.bitwise_and(combined_mask, cv2.bitwise_not(glow_mask))
+    combined_mask = cv2.bitwise_and(combined_mask, cv2.bitwise_not(strip.glow))
     
-    contours, _ = cv2.findContours(combined_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    if not contours:
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(combined_mask, connectivity=8)
+    # 统计表每行 (x, y, w, h, 面积)，连通域很少，逐行处理比数组运算快
+    stats = stats.tolist()
+    components = [_clip_component(labels, stats[i], i, roi_height)
+                  for i in range(1, count) if stats[i][1] < roi_height]
+    if not components:
         return None
-        
-    max_contour = max(contours, key=cv2.contourArea)
-    x, y, w, h = cv2.boundingRect(max_contour)
     
-    search_region = combined_mask[y:y+h, max(0, x-20):x]
-    left_contours, _ = cv2.findContours(search_region, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    # 点数：信息区域（上 2/3）内面积最大的连通域
+    label, x, y, w, h = max(components, key=lambda c: c[5])[:5]
     
-    if left_contours:
-        left_x = x - 15 + min([cv2.boundingRect(c)[0] for c in left_contours])
+    # 左侧 20 像素内与点数同行的其他连通域（两位数点数）
+    search_x = max(0, x - 20)
+    left = [max(cx, search_x) - search_x for i, cx, cy, cw, ch, _ in components
+            if i != label and cx < x and cx + cw > search_x and cy < y + h and cy + ch > y]
+    if left:
+        left_x = x - 15 + min(left)
         x_start = max(0, left_x - padding)
     else:
         x_start = max(0, x - padding)
@@ -134,46 +190,31 @@ def _extract_number_legacy(image_path, padding=2):
     y_end = min(roi_height, y + h + padding)
     
     number_region = combined_mask[y_start:y_end, x_start:x_end]
-    padded_region = np.zeros((y_end - y_start, x_end - x_start), dtype=np.uint8)
-    padded_region[0:number_region.shape[0], 0:number_region.shape[1]] = number_region
-    
     kernel = np.ones((2,2), np.uint8)
-    padded_region = cv2.dilate(padded_region, kernel, iterations=1)
-    padded_region = cv2.erode(padded_region, kernel, iterations=1)
+    number_region = cv2.dilate(number_region, kernel, iterations=1)
+    number_region = cv2.erode(number_region, kernel, iterations=1)
     
-    output = cv2.bitwise_not(padded_region)
-    output[output < 128] = 0
-    output[output >= 128] = 255
+    output = cv2.bitwise_not(number_region)
     
-    suit_output = _extract_suit_legacy(img, color_type)
+    if lazy_suit:
+        return output, partial(_suit_from_stats, combined_mask, stats[1:], height, width), color_type
+    suit_output = _suit_from_stats(combined_mask, stats[1:], height, width)
     return output, suit_output, color_type
 
 
-def _extract_suit_legacy(img, color_type):
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-    height, width = img.shape[:2]
-    
-    lower_glow = np.array([15, 50, 150])
-    upper_glow = np.array([35, 255, 255])
-    glow_mask = cv2.inRange(hsv, lower_glow, upper_glow)
-    
-    if color_type == '_r':
-        lower_red1 = np.array([0, 100, 100])
-        upper_red1 = np.array([10, 255, 255])
-        lower_red2 = np.array([170, 100, 100])
-        upper_red2 = np.array([180, 255, 255])
-        mask1 = cv2.inRange(hsv, lower_red1, upper_red1)
-        mask2 = cv2.inRange(hsv, lower_red2, upper_red2)
-        color_mask = mask1 + mask2
-        color_mask = cv2.bitwise_and(color_mask, cv2.bitwise_not(glow_mask))
-    else:
-        lower_black = np.array([0, 0, 0])
-        upper_black = np.array([180, 255, 50])
-        color_mask = cv2.inRange(hsv, lower_black, upper_black)
-    
-    all_mask = cv2.bitwise_or(color_mask, cv2.inRange(hsv, np.array([0,0,0]), np.array([180,255,50])))
-    all_mask = cv2.bitwise_and(all_mask, cv2.bitwise_not(glow_mask))
-    
+def _clip_component(labels, stat, i, y_limit):
+    """连通域 i 截到 y_limit 行以上的 (i, x, y, w, h, 面积)"""
+    x, y, w, h, area = stat
+    if y + h > y_limit:
+        clipped = (labels[y:y_limit, x:x + w] == i).view(np.uint8)
+        area = cv2.countNonZero(clipped)
+        cx, _, w, h = cv2.boundingRect(clipped)
+        x += cx
+    return i, x, y, w, h, area
+
+
+def _suit_from_stats(mask, stats, height, width):
+    """按连通域统计表定位点数底边，在其下方左侧限定区域内裁切花色"""
     scale = height / 58.0
     rank_y_limit = int(height * 0.26)
     rank_x_limit = int(width * 0.17)
@@ -181,40 +222,27 @@ def _extract_suit_legacy(img, color_type):
     default_rank_bottom = int(height * 0.47)
     search_height = int(height * 0.38)
     search_x_max = int(width * 0.20)
-
-    contours, _ = cv2.findContours(all_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    rank_bottom = 0
-    for cnt in contours:
-        area = cv2.contourArea(cnt)
-        if area > min_area:
-            x, y, cw, ch = cv2.boundingRect(cnt)
-            if y < rank_y_limit and x < rank_x_limit:
-                rank_bottom = max(rank_bottom, y + ch)
-    if rank_bottom == 0:
-        rank_bottom = default_rank_bottom
+    
+    rank_bottom = max((y + h for x, y, w, h, area in stats
+                       if area > min_area and y < rank_y_limit and x < rank_x_limit),
+                      default=default_rank_bottom)
     
     search_start = rank_bottom + int(2 * scale)
     search_end = min(height, rank_bottom + search_height)
-    suit_region = all_mask[search_start:search_end, 0:search_x_max]
-    
-    points = cv2.findNonZero(suit_region)
-    if points is None or len(points) < 5:
+    hits = [stat for stat in stats
+            if stat[0] < search_x_max and stat[1] < search_end and stat[1] + stat[3] > search_start]
+    if sum(stat[4] for stat in hits) < 5:
         suit_output = np.zeros((10, 10), dtype=np.uint8)
         suit_output[:] = 255
         return suit_output
     
-    x, y, cw, ch = cv2.boundingRect(points)
     padding = 2
-    y1 = max(0, y + search_start - padding)
-    y2 = min(height, y + search_start + ch + padding)
-    x1 = max(0, x - padding)
-    x2 = min(search_x_max, x + cw + padding)
-    
-    suit_crop = all_mask[y1:y2, x1:x2]
-    suit_output = cv2.bitwise_not(suit_crop)
-    suit_output[suit_output < 128] = 0
-    suit_output[suit_output >= 128] = 255
-    return suit_output
+    y1 = max(0, max(search_start, min(y for x, y, w, h, area in hits)) - padding)
+    y2 = min(height, min(search_end, max(y + h for x, y, w, h, area in hits)) + padding)
+    x1 = max(0, min(x for x, y, w, h, area in hits) - padding)
+    x2 = min(search_x_max, max(x + w for x, y, w, h, area in hits) + padding)
+    
+    return cv2.bitwise_not(mask[y1:y2, x1:x2])
 
 
 def process_cards_legacy():
@@ -0,0 +1,230 @@
+"""
+FreeCell截图批量识别命令行工具（无界面）
+
+用法:
+    python freecell_match.py 截图目录/ [更多目录或通配符 ...] [-o results.jsonl]
+    python freecell_match.py "archive/*.png" -j 8 --mode combined
+
+- 输入可以是目录（读取其中的 .png/.jpg/.bmp）、单个文件或通配符
+- 截图在进程池中并行识别，每个工作进程只加载一次模板（进程级模板缓存常驻）
+- 每张截图输出一行 JSON（JSONL）：布局、完整性验证、逐张置信度、各阶段用时
+- 结束时在 stderr 输出汇总吞吐量（张/秒）
+- --cache 指定结果缓存目录时，已识别过的截图直接返回缓存结果
+- --glyph-cache 为每个工作进程启用字形缓存（combined 模式），重复牌面跳过模板匹配
+- --server（或环境变量 FREECELL_SERVER）指定识别服务地址时，截图交给常驻服务识别
+- --column-detector projection 使用投影法检测列（发光/遮挡连接相邻列时更稳健）
+- --segmentation profile 按行边界检测每列张数，可识别牌局中途的截图
+- --lazy-suit 惰性花色（legacy 模式）：点数可信且同色只剩一个未用花色时跳过花色提取，结束时汇总跳过次数
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import card_pipeline
+import match_numbers
+from card_splitter import COLUMN_DETECTORS, SEGMENTATION_MODES
+from recognition_server import RecognitionClient, SERVER_ENV
+from result_cache import ResultCache
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+# 工作进程内的字形缓存（--glyph-cache 时由 _warm_worker 创建，跨截图复用）
+_glyph_cache: Optional[match_numbers.GlyphCache] = None
+
+
+def collect_inputs(patterns: List[str]) -> List[str]:
+    """展开目录/文件/通配符为截图路径列表（去重，保持输入顺序，目录内按文件名排序）"""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(pattern, f) for f in sorted(os.listdir(pattern))
+                       if f.lower().endswith(IMAGE_EXTENSIONS)]
+        elif os.path.isfile(pattern):
+            matches = [pattern]
+        else:
+            matches = sorted(p for p in glob.glob(pattern, recursive=True)
+                             if p.lower().endswith(IMAGE_EXTENSIONS))
+        paths.extend(matches)
+    return list(dict.fromkeys(paths))
+
+
+def _warm_worker(template_set: str, mode: str, glyph_cache: bool = False):
+    """工作进程初始化：预加载模板集到进程级缓存，按需创建字形缓存
+    template_set 为 'auto' 时预加载参与探测的全部模板集"""
+    global _glyph_cache
+    if glyph_cache and _glyph_cache is None:
+        _glyph_cache = match_numbers.GlyphCache()
+    template_sets = [template_set]
+    if template_set == 'auto':
+        template_base = 'Card_Rank_Templates' if mode == 'legacy' else 'Card_Info_Templates'
+        template_sets = [os.path.basename(d) for d in match_numbers.LegacyTemplateCache.set_dirs(template_base)]
+    for name in template_sets:
+        if mode == 'legacy':
+            rank_dir, suit_dir = match_numbers.resolve_template_dirs(name)
+            if rank_dir is not None:
+                match_numbers.TemplateCache.get(rank_dir, suit_dir or '')
+        else:
+            info_dir = match_numbers.resolve_info_template_dir(name)
+            if info_dir is not None:
+                match_numbers.CombinedTemplateCache.get(info_dir)
+
+
+def _to_record(path: str, outcome: Dict, read_ms: int) -> Dict:
+    """recognize() 的结果 → 一行 JSONL 记录（用时含读图）"""
+    record = dict(path=path, **card_pipeline.outcome_to_record(outcome))
+    record['timings']['read'] = read_ms
+    record['timings']['total'] += read_ms
+    return record
+
+
+def _glyph_hits() -> int:
+    if _glyph_cache is None:
+        return 0
+    return _glyph_cache.hits + _glyph_cache.near_hits
+
+
+def recognize_file(task: Tuple[str, str, str, Optional[bool], Optional[str], str, str, bool]) -> Dict:
+    """单张截图任务：(path, template_set, mode, deck_constraint, cache_dir, column_detector, segmentation, lazy_suit)
+    → JSONL 记录；识别失败时返回 {'path': ..., 'valid': False, 'error': 原因}"""
+    path, template_set, mode, deck_constraint, cache_dir, column_detector, segmentation, lazy_suit = task
+    start_time = time.time()
+    try:
+        image = card_pipeline.load_image(path)
+        if image is None:
+            raise ValueError("无法读取图像")
+        read_ms = int((time.time() - start_time) * 1000)
+        cache = ResultCache(cache_dir) if cache_dir else None
+        glyph_before = _glyph_hits()
+        outcome = card_pipeline.recognize(image, template_set, mode, deck_constraint,
+                                          cache=cache, glyph_cache=_glyph_cache,
+                                          column_detector=column_detector, segmentation=segmentation,
+                                          lazy_suit=lazy_suit)
+        record = _to_record(path, outcome, read_ms)
+        if _glyph_cache is not None:
+            record['glyph_hits'] = _glyph_hits() - glyph_before
+        return record
+    except Exception as e:
+        return {'path': path, 'valid': False, 'error': str(e),
+                'timings': {'total': int((time.time() - start_time) * 1000)}}
+
+
+def _recognize_remote(task: Tuple[RecognitionClient, str, str, str, Optional[bool]]) -> Dict:
+    """识别服务客户端任务：(client, path, template_set, mode, deck_constraint) → JSONL 记录"""
+    client, path, template_set, mode, deck_constraint = task
+    start_time = time.time()
+    try:
+        record = client.recognize_file(path, template_set, mode, deck_constraint)
+    except Exception as e:
+        record = {'error': f"识别服务请求失败: {e}"}
+    if 'error' in record:
+        return {'path': path, 'valid': False, 'error': record['error'],
+                'timings': {'total': int((time.time() - start_time) * 1000)}}
+    record = dict(path=path, **record)
+    record['timings']['total'] = int((time.time() - start_time) * 1000)
+    return record
+
+
+def recognize_files(paths: List[str], template_set: str = 'auto', mode: str = 'legacy',
+                    deck_constraint: Optional[bool] = None,
+                    workers: Optional[int] = None,
+                    cache_dir: Optional[str] = None,
+                    glyph_cache: bool = False,
+                    server: Optional[str] = None,
+                    column_detector: str = 'contour',
+                    segmentation: str = 'deal',
+                    lazy_suit: bool = False) -> Iterator[Dict]:
+    """批量识别，按输入顺序逐条产出记录。
+    workers: 进程数（None 为 CPU 核数，1 为当前进程串行）；使用识别服务时为并发请求数
+    cache_dir: 结果缓存目录（None 为不使用缓存）
+    glyph_cache: 每个工作进程使用字形缓存，记录附带 'glyph_hits'
+    server: 识别服务地址（缓存由服务端管理，cache_dir/glyph_cache/column_detector/segmentation/lazy_suit 不生效）
+    column_detector: 列检测方式，'contour' 轮廓法 / 'projection' 投影法
+    segmentation: 'deal' 开局布局 / 'profile' 行边界检测（牌局中途）
+    lazy_suit: legacy 模式惰性花色，记录附带 'suit_skipped'"""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, max(1, len(paths)))
+    if server:
+        client = RecognitionClient(server)
+        tasks = [(client, path, template_set, mode, deck_constraint) for path in paths]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            yield from pool.map(_recognize_remote, tasks)
+        return
+    
+    tasks = [(path, template_set, mode, deck_constraint, cache_dir, column_detector, segmentation,
+              lazy_suit) for path in paths]
+    if workers <= 1:
+        _warm_worker(template_set, mode, glyph_cache)
+        for task in tasks:
+            yield recognize_file(task)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_warm_worker,
+                             initargs=(template_set, mode, glyph_cache)) as pool:
+        yield from pool.map(recognize_file, tasks)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="FreeCell截图批量识别，每张截图输出一行 JSON")
+    parser.add_argument('inputs', nargs='+', help="截图目录、文件或通配符")
+    parser.add_argument('-o', '--output', default='-', help="JSONL 输出文件（默认 stdout）")
+    parser.add_argument('-t', '--template-set', default='auto', help="模板集名称（默认 auto：探测选择并按卡片尺寸记忆）")
+    parser.add_argument('-m', '--mode', default='legacy', choices=card_pipeline.RECOGNIZE_MODES,
+                        help="legacy: 点数+花色分离匹配；combined: 整体模板匹配")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="工作进程数（默认 CPU 核数）")
+    parser.add_argument('--no-deck', action='store_true', help="关闭整副牌一对一指派")
+    parser.add_argument('--cache', metavar='DIR', default=None, help="结果缓存目录（默认不缓存）")
+    parser.add_argument('--glyph-cache', action='store_true', help="启用字形缓存（combined 模式）")
+    parser.add_argument('--column-detector', default='contour', choices=COLUMN_DETECTORS,
+                        help="列检测方式：contour 轮廓法（默认）；projection 投影法")
+    parser.add_argument('--segmentation', default='deal', choices=SEGMENTATION_MODES,
+                        help="deal: 开局布局（默认）；profile: 按行边界检测每列张数（牌局中途截图）")
+    parser.add_argument('--lazy-suit', action='store_true',
+                        help="惰性花色（legacy 模式）：只在同色花色仍不确定或点数置信度低时提取和匹配花色")
+    parser.add_argument('--server', default=os.environ.get(SERVER_ENV),
+                        help=f"识别服务地址，如 http://127.0.0.1:8765 或 unix:/tmp/freecell.sock（默认取 {SERVER_ENV}）")
+    args = parser.parse_args(argv)
+    
+    paths = collect_inputs(args.inputs)
+    if not paths:
+        print("未找到截图文件", file=sys.stderr)
+        return 1
+    
+    deck_constraint = False if args.no_deck else None
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    start_time = time.time()
+    valid_count = failed_count = glyph_hits = suit_skipped = 0
+    try:
+        for record in recognize_files(paths, args.template_set, args.mode,
+                                      deck_constraint, args.workers, args.cache,
+                                      args.glyph_cache, args.server, args.column_detector,
+                                      args.segmentation, args.lazy_suit):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            if 'error' in record:
+                failed_count += 1
+            elif record['valid']:
+                valid_count += 1
+            glyph_hits += record.get('glyph_hits', 0)
+            suit_skipped += record.get('suit_skipped', 0)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    
+    elapsed = time.time() - start_time
+    print(f"共 {len(paths)} 张截图：验证通过 {valid_count}，未通过 {len(paths) - valid_count - failed_count}，"
+          f"失败 {failed_count}；用时 {elapsed:.2f}s，{len(paths) / elapsed:.2f} 张/秒", file=sys.stderr)
+    if args.glyph_cache:
+        print(f"字形缓存命中 {glyph_hits} 张卡片", file=sys.stderr)
+    if args.lazy_suit:
+        print(f"惰性花色跳过 {suit_skipped} 次花色提取", file=sys.stderr)
+    return 0 if failed_count == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
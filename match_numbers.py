@@ -7,13 +7,26 @@
 3. BatchCardMatcher - 批量匹配，颜色约束优化
 4. 模板缓存 - 同一模板集只加载一次
 5. 向后兼容 - 保留原有 API 接口
+6. NCCMatrixEngine - 矩阵化 NCC，整副牌 × 全部模板一次矩阵乘法
+7. solve_deck_assignment - 整副牌一对一指派，保证 52 张不重复
+8. compile_templates - 模板集预编译为内存映射包，冷启动免 PNG 解码（首次加载或 PNG 更新后自动编译）
+9. GlyphCache - 整体信息图像字形缓存，重复出现的牌面跳过模板匹配
 """
 
 import cv2
+import hashlib
+import json
 import numpy as np
 import os
+import threading
 import time
-from typing import Dict, List, Tuple, Optional
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Tuple, Optional
+
+from card_splitter import MAX_COLUMN_CARDS
+from extract_numbers import binarize_batch
 
 # ============================================================
 # 统一模板管理器
@@ -27,6 +40,141 @@ COLOR_SUIT_MAP = {
 }
 
 
+def _name_color(filename: str) -> str:
+    """文件名中的颜色标记（'_r' / '_b'，提取阶段写入），没有时返回 ''（不做颜色约束）"""
+    for color in COLOR_SUIT_MAP:
+        if f"{color}." in filename:
+            return color
+    return ''
+
+# ============================================================
+# 模板预编译包（内存映射）
+# ============================================================
+
+TEMPLATE_BUNDLE_NAME = 'templates.bundle.npy'
+TEMPLATE_MANIFEST_NAME = 'templates.bundle.json'
+TEMPLATE_BUNDLE_VERSION = 1
+
+
+def _png_sources(template_dir: str) -> Dict[str, Tuple[int, int]]:
+    """目录中 PNG 文件的 {文件名: (mtime_ns, size)}"""
+    sources = {}
+    for file in os.listdir(template_dir):
+        if file.endswith('.png'):
+            st = os.stat(os.path.join(template_dir, file))
+            sources[file] = (st.st_mtime_ns, st.st_size)
+    return sources
+
+
+def compile_templates(template_dir: str) -> Optional[str]:
+    """
+    将模板集预编译为单一包：
+    - templates.bundle.npy: 全部灰度模板按行展平后首尾相接的一维 uint8 数组
+    - templates.bundle.json: 文件名索引（偏移、尺寸）及源 PNG 的 mtime/size 清单
+    加载时用 np.load(mmap_mode='r') 映射，多进程共享同一份页面。
+    TemplateDirReader 在包缺失或过期时自动调用，也可在部署时预先调用。
+    返回包路径，目录不存在或没有模板时返回 None。
+    """
+    if not os.path.isdir(template_dir):
+        return None
+    sources = _png_sources(template_dir)
+    entries, chunks, offset = [], [], 0
+    for file in sorted(sources):
+        img = cv2.imread(os.path.join(template_dir, file), cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            continue
+        mtime_ns, size = sources[file]
+        entries.append({'file': file, 'offset': offset, 'shape': list(img.shape[:2]),
+                        'mtime_ns': mtime_ns, 'size': size})
+        chunks.append(img.reshape(-1))
+        offset += img.size
+    if not entries:
+        return None
+    
+    bundle_path = os.path.join(template_dir, TEMPLATE_BUNDLE_NAME)
+    manifest_path = os.path.join(template_dir, TEMPLATE_MANIFEST_NAME)
+    # 先写临时文件再替换，避免其它进程读到半成品（临时文件按进程区分，工作进程可能同时编译）
+    tmp_bundle = f"{bundle_path}.{os.getpid()}.tmp"
+    with open(tmp_bundle, 'wb') as f:
+        np.save(f, np.concatenate(chunks))
+    tmp_manifest = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_manifest, 'w', encoding='utf-8') as f:
+        json.dump({'version': TEMPLATE_BUNDLE_VERSION, 'files': entries}, f)
+    os.replace(tmp_bundle, bundle_path)
+    os.replace(tmp_manifest, manifest_path)
+    return bundle_path
+
+
+def _load_bundle(template_dir: str) -> Optional[Dict[str, np.ndarray]]:
+    """加载新鲜的预编译包，返回 {文件名: 模板视图}；包不存在或已过期返回 None"""
+    bundle_path = os.path.join(template_dir, TEMPLATE_BUNDLE_NAME)
+    manifest_path = os.path.join(template_dir, TEMPLATE_MANIFEST_NAME)
+    if not (os.path.exists(bundle_path) and os.path.exists(manifest_path)):
+        return None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') != TEMPLATE_BUNDLE_VERSION:
+            return None
+        entries = manifest['files']
+        # 清单与当前 PNG 文件（名称、mtime、大小）完全一致才视为新鲜
+        current = _png_sources(template_dir)
+        recorded = {e['file']: (e['mtime_ns'], e['size']) for e in entries}
+        if current != recorded:
+            return None
+        flat = np.load(bundle_path, mmap_mode='r')
+        images = {}
+        for e in entries:
+            h, w = e['shape']
+            images[e['file']] = flat[e['offset']:e['offset'] + h * w].reshape(h, w)
+        return images
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+class TemplateDirReader:
+    """模板目录读取器：预编译包新鲜时从内存映射读取；包缺失或过期时重新编译，
+    编译失败（如目录只读）时逐个解码 PNG"""
+    
+    def __init__(self, template_dir: str):
+        self.template_dir = template_dir
+        self.bundle = None
+        if os.path.isdir(template_dir):
+            self.bundle = _load_bundle(template_dir)
+            if self.bundle is None:
+                try:
+                    if compile_templates(template_dir):
+                        self.bundle = _load_bundle(template_dir)
+                except OSError:
+                    pass
+        if self.bundle is not None:
+            self.files = list(self.bundle)
+        elif os.path.isdir(template_dir):
+            self.files = os.listdir(template_dir)
+        else:
+            self.files = []
+    
+    def read(self, file: str) -> Optional[np.ndarray]:
+        if self.bundle is not None:
+            return self.bundle.get(file)
+        return cv2.imread(os.path.join(self.template_dir, file), cv2.IMREAD_GRAYSCALE)
+
+
+# 一副牌的全部 52 个标签（{rank}{suit}）
+DECK_LABELS = [rank + suit for suit in 'HSDC' for rank in 'A23456789TJQK']
+
+# 尺寸分组: [((h, w), [(原始序号, 模板图像, 标签), ...]), ...]
+ShapeGroups = List[Tuple[Tuple[int, int], List[Tuple[int, np.ndarray, str]]]]
+
+
+def _group_by_shape(templates: List[Tuple[np.ndarray, str]]) -> ShapeGroups:
+    """按模板尺寸分组，保留原始序号用于同分时的先后顺序"""
+    groups: Dict[Tuple[int, int], List[Tuple[int, np.ndarray, str]]] = {}
+    for idx, (img, label) in enumerate(templates):
+        groups.setdefault(img.shape[:2], []).append((idx, img, label))
+    return list(groups.items())
+
+
 class UnifiedTemplateManager:
     """
     统一模板管理器：从 rank_dir 和 suit_dir 一次性加载所有模板。
@@ -42,12 +190,19 @@ class UnifiedTemplateManager:
         # {color: [(cv_img, label), ...]}
         self.rank_templates: Dict[str, List[Tuple[np.ndarray, str]]] = {'_r': [], '_b': []}
         self.suit_templates: Dict[str, List[Tuple[np.ndarray, str]]] = {'_r': [], '_b': []}
+        # {color: ShapeGroups}，加载时预先按尺寸分组
+        self.rank_groups: Dict[str, ShapeGroups] = {}
+        self.suit_groups: Dict[str, ShapeGroups] = {}
+        self._engines: Dict[Tuple[str, str, str], '_MatrixEngine'] = {}
         self._load_all()
     
     def _load_all(self):
         """一次性加载 rank + suit 模板"""
         self._load_dir(self.rank_dir, self.rank_templates, RANK_CHARS)
         self._load_dir(self.suit_dir, self.suit_templates, SUIT_CHARS)
+        for color in ('_r', '_b'):
+            self.rank_groups[color] = _group_by_shape(self.rank_templates[color])
+            self.suit_groups[color] = _group_by_shape(self.suit_templates[color])
     
     @staticmethod
     def _load_dir(template_dir: str, 
@@ -57,7 +212,8 @@ class UnifiedTemplateManager:
         if not os.path.exists(template_dir):
             return
         
-        for file in os.listdir(template_dir):
+        reader = TemplateDirReader(template_dir)
+        for file in reader.files:
             if not file.endswith('.png'):
                 continue
             parts = file.split('_')
@@ -68,10 +224,18 @@ class UnifiedTemplateManager:
             if label not in valid_labels:
                 continue
             
-            img = cv2.imread(os.path.join(template_dir, file), cv2.IMREAD_GRAYSCALE)
+            img = reader.read(file)
             if img is not None:
                 target[color].append((img, label))
     
+    def get_engine(self, kind: str, color: str, backend: str = 'ncc') -> '_MatrixEngine':
+        """返回 rank/suit 某颜色模板的矩阵引擎（按后端缓存）"""
+        key = (kind, color, backend)
+        if key not in self._engines:
+            templates = self.rank_templates if kind == 'rank' else self.suit_templates
+            self._engines[key] = MATCH_BACKENDS[backend](templates[color])
+        return self._engines[key]
+    
     def get_rank_count(self, color: str) -> int:
         return len(self.rank_templates.get(color, []))
     
@@ -103,28 +267,39 @@ CARD_CHARS = set('A23456789TJQK') | set('HSDC')
 
 class CombinedTemplateManager:
     """整体模板管理器：从单一目录加载点数+花色组合模板。
-    模板文件命名规则: {rank}{suit}.png (如 AH.png, 2S.png, TC.png)
+    模板文件命名规则: {rank}{suit}.png (如 AH.png, 2S.png, TC.png)，规范化模板集为 {rank}{suit}_{seq}.png
     """
     
     def __init__(self, template_dir: str):
         self.template_dir = template_dir
         self.templates: Dict[str, List[Tuple[np.ndarray, str]]] = {'_r': [], '_b': []}
+        self._engines: Dict[str, '_MatrixEngine'] = {}
         self._load()
+        self.groups: ShapeGroups = _group_by_shape(self.templates['_r'] + self.templates['_b'])
+    
+    def get_engine(self, backend: str = 'ncc') -> '_MatrixEngine':
+        """返回全部模板的矩阵引擎（首次调用时构建，按后端缓存）"""
+        if backend not in self._engines:
+            self._engines[backend] = MATCH_BACKENDS[backend](
+                self.templates['_r'] + self.templates['_b'])
+        return self._engines[backend]
     
     def _load(self):
         if not os.path.exists(self.template_dir):
             return
-        for file in os.listdir(self.template_dir):
+        reader = TemplateDirReader(self.template_dir)
+        for file in reader.files:
             if not file.endswith('.png'):
                 continue
-            label = file[:-4]
+            # 规范化模板集同一标签有多个来源：{rank}{suit}_{seq}.png
+            label = file[:-4].split('_')[0]
             if len(label) != 2:
                 continue
             rank, suit = label[0], label[1]
             if rank not in RANK_CHARS or suit not in SUIT_CHARS:
                 continue
             color = '_r' if suit in 'HD' else '_b'
-            img = cv2.imread(os.path.join(self.template_dir, file), cv2.IMREAD_GRAYSCALE)
+            img = reader.read(file)
             if img is not None:
                 self.templates[color].append((img, label))
 
@@ -143,52 +318,696 @@ class CombinedTemplateCache:
         cls._cache.clear()
 
 
+# ============================================================
+# 规范化模板集（与分辨率无关）
+# ============================================================
+
+CANONICAL_SET_NAME = 'set_canonical'
+# 规范画布 (h, w)：字形外接框拉伸到整个画布（不保持宽高比）
+# 整体信息图像的点数和花色分别规范化后上下拼接，画布为两者之和；两部分面积接近，花色在 NCC 中不被点数淹没
+CANONICAL_SIZES = {'rank': (32, 24), 'suit': (24, 24)}
+CANONICAL_SIZES['info'] = (CANONICAL_SIZES['rank'][0] + CANONICAL_SIZES['suit'][0],
+                           CANONICAL_SIZES['rank'][1])
+# 构建时同一标签的两个规范模板平均每像素灰度差不超过此值视为重复
+CANONICAL_DEDUP_DIFF = 2
+# 模板库目录 → 字形类别
+CANONICAL_KINDS = {'Card_Rank_Templates': 'rank', 'Card_Suit_Templates': 'suit',
+                   'Card_Info_Templates': 'info'}
+
+
+def is_canonical_set(template_dir: Optional[str]) -> bool:
+    """是否为规范化模板集目录（set_canonical）"""
+    return bool(template_dir) and os.path.basename(os.path.normpath(template_dir)) == CANONICAL_SET_NAME
+
+
+def _union_boxes(boxes: List[Tuple[int, int, int, int]]) -> Tuple[int, int, int, int]:
+    """多个 (x, y, w, h) 的外接框"""
+    x0, y0 = min(b[0] for b in boxes), min(b[1] for b in boxes)
+    x1, y1 = max(b[0] + b[2] for b in boxes), max(b[1] + b[3] for b in boxes)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def _info_glyph_boxes(gray: np.ndarray) -> Tuple[Optional[Tuple], Optional[Tuple]]:
+    """在整体信息图像中定位点数框和花色框 (x, y, w, h)。
+    忽略接触图像边缘的连通域（卡片边框、相邻大花色）；点数 = 上半部分面积最大的连通域
+    及与它同行的连通域（"10" 的 "1"）；花色 = 点数下方面积最大的连通域及其正下方相邻的碎片（梅花的茎）"""
+    _, _, stats, _ = cv2.connectedComponentsWithStats((gray < 128).view(np.uint8), connectivity=8)
+    height, width = gray.shape
+    comps = [tuple(stat) for stat in stats[1:].tolist()
+             if stat[0] > 0 and stat[1] > 0 and stat[0] + stat[2] < width and stat[1] + stat[3] < height]
+    upper = [c for c in comps if c[1] < height // 2]
+    if not upper:
+        return None, None
+    anchor = max(upper, key=lambda c: c[4])
+    ax, ay, aw, ah, area = anchor
+    rank = [c[:4] for c in comps if c[4] * 10 >= area
+            and min(c[1] + c[3], ay + ah) - max(c[1], ay) >= min(c[3], ah) / 2]
+    rank_box = _union_boxes(rank)
+    
+    below = [c for c in comps if c[1] >= rank_box[1] + rank_box[3]]
+    if not below:
+        return rank_box, None
+    sx, sy, sw, sh, _ = max(below, key=lambda c: c[4])
+    gap = max(2, sh // 4)
+    suit = [c[:4] for c in below if c[0] < sx + sw and c[0] + c[2] > sx
+            and sy <= c[1] <= sy + sh + gap]
+    return rank_box, _union_boxes(suit)
+
+
+def _fit_glyph(gray: np.ndarray, box: Optional[Tuple[int, int, int, int]],
+               size: Tuple[int, int]) -> np.ndarray:
+    """把外接框内的字形拉伸到 size 画布（外接框四边与画布四边对齐），没有字形时为空白画布。
+    按高度缩放、左对齐时，宽度取整和抗锯齿边缘使字形中心左右漂移 1-2 像素，
+    缩放截图上黑桃/梅花、方块/黑桃等形近花色因此混淆"""
+    height, width = size
+    if box is None:
+        return np.full((height, width), 255, dtype=np.uint8)
+    x, y, w, h = box
+    return cv2.resize(gray[y:y + h, x:x + w], (width, height), interpolation=cv2.INTER_AREA)
+
+
+def canonicalize_glyph(image: np.ndarray, kind: str) -> np.ndarray:
+    """白底黑字图像 → 规范画布（CANONICAL_SIZES[kind]）。
+    按检测到的字形外接框裁切并拉伸到固定画布，不同分辨率的同一字形
+    得到相同尺寸的图像，匹配不再需要尺寸惩罚。
+    kind: 'rank' / 'suit'（已裁切的点数/花色图像，外接框取全部字形像素）；
+          'info'（整体信息图像，点数和花色分别定位、规范化后上下拼接）
+    """
+    gray = _to_gray(image)
+    if kind == 'info':
+        rank_box, suit_box = _info_glyph_boxes(gray)
+        return np.vstack([_fit_glyph(gray, rank_box, CANONICAL_SIZES['rank']),
+                          _fit_glyph(gray, suit_box, CANONICAL_SIZES['suit'])])
+    points = cv2.findNonZero((gray < 128).view(np.uint8))
+    box = None if points is None else cv2.boundingRect(points)
+    return _fit_glyph(gray, box, CANONICAL_SIZES[kind])
+
+
+def _template_label(file: str, kind: str) -> Optional[Tuple[str, str]]:
+    """模板文件名 → (标签, 颜色)，不符合命名规则时返回 None"""
+    parts = file[:-4].split('_')
+    if kind == 'info':
+        label = parts[0]
+        if len(label) != 2 or label[0] not in RANK_CHARS or label[1] not in SUIT_CHARS:
+            return None
+        return label, 'r' if label[1] in 'HD' else 'b'
+    if len(parts) != 3 or parts[0] not in (RANK_CHARS if kind == 'rank' else SUIT_CHARS):
+        return None
+    return parts[0], parts[1]
+
+
+def build_canonical_templates(template_base: str) -> Optional[str]:
+    """
+    把 template_base（Card_Rank_Templates / Card_Suit_Templates / Card_Info_Templates）下
+    现有的各分辨率模板集（set_1920x1080、set_2880x1800 等）逐个规范化，合并为 set_canonical。
+    文件命名沿用原规则并按来源编号：点数/花色 {label}_{color}_{seq}.png，整体 {rank}{suit}_{seq}.png。
+    返回规范化模板集目录，没有可用模板时返回 None。
+    """
+    kind = CANONICAL_KINDS[os.path.basename(os.path.normpath(template_base))]
+    if not os.path.isdir(template_base):
+        return None
+    sources = [os.path.join(template_base, d) for d in sorted(os.listdir(template_base))
+               if d.startswith('set_') and d != CANONICAL_SET_NAME
+               and os.path.isdir(os.path.join(template_base, d))]
+    templates, kept = [], {}
+    for source in sources:
+        reader = TemplateDirReader(source)
+        for file in sorted(reader.files):
+            parsed = _template_label(file, kind) if file.endswith('.png') else None
+            img = reader.read(file) if parsed is not None else None
+            if img is None:
+                continue
+            glyph = canonicalize_glyph(img, kind)
+            # 不同分辨率的模板规范化后常常几乎相同，只保留一份，避免匹配时重复计算
+            if any(cv2.norm(glyph, other, cv2.NORM_L1) <= CANONICAL_DEDUP_DIFF * glyph.size
+                   for other in kept.setdefault(parsed, [])):
+                continue
+            kept[parsed].append(glyph)
+            label, color = parsed
+            seq = len(kept[parsed])
+            name = f"{label}_{seq}.png" if kind == 'info' else f"{label}_{color}_{seq}.png"
+            templates.append((name, glyph))
+    if not templates:
+        return None
+    
+    output_dir = os.path.join(template_base, CANONICAL_SET_NAME)
+    os.makedirs(output_dir, exist_ok=True)
+    for file in os.listdir(output_dir):
+        if file.endswith('.png'):
+            os.remove(os.path.join(output_dir, file))
+    for name, img in templates:
+        cv2.imwrite(os.path.join(output_dir, name), img)
+    return output_dir
+
+
+# ============================================================
+# 字形缓存
+# ============================================================
+
+GLYPH_CANONICAL_SIZE = (32, 20)  # 规范尺寸 (h, w)，与整体模板宽高比接近
+GLYPH_PHASH_SIZE = (16, 8)       # 感知哈希尺寸 (h, w)，共 128 位
+
+
+def _canonical_glyph(image: np.ndarray) -> np.ndarray:
+    """缩放到规范尺寸并重新二值化"""
+    gray = _to_gray(image)
+    h, w = GLYPH_CANONICAL_SIZE
+    if gray.shape[:2] != (h, w):
+        gray = cv2.resize(gray, (w, h), interpolation=cv2.INTER_AREA)
+    return cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)[1]
+
+
+def _glyph_digest(image: np.ndarray) -> str:
+    """二值信息图的精确哈希（含尺寸）。
+    同一分辨率下提取尺寸固定，直接对原图取哈希，省去缩放（每张约 4µs）"""
+    gray = np.ascontiguousarray(_to_gray(image))
+    h = hashlib.sha1(f"{gray.shape}".encode())
+    h.update(gray.data)
+    return h.hexdigest()
+
+
+def _glyph_phash(image: np.ndarray) -> int:
+    """规范尺寸二值图的 128 位感知哈希（均值阈值）"""
+    h, w = GLYPH_PHASH_SIZE
+    small = cv2.resize(_canonical_glyph(image), (w, h), interpolation=cv2.INTER_AREA)
+    bits = np.packbits(small.reshape(-1) > small.mean())
+    return int.from_bytes(bits.tobytes(), 'big')
+
+
+class GlyphCache:
+    """
+    整体信息图像 → {rank, suit, confidence} 的字形缓存。
+    同一分辨率下 52 张牌面在每局中重复出现，匹配过一次即可复用：
+    - 精确命中：二值图哈希相同，完全跳过模板匹配
+    - 近似命中：规范尺寸感知哈希 Hamming 距离 ≤ near_distance 且候选标签唯一
+      （只在启用时计算和存储，跨分辨率的同一牌面也可命中）。默认关闭（near_distance=0）：
+      128 位感知哈希分不开形近的牌面（1080p 下 8S/6S 距离为 0，3C/2C、4C/4S 等为 3），
+      缓存中只有其中一张时另一张会被误判
+    - 只缓存置信度 ≥ min_confidence 的结果；按模板集目录分命名空间
+    - hits / near_hits / misses 计数；指定 path 时可 load()/save() 持久化（JSON，
+      识别服务的 --glyph-cache-file 启动时加载、退出时保存）
+    - 线程安全，可在多线程服务中共享
+    """
+    
+    def __init__(self, path: Optional[str] = None, near_distance: int = 0,
+                 min_confidence: float = 70.0):
+        self.path = path
+        self.near_distance = near_distance
+        self.min_confidence = min_confidence
+        # {namespace: {digest: (phash, entry)}}，未启用近似命中时写入的 phash 为 None
+        self.entries: Dict[str, Dict[str, Tuple[int, Dict]]] = {}
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load()
+    
+    def lookup(self, image: np.ndarray, namespace: str) -> Optional[Dict]:
+        """查找缓存，命中返回 {'rank', 'suit', 'confidence', 'count': 0, 'cached': 'exact'|'near'}"""
+        digest = _glyph_digest(image)
+        with self._lock:
+            entries = self.entries.get(namespace, {})
+            if digest in entries:
+                self.hits += 1
+                return dict(entries[digest][1], count=0, cached='exact')
+            candidates = ([(other, entry) for other, entry in entries.values() if other is not None]
+                          if self.near_distance > 0 else [])
+        if candidates:
+            phash = _glyph_phash(image)
+            near = [entry for other, entry in candidates
+                    if (phash ^ other).bit_count() <= self.near_distance]
+            if near and len({(e['rank'], e['suit']) for e in near}) == 1:
+                with self._lock:
+                    self.near_hits += 1
+                return dict(near[0], count=0, cached='near')
+        with self._lock:
+            self.misses += 1
+        return None
+    
+    def store(self, image: np.ndarray, namespace: str, result: Dict):
+        """写入匹配结果（未识别或置信度不足时忽略）；感知哈希只在启用近似命中时计算"""
+        if result.get('rank') is None or result['confidence'] < self.min_confidence:
+            return
+        phash = _glyph_phash(image) if self.near_distance > 0 else None
+        value = (phash, {
+            'rank': result['rank'], 'suit': result['suit'],
+            'confidence': float(result['confidence']),
+        })
+        digest = _glyph_digest(image)
+        with self._lock:
+            self.entries.setdefault(namespace, {})[digest] = value
+    
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self.hits, 'near_hits': self.near_hits, 'misses': self.misses,
+                    'entries': sum(len(e) for e in self.entries.values())}
+    
+    def save(self, path: Optional[str] = None):
+        path = path or self.path
+        with self._lock:
+            data = {ns: {digest: [phash, entry] for digest, (phash, entry) in entries.items()}
+                    for ns, entries in self.entries.items()}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+    
+    def load(self, path: Optional[str] = None):
+        path = path or self.path
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.entries = {ns: {digest: (phash, entry) for digest, (phash, entry) in entries.items()}
+                        for ns, entries in data.items()}
+
+
 class CombinedCardMatcher:
-    """整体卡片匹配器：匹配点数+花色组合"""
+    """整体卡片匹配器：匹配点数+花色组合
+    backend: 'ncc' 灰度归一化相关（默认）；'binary' 位压缩二值 Hamming 匹配（缩放截图上准确率较低）；
+             'cascade' 由粗到细级联匹配（结果附带 'skipped' 省去的精匹配模板数）
+    glyph_cache: 字形缓存，命中的卡片跳过模板匹配（结果附带 'cached'）
+    template_dir 为规范化模板集（set_canonical）时，信息图像先经 canonicalize_glyph 规范化
+    colors: match_cards / match_deck 可传入每张卡片的颜色（'_r' / '_b'，'' 为未知），
+            同 BatchCardMatcher 的颜色约束：红牌只匹配 H/D，黑牌只匹配 S/C
+    """
     
     def __init__(self, template_dir: str,
                  size_threshold: float = 0.3,
-                 match_threshold: float = 0.4):
+                 match_threshold: float = 0.4,
+                 backend: str = 'ncc',
+                 glyph_cache: Optional[GlyphCache] = None):
+        self.template_dir = template_dir
         self.tm = CombinedTemplateCache.get(template_dir)
         self.size_threshold = size_threshold
         self.match_threshold = match_threshold
+        self.backend = _check_backend(backend)
+        self.glyph_cache = glyph_cache
+        self.canonical = is_canonical_set(template_dir)
+    
+    def _prepare(self, info_image: np.ndarray) -> np.ndarray:
+        """匹配前的灰度图（规范化模板集时为规范画布）"""
+        if self.canonical:
+            return canonicalize_glyph(info_image, 'info')
+        return _to_gray(info_image)
     
     def match_card(self, info_image: np.ndarray) -> Dict:
         """匹配整体信息图像，返回点数+花色"""
-        all_templates = self.tm.templates['_r'] + self.tm.templates['_b']
-        if not all_templates:
+        if not self.tm.groups:
             return {'rank': None, 'suit': None, 'confidence': 0.0, 'count': 0}
         
-        if len(info_image.shape) > 2:
-            info_image = cv2.cvtColor(info_image, cv2.COLOR_BGR2GRAY)
+        if self.backend != 'ncc':
+            return self.match_cards([info_image])[0]
         
-        best_label = None
-        best_score = 0.0
-        match_count = 0
+        if self.glyph_cache is not None:
+            cached = self.glyph_cache.lookup(info_image, self.template_dir)
+            if cached is not None:
+                return cached
         
-        for template, label in all_templates:
-            match_count += 1
-            score, size_score = _match_single(info_image, template, self.size_threshold)
-            threshold = self.match_threshold * (0.8 + 0.2 * size_score)
-            if score > best_score and score > threshold:
-                best_score = score
-                best_label = label
+        best_label, confidence, match_count = _match_against_groups(
+            self._prepare(info_image), self.tm.groups, self.size_threshold, self.match_threshold)
         
         if best_label:
-            return {
+            result = {
                 'rank': best_label[0],
                 'suit': best_label[1],
-                'confidence': best_score * 100,
+                'confidence': confidence,
                 'count': match_count,
             }
+            if self.glyph_cache is not None:
+                self.glyph_cache.store(info_image, self.template_dir, result)
+            return result
         return {'rank': None, 'suit': None, 'confidence': 0.0, 'count': match_count}
+    
+    def _lookup_glyphs(self, info_images: List[np.ndarray]) -> List[Optional[Dict]]:
+        if self.glyph_cache is None:
+            return [None] * len(info_images)
+        return [self.glyph_cache.lookup(img, self.template_dir) for img in info_images]
+    
+    def match_cards(self, info_images: List[np.ndarray],
+                    colors: Optional[List[str]] = None) -> List[Dict]:
+        """批量匹配整副牌：全部信息图像 × 全部模板一次矩阵乘法（每种颜色一次）。
+        返回与 match_card 相同格式的结果列表（顺序与输入一致）。
+        字形缓存命中的卡片不参与矩阵运算。
+        """
+        if not info_images:
+            return []
+        engine = self.tm.get_engine(self.backend)
+        if not engine.labels:
+            return [{'rank': None, 'suit': None, 'confidence': 0.0, 'count': 0}
+                    for _ in info_images]
+        
+        results = self._lookup_glyphs(info_images)
+        pending = [i for i, r in enumerate(results) if r is None]
+        if not pending:
+            return results
+        
+        colors = colors or [''] * len(info_images)
+        by_color: Dict[str, List[int]] = {}
+        for i in pending:
+            by_color.setdefault(colors[i], []).append(i)
+        matched = {}
+        for color, rows in by_color.items():
+            suits = COLOR_SUIT_MAP.get(color)
+            allowed = [label for label in engine.labels if label[1] in suits] if suits else None
+            images = [self._prepare(info_images[i]) for i in rows]
+            matched.update(zip(rows, engine.match_batch(
+                images, self.size_threshold, self.match_threshold, allowed)))
+        matches = [matched[i] for i in pending]
+        
+        total = len(engine.labels)
+        for i, (label, confidence, count) in zip(pending, matches):
+            if label is None:
+                result = {'rank': None, 'suit': None, 'confidence': 0.0, 'count': count}
+            else:
+                result = {
+                    'rank': label[0],
+                    'suit': label[1],
+                    'confidence': confidence,
+                    'count': count,
+                }
+            if self.backend == 'cascade':
+                result['skipped'] = total - count
+            results[i] = result
+            if self.glyph_cache is not None:
+                self.glyph_cache.store(info_images[i], self.template_dir, result)
+        return results
+    
+    def match_deck(self, info_images: List[np.ndarray],
+                   colors: Optional[List[str]] = None) -> List[Dict]:
+        """整副牌约束匹配：卡片 × 标签得分矩阵上求一对一最优指派，
+        保证结果不重复。额外返回 'margin'（指派得分 - 该卡其它标签最高分）。
+        colors 给出时颜色不符的标签得分为 -inf。
+        """
+        if not info_images:
+            return []
+        # 字形缓存全部精确命中且标签互不相同时，逐张最优即为最优指派，无需计算得分矩阵
+        # （此时没有 'margin'）；近似命中可能是形近的另一张牌，必须重新打分
+        cached = self._lookup_glyphs(info_images)
+        if (all(r is not None and r['cached'] == 'exact' for r in cached)
+                and len({(r['rank'], r['suit']) for r in cached}) == len(cached)):
+            return cached
+        # 级联后端只有粗筛得分，整副指派统一使用完整 NCC 得分
+        backend = 'ncc' if self.backend == 'cascade' else self.backend
+        engine = self.tm.get_engine(backend)
+        images = [self._prepare(img) for img in info_images]
+        scores = _label_score_matrix(engine, images, DECK_LABELS, self.size_threshold)
+        if colors:
+            for row, color in enumerate(colors):
+                suits = COLOR_SUIT_MAP.get(color)
+                if suits:
+                    scores[row, [label[1] not in suits for label in DECK_LABELS]] = -np.inf
+        labels, assigned, margins = solve_deck_assignment(scores, DECK_LABELS)
+        
+        count = len(engine.labels)
+        results = []
+        for info_image, label, score, margin in zip(info_images, labels, assigned, margins):
+            if label is None:
+                results.append({'rank': None, 'suit': None, 'confidence': 0.0,
+                                'count': count, 'margin': 0.0})
+                continue
+            result = {
+                'rank': label[0],
+                'suit': label[1],
+                'confidence': max(0.0, score) * 100,
+                'count': count,
+                'margin': margin * 100,
+            }
+            # 只缓存同时也是逐张最优的指派（margin > 0），保证缓存标签即最高分标签
+            if self.glyph_cache is not None and margin > 0:
+                self.glyph_cache.store(info_image, self.template_dir, result)
+            results.append(result)
+        return results
+
+
+# ============================================================
+# 矩阵化 NCC 引擎
+# ============================================================
+
+def _to_gray(image: np.ndarray) -> np.ndarray:
+    if len(image.shape) > 2:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+
+def _stack_resized(images: List[np.ndarray], size: Tuple[int, int]) -> np.ndarray:
+    """将灰度图统一缩放到 size=(h, w)，堆叠为 (n, h*w) 的 float32 矩阵"""
+    h, w = size
+    stacked = np.empty((len(images), h * w), dtype=np.float32)
+    for i, img in enumerate(images):
+        if img.shape[:2] != (h, w):
+            img = cv2.resize(img, (w, h))
+        stacked[i] = img.reshape(-1)
+    return stacked
+
+
+def _normalize_rows(mat: np.ndarray) -> np.ndarray:
+    """按行去均值并归一化为单位向量（常数行保持为零向量）"""
+    mat = mat - mat.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    mat /= norms
+    return mat
+
+
+class _MatrixEngine(ABC):
+    """矩阵引擎基类：记录标签、原始模板尺寸和统一的标准尺寸 (h, w)；子类实现 score"""
+    
+    def __init__(self, templates: List[Tuple[np.ndarray, str]],
+                 size: Optional[Tuple[int, int]] = None):
+        self.labels = [label for _, label in templates]
+        self.template_shapes = np.array([img.shape[:2] for img, _ in templates],
+                                        dtype=np.float32).reshape(-1, 2)
+        if size is None:
+            if templates:
+                size = tuple(int(v) for v in np.median(self.template_shapes, axis=0))
+            else:
+                size = (1, 1)
+        self.size = size
+    
+    @abstractmethod
+    def score(self, images: List[np.ndarray]) -> np.ndarray:
+        """返回 (n_images, n_templates) 的相似度矩阵（输入为灰度图）"""
+    
+    def match_batch(self, images: List[np.ndarray],
+                    size_threshold: float, match_threshold: float,
+                    allowed_labels: Optional[List[str]] = None) -> List[Tuple[Optional[str], float, int]]:
+        """批量匹配灰度图像，每张返回 (best_label, confidence_percent, match_count)"""
+        if not images:
+            return []
+        if not self.labels:
+            return [(None, 0.0, 0) for _ in images]
+        scores = self.score(images)
+        count = len(self.labels)
+        if allowed_labels is not None:
+            keep = np.array([label in allowed_labels for label in self.labels])
+            # 取相似度下限而非 -inf：尺寸相似度为 0 时 -inf * 0 为 NaN
+            scores = np.where(keep, scores, -1.0)
+            count = int(keep.sum())
+        best_idx, best_scores = _select_best(
+            scores, self.size_scores(images), size_threshold, match_threshold)
+        return [(self.labels[idx], float(score) * 100, count) if idx >= 0 else (None, 0.0, count)
+                for idx, score in zip(best_idx, best_scores)]
+    
+    def size_scores(self, images: List[np.ndarray]) -> np.ndarray:
+        """向量化的 _calculate_size_similarity，返回 (n_images, n_templates)"""
+        shapes = np.array([img.shape[:2] for img in images], dtype=np.float32).reshape(-1, 2)
+        ratios = shapes[:, None, :] / self.template_shapes[None, :, :]
+        return 1 - np.abs(1 - ratios.min(axis=2))
+
+
+class NCCMatrixEngine(_MatrixEngine):
+    """
+    矩阵化 NCC 引擎：
+    - 模板统一缩放到标准尺寸，去均值、单位化后存为 (n_templates, D) 矩阵
+    - 查询图像同样处理后堆叠，一次矩阵乘法得到 (n_images, n_templates) 得分
+    - 同尺寸下与 TM_CCOEFF_NORMED 等价
+    """
+    
+    def __init__(self, templates: List[Tuple[np.ndarray, str]],
+                 size: Optional[Tuple[int, int]] = None):
+        super().__init__(templates, size)
+        self.matrix = _normalize_rows(_stack_resized([img for img, _ in templates], self.size))
+    
+    def score(self, images: List[np.ndarray]) -> np.ndarray:
+        """返回 (n_images, n_templates) 的 NCC 得分矩阵（输入为灰度图）"""
+        queries = _normalize_rows(_stack_resized(images, self.size))
+        return queries @ self.matrix.T
+
+
+# 每个字节的置位数查找表（NumPy >= 2.0 优先使用 np.bitwise_count）
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
 
 
+def _popcount_rows(bits: np.ndarray) -> np.ndarray:
+    """对最后一维求置位总数"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(bits).sum(axis=-1, dtype=np.int32)
+    return _POPCOUNT_TABLE[bits].sum(axis=-1, dtype=np.int32)
+
+
+class BinaryMatrixEngine(_MatrixEngine):
+    """
+    位压缩二值引擎：
+    - 模板和查询统一缩放到标准尺寸，黑色像素（字形）用 np.packbits 压缩为位平面
+    - 一次向量化 XOR/OR + 查表 popcount 对全部模板打分，内存为 uint8 灰度的 1/8
+    - 得分 = 1 - popcount(a ^ b) / popcount(a | b)，即字形像素的 Tanimoto 相似度
+    - 缩放截图上不如 NCC：缩放后的抗锯齿笔画在 128 阈值处粗细变化，二值化放大了与模板的差异
+      （1080p 截图放大 1.25 倍、set_1920x1080、不加整副牌约束：20/52，NCC 为 28/52）
+    """
+    
+    def __init__(self, templates: List[Tuple[np.ndarray, str]],
+                 size: Optional[Tuple[int, int]] = None):
+        super().__init__(templates, size)
+        self.bits = self._pack([img for img, _ in templates])
+    
+    def _pack(self, images: List[np.ndarray]) -> np.ndarray:
+        """二值化并按行压缩为 (n, ceil(h*w/8)) 的 uint8 位平面"""
+        ink = _stack_resized(images, self.size) < 128
+        return np.packbits(ink, axis=1)
+    
+    def score(self, images: List[np.ndarray]) -> np.ndarray:
+        """返回 (n_images, n_templates) 的二值相似度矩阵（输入为灰度图）"""
+        queries = self._pack(images)[:, None, :]
+        diff = _popcount_rows(queries ^ self.bits[None, :, :])
+        union = _popcount_rows(queries | self.bits[None, :, :])
+        return 1.0 - diff / np.maximum(union, 1)
+
+
+def _select_best(ncc: np.ndarray, size_scores: np.ndarray,
+                 size_threshold: float, match_threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    按 _match_against_templates 的规则从得分矩阵中逐行选出最佳模板。
+    返回 (best_index, best_score)，无有效匹配的行 best_index 为 -1。
+    """
+    final = np.where(size_scores < size_threshold, 0.0, ncc * size_scores)
+    threshold = match_threshold * (0.8 + 0.2 * size_scores)
+    final = np.where((final > threshold) & (final > 0), final, -np.inf)
+    best_idx = np.argmax(final, axis=1)
+    best_scores = final[np.arange(len(final)), best_idx]
+    valid = np.isfinite(best_scores)
+    return np.where(valid, best_idx, -1), np.where(valid, best_scores, 0.0)
+
+
+def _label_score_matrix(engine: _MatrixEngine, images: List[np.ndarray],
+                        label_space: List[str], size_threshold: float) -> np.ndarray:
+    """
+    计算 (n_images, len(label_space)) 的标签得分矩阵：
+    得分 = 相似度 × 尺寸相似度，同一标签取多个模板中的最高分，
+    没有模板或尺寸不符的标签为 -inf。
+    """
+    result = np.full((len(images), len(label_space)), -np.inf)
+    if not images or not engine.labels:
+        return result
+    size_scores = engine.size_scores(images)
+    scores = np.where(size_scores < size_threshold, -np.inf, engine.score(images) * size_scores)
+    index = {label: i for i, label in enumerate(label_space)}
+    for col, label in enumerate(engine.labels):
+        if label in index:
+            j = index[label]
+            result[:, j] = np.maximum(result[:, j], scores[:, col])
+    return result
+
+
+def _linear_sum_assignment(cost: np.ndarray) -> np.ndarray:
+    """
+    最小代价指派（匈牙利算法，最短增广路实现，内层循环 NumPy 向量化）。
+    cost: (n, m) 且 n <= m，返回每行分配到的列号。
+    """
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=int)    # p[j]: 分配到第 j 列的行号（从 1 开始，0 表示空）
+    way = np.zeros(m + 1, dtype=int)
+    
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            used_cols = np.nonzero(used)[0]
+            u[p[used_cols]] += delta
+            v[used_cols] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        # 沿增广路回溯更新匹配
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    
+    assignment = np.zeros(n, dtype=int)
+    for j in range(1, m + 1):
+        if p[j]:
+            assignment[p[j] - 1] = j - 1
+    return assignment
+
+
+def solve_deck_assignment(scores: np.ndarray,
+                          label_space: List[str] = DECK_LABELS) -> Tuple[List[Optional[str]], List[float], List[float]]:
+    """
+    整副牌一对一指派：在 (n_cards, n_labels) 得分矩阵上最大化总得分，
+    每个标签最多分配给一张卡片（n_cards <= n_labels）。
+    
+    返回 (labels, scores, margins):
+    - labels: 每张卡片分配到的标签，得分为 -inf（无可用模板）时为 None
+    - scores: 分配到的标签得分
+    - margins: 分配得分 - 该卡其它标签的最高得分；为负说明为满足整副约束
+               放弃了单卡最优，可作为低置信度提示
+    """
+    n, m = scores.shape
+    if n == 0:
+        return [], [], []
+    if n > m:
+        raise ValueError(f"卡片数 {n} 超过标签数 {m}，无法一对一指派")
+    
+    finite = np.isfinite(scores)
+    # -inf 换成足够大的有限代价，保证算法数值稳定
+    floor = scores[finite].min() - 1.0 if finite.any() else 0.0
+    filled = np.where(finite, scores, floor - 1000.0)
+    assignment = _linear_sum_assignment(-filled)
+    
+    labels, assigned, margins = [], [], []
+    for row, col in enumerate(assignment):
+        score = float(scores[row, col])
+        others = np.delete(scores[row], col)
+        best_other = float(others.max()) if others.size else -np.inf
+        if not np.isfinite(score):
+            labels.append(None)
+            assigned.append(0.0)
+            margins.append(0.0)
+            continue
+        labels.append(label_space[col])
+        assigned.append(score)
+        margins.append(score - best_other if np.isfinite(best_other) else score)
+    return labels, assigned, margins
 
 
+def _match_with_engine(image: np.ndarray, engine: _MatrixEngine,
+                       size_threshold: float, match_threshold: float,
+                       allowed_labels: Optional[List[str]] = None) -> Tuple[Optional[str], float, int]:
+    """用矩阵引擎匹配单张图像，返回格式同 _match_against_templates"""
+    if image is None or not engine.labels:
+        return None, 0.0, 0
+    return engine.match_batch([_to_gray(image)], size_threshold, match_threshold,
+                              allowed_labels)[0]
+
+
+@lru_cache(maxsize=4096)
 def _calculate_size_similarity(img_size: Tuple[int, int], 
                                tmpl_size: Tuple[int, int]) -> float:
-    """计算图像尺寸相似度"""
+    """计算图像尺寸相似度（按尺寸对缓存）"""
     h_ratio = img_size[0] / tmpl_size[0]
     w_ratio = img_size[1] / tmpl_size[1]
     return 1 - abs(1 - min(h_ratio, w_ratio))
@@ -217,18 +1036,46 @@ def _match_against_templates(image: np.ndarray,
     """
     if image is None or not templates:
         return None, 0.0, 0
+    return _match_against_groups(image, _group_by_shape(templates),
+                                 size_threshold, match_threshold)
+
+
+def _match_against_groups(image: np.ndarray,
+                          groups: ShapeGroups,
+                          size_threshold: float = 0.3,
+                          match_threshold: float = 0.4,
+                          allowed_labels: Optional[List[str]] = None) -> Tuple[Optional[str], float, int]:
+    """
+    在按尺寸分组的模板中找到最佳匹配：每种尺寸只缩放一次查询图像、
+    只计算一次尺寸相似度。
+    allowed_labels: 如果指定，只匹配这些标签的模板
+    返回 (best_label, confidence_percent, match_count)
+    """
+    if image is None or not groups:
+        return None, 0.0, 0
     
-    if len(image.shape) > 2:
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    image = _to_gray(image)
+    
+    # [(原始序号, 标签, 得分, 尺寸得分)]
+    scored = []
+    for shape, members in groups:
+        if allowed_labels is not None:
+            members = [m for m in members if m[2] in allowed_labels]
+            if not members:
+                continue
+        size_score = _calculate_size_similarity(image.shape[:2], shape)
+        if size_score < size_threshold:
+            scored.extend((idx, label, 0.0, size_score) for idx, _, label in members)
+            continue
+        resized = cv2.resize(image, (shape[1], shape[0]))
+        for idx, template, label in members:
+            result = cv2.matchTemplate(resized, template, cv2.TM_CCOEFF_NORMED)
+            scored.append((idx, label, float(np.max(result)) * size_score, size_score))
+    scored.sort(key=lambda item: item[0])
     
     best_label = None
     best_score = 0.0
-    match_count = 0
-    
-    for template, label in templates:
-        match_count += 1
-        score, size_score = _match_single(image, template, size_threshold)
-        
+    for _, label, score, size_score in scored:
         # 动态阈值：尺寸越接近，阈值越宽松
         threshold = match_threshold * (0.8 + 0.2 * size_score)
         
@@ -236,7 +1083,96 @@ def _match_against_templates(image: np.ndarray,
             best_score = score
             best_label = label
     
-    return best_label, best_score * 100, match_count
+    return best_label, best_score * 100, len(scored)
+
+
+# ============================================================
+# 由粗到细级联匹配
+# ============================================================
+
+class CascadeMatcher(_MatrixEngine):
+    """
+    两级级联匹配器：
+    1. 粗筛：全部模板缩放到极低分辨率（默认 16×8），一次矩阵乘法打分
+    2. 精匹配：只对粗筛得分在最高分 margin 以内的候选（至少 min_k 个）计算标准尺寸的矩阵 NCC，
+       得分与 'ncc' 后端相同
+    候选超过 max_k 个（粗筛区分不开）或候选中最佳得分低于 fallback_score（可能都不是正确模板）时，
+    该卡片回退为全部模板。缩放截图上 'ncc' 的最佳模板与粗筛最高分的差距最大约 0.11
+    （整体模板集 set_1920x1080），被剪掉的情况只出现在最佳得分 0.52 以下的弱匹配上
+    match_count 为实际计算的模板数
+    """
+    
+    def __init__(self, templates: List[Tuple[np.ndarray, str]],
+                 coarse_size: Tuple[int, int] = (16, 8),
+                 margin: float = 0.15, min_k: int = 2, max_k: int = 8,
+                 fallback_score: float = 0.6):
+        super().__init__(templates)
+        self.coarse = NCCMatrixEngine(templates, size=coarse_size)
+        self.fine = NCCMatrixEngine(templates, size=self.size)
+        self.margin = margin
+        self.min_k = min_k
+        self.max_k = max_k
+        self.fallback_score = fallback_score
+    
+    def score(self, images: List[np.ndarray]) -> np.ndarray:
+        """粗筛得分矩阵"""
+        return self.coarse.score(images)
+    
+    def match_batch(self, images: List[np.ndarray],
+                    size_threshold: float, match_threshold: float,
+                    allowed_labels: Optional[List[str]] = None) -> List[Tuple[Optional[str], float, int]]:
+        if not images:
+            return []
+        if not self.labels:
+            return [(None, 0.0, 0) for _ in images]
+        keep = np.ones(len(self.labels), dtype=bool)
+        if allowed_labels is not None:
+            keep = np.array([label in allowed_labels for label in self.labels])
+        available = int(keep.sum())
+        if not available:
+            return [(None, 0.0, 0) for _ in images]
+        coarse = np.where(keep, self.score(images), -np.inf)
+        queries = _normalize_rows(_stack_resized(images, self.size))
+        size_scores = self.size_scores(images)
+        
+        # k 由粗筛得分差距决定：与最高分相差不超过 margin 的都保留
+        top = coarse.max(axis=1, keepdims=True)
+        k = np.maximum((coarse >= top - self.margin).sum(axis=1), min(self.min_k, available))
+        width = min(int(k.max()), self.max_k)
+        order = np.argsort(-coarse, axis=1)[:, :width]
+        rows = np.arange(len(images))[:, None]
+        candidate = np.einsum('nkd,nd->nk', self.fine.matrix[order], queries)
+        candidate[np.arange(width)[None, :] >= k[:, None]] = -1.0
+        # 未计算的模板取相似度下限（同 _MatrixEngine.match_batch 的标签过滤）
+        fine = np.full(coarse.shape, -1.0)
+        fine[rows, order] = candidate
+        
+        best = np.max(candidate * size_scores[rows, order], axis=1)
+        fallback = (k > self.max_k) | (best < self.fallback_score)
+        if fallback.any():
+            fine[fallback] = np.where(keep, queries[fallback] @ self.fine.matrix.T, -1.0)
+        counts = np.where(fallback, available, k)
+        
+        best_idx, best_scores = _select_best(fine, size_scores, size_threshold, match_threshold)
+        return [(self.labels[idx], float(score) * 100, int(count)) if idx >= 0 else (None, 0.0, int(count))
+                for idx, score, count in zip(best_idx, best_scores, counts)]
+
+
+# 可选匹配后端: backend 名称 → 矩阵引擎
+# 默认且唯一由流水线/命令行使用的是 'ncc'。'binary' 只在截图与模板集同分辨率时与 NCC 等价，
+# 缩放截图上准确率明显下降（见 BinaryMatrixEngine），仅供显式指定；
+# 'cascade' 精匹配为候选模板上的矩阵 NCC，可能剪掉正确模板的弱匹配回退全部模板（见 CascadeMatcher）
+MATCH_BACKENDS = {
+    'ncc': NCCMatrixEngine,
+    'binary': BinaryMatrixEngine,
+    'cascade': CascadeMatcher,
+}
+
+
+def _check_backend(backend: str) -> str:
+    if backend not in MATCH_BACKENDS:
+        raise ValueError(f"未知的匹配后端: {backend}，可选: {', '.join(MATCH_BACKENDS)}")
+    return backend
 
 
 # ============================================================
@@ -249,23 +1185,45 @@ class BatchCardMatcher:
     - 一次性加载模板（缓存）
     - 颜色约束优化：红牌只匹配 H/D，黑牌只匹配 S/C
     - size_ratio 预计算
+    - backend: 'ncc'（默认）、'binary' 位压缩二值匹配（缩放截图上准确率较低）或 'cascade' 级联匹配
+    - 惰性花色：点数可信且同色只剩一个未用花色时跳过花色提取和匹配
+    - 规范化模板集（set_canonical）：点数/花色图像先经 canonicalize_glyph 规范化
     """
     
     def __init__(self, rank_dir: str, suit_dir: str,
                  rank_size_threshold: float = 0.3,
                  rank_match_threshold: float = 0.4,
                  suit_size_threshold: float = 0.1,
-                 suit_match_threshold: float = 0.5):
+                 suit_match_threshold: float = 0.5,
+                 backend: str = 'ncc',
+                 suit_skip_confidence: float = 60.0,
+                 suit_settle_confidence: float = 85.0):
         self.tm = TemplateCache.get(rank_dir, suit_dir)
         self.rank_size_threshold = rank_size_threshold
         self.rank_match_threshold = rank_match_threshold
         self.suit_size_threshold = suit_size_threshold
         self.suit_match_threshold = suit_match_threshold
+        self.backend = _check_backend(backend)
+        self.suit_skip_confidence = suit_skip_confidence
+        self.suit_settle_confidence = suit_settle_confidence
+        self.canonical = {'rank': is_canonical_set(rank_dir), 'suit': is_canonical_set(suit_dir)}
+    
+    def _prepare(self, image: np.ndarray, kind: str) -> np.ndarray:
+        """匹配前的图像（规范化模板集时为规范画布）"""
+        if self.canonical[kind] and image is not None:
+            return canonicalize_glyph(image, kind)
+        return image
     
     def match_rank(self, image: np.ndarray, color: str) -> Tuple[Optional[str], float, int]:
         """匹配点数"""
-        return _match_against_templates(
-            image, self.tm.rank_templates[color],
+        image = self._prepare(image, 'rank')
+        if self.backend != 'ncc':
+            return _match_with_engine(
+                image, self.tm.get_engine('rank', color, self.backend),
+                self.rank_size_threshold, self.rank_match_threshold
+            )
+        return _match_against_groups(
+            image, self.tm.rank_groups[color],
             self.rank_size_threshold, self.rank_match_threshold
         )
     
@@ -275,29 +1233,82 @@ class BatchCardMatcher:
         匹配花色。
         allowed_suits: 如果指定，只在这些花色中搜索（颜色约束优化）
         """
-        templates = self.tm.suit_templates[color]
-        
-        if allowed_suits is not None:
-            templates = [(img, label) for img, label in templates if label in allowed_suits]
-        
-        return _match_against_templates(
-            image, templates,
-            self.suit_size_threshold, self.suit_match_threshold
+        image = self._prepare(image, 'suit')
+        if self.backend != 'ncc':
+            return _match_with_engine(
+                image, self.tm.get_engine('suit', color, self.backend),
+                self.suit_size_threshold, self.suit_match_threshold,
+                allowed_suits
+            )
+        return _match_against_groups(
+            image, self.tm.suit_groups[color],
+            self.suit_size_threshold, self.suit_match_threshold,
+            allowed_suits
         )
     
-    def match_card(self, rank_image: np.ndarray, suit_image: Optional[np.ndarray],
-                   color: str) -> Dict:
-        """匹配单张卡片（点数 + 花色），利用颜色约束。"""
+    def match_card(self, rank_image: np.ndarray, suit_image, color: str,
+                   used_labels: Optional[set] = None) -> Dict:
+        """匹配单张卡片（点数 + 花色），利用颜色约束。
+        suit_image: 花色图像，或调用时才提取花色图像的无参函数（惰性提取）
+        used_labels: 惰性花色模式下前面卡片已确定的标签（如 '7H'）。点数置信度不低于
+                     suit_skip_confidence、且该点数在本颜色下只剩一个未用花色时直接取该花色，
+                     不提取也不匹配花色，结果中 'suit_skipped' 为 True
+        """
         rank, rank_conf, rank_count = self.match_rank(rank_image, color)
         allowed = COLOR_SUIT_MAP.get(color)
+        if used_labels is not None and rank is not None and rank_conf >= self.suit_skip_confidence:
+            remaining = [s for s in allowed if rank + s not in used_labels]
+            if len(remaining) == 1:
+                return {
+                    'rank': rank, 'rank_confidence': rank_conf, 'rank_count': rank_count,
+                    'suit': remaining[0], 'suit_confidence': 0.0, 'suit_count': 0,
+                    'suit_skipped': True,
+                }
+        if callable(suit_image):
+            suit_image = suit_image()
         suit, suit_conf, suit_count = 0.0, 0.0, 0
         if suit_image is not None:
             suit, suit_conf, suit_count = self.match_suit(suit_image, color, allowed)
         return {
             'rank': rank, 'rank_confidence': rank_conf, 'rank_count': rank_count,
             'suit': suit, 'suit_confidence': suit_conf, 'suit_count': suit_count,
+            'suit_skipped': False,
         }
     
+    def deck_scores(self, rank_images: List[Optional[np.ndarray]],
+                    suit_images: List[Optional[np.ndarray]],
+                    colors: List[str]) -> np.ndarray:
+        """
+        计算 (n_cards, 52) 的整副牌得分矩阵（标签顺序同 DECK_LABELS）：
+        得分 = 点数得分 + 花色得分，颜色不符的标签为 -inf；
+        缺少花色图像或花色模板时花色得分为 0，由整副约束决定花色。
+        """
+        scores = np.full((len(colors), len(DECK_LABELS)), -np.inf)
+        rank_labels = list('A23456789TJQK')
+        for color, suits in COLOR_SUIT_MAP.items():
+            rows = [i for i, c in enumerate(colors) if c == color and rank_images[i] is not None]
+            if not rows:
+                continue
+            rank_part = _label_score_matrix(
+                self.tm.get_engine('rank', color),
+                [_to_gray(self._prepare(rank_images[i], 'rank')) for i in rows],
+                rank_labels, self.rank_size_threshold)
+            
+            suit_part = np.zeros((len(rows), len(suits)))
+            suit_rows = [k for k, i in enumerate(rows) if suit_images[i] is not None]
+            suit_engine = self.tm.get_engine('suit', color)
+            if suit_rows and suit_engine.labels:
+                part = _label_score_matrix(
+                    suit_engine,
+                    [_to_gray(self._prepare(suit_images[rows[k]], 'suit')) for k in suit_rows],
+                    suits, self.suit_size_threshold)
+                suit_part[suit_rows] = np.where(np.isfinite(part), part, 0.0)
+            
+            for s, suit in enumerate(suits):
+                for r, rank in enumerate(rank_labels):
+                    scores[rows, DECK_LABELS.index(rank + suit)] = rank_part[:, r] + suit_part[:, s]
+        return scores
+    
     def match_info_card(self, info_image: np.ndarray, color: str,
                         rank_ratio: float = 0.45) -> Dict:
         """从整体信息图像分割并匹配点数和花色。
@@ -314,25 +1325,18 @@ class BatchCardMatcher:
 # 模板集自动选择
 # ============================================================
 
-def _find_best_template_dir(base_dir: str, preferred: str) -> Optional[str]:
-    """在 base_dir 中找到最佳可用模板集"""
-    preferred_path = os.path.join(base_dir, preferred)
-    if os.path.exists(preferred_path) and os.listdir(preferred_path):
-        return preferred_path
-    
-    # 回退：找任意可用的
-    if os.path.exists(base_dir):
-        for d in sorted(os.listdir(base_dir)):
-            dir_path = os.path.join(base_dir, d)
-            if d.startswith('set_') and os.path.isdir(dir_path) and os.listdir(dir_path):
-                return dir_path
+def _template_dir(base_dir: str, template_set: str) -> Optional[str]:
+    """base_dir 下名为 template_set 的非空模板集目录，不存在时返回 None（不再回退扫描其他 set_*）"""
+    path = os.path.join(base_dir, template_set)
+    if os.path.isdir(path) and os.listdir(path):
+        return path
     return None
 
 
-def resolve_template_dirs(template_set: str = 'auto', 
-                          card_width: int = 0, card_height: int = 0) -> Tuple[Optional[str], Optional[str]]:
+def resolve_template_dirs(template_set: str = 'auto') -> Tuple[Optional[str], Optional[str]]:
     """
-    根据模板集名称或卡片尺寸，解析出 rank_dir 和 suit_dir。
+    根据模板集名称解析出 rank_dir 和 suit_dir。
+    'auto' 为规范化模板集（set_canonical），与截图分辨率无关，不按卡片尺寸选择。
     
     返回 (rank_dir, suit_dir)，任一可能为 None。
     """
@@ -340,21 +1344,150 @@ def resolve_template_dirs(template_set: str = 'auto',
     suit_base = 'Card_Suit_Templates'
     
     if template_set == 'auto':
-        if card_width >= 200 or card_height >= 80:
-            template_set = 'set_2880x1800'
-        else:
-            template_set = 'set_1920x1080'
+        template_set = CANONICAL_SET_NAME
     
-    rank_dir = _find_best_template_dir(rank_base, template_set)
+    rank_dir = _template_dir(rank_base, template_set)
     
     # suit 模板集名称可能与 rank 不同（如 set_1920x1080 → set_1）
-    suit_dir = _find_best_template_dir(suit_base, template_set)
+    suit_dir = _template_dir(suit_base, template_set)
     if suit_dir is None and template_set == 'set_1920x1080':
-        suit_dir = _find_best_template_dir(suit_base, 'set_1')
+        suit_dir = _template_dir(suit_base, 'set_1')
     
     return rank_dir, suit_dir
 
 
+def resolve_info_template_dir(template_set: str = 'auto') -> Optional[str]:
+    """同 resolve_template_dirs，解析整体模板集目录（Card_Info_Templates）"""
+    if template_set == 'auto':
+        template_set = CANONICAL_SET_NAME
+    return _template_dir('Card_Info_Templates', template_set)
+
+
+# ============================================================
+# 探测式模板集选择（'auto'）
+# ============================================================
+
+PROBE_SAMPLE_COUNT = 5      # 探测用的样本卡片数（取最先提取的几张；4 张时 1.25× 截图会选中较弱的模板集）
+PROBE_MIN_SCORE = 0.4       # 可信 top-1：最佳标签得分下限（同默认 match_threshold）
+PROBE_MIN_MARGIN = 0.02     # 可信 top-1：最佳与次佳标签得分间隔下限
+
+
+class TemplateSetSelector:
+    """
+    'auto' 的探测式模板集选择：
+    - 取最先提取的 PROBE_SAMPLE_COUNT 张卡片，对模板库下每个非空 set_* 用矩阵引擎一次打分
+    - 可信 top-1 最多的模板集胜出，数量相同时比较平均间隔。可信 top-1：最佳得分 >= PROBE_MIN_SCORE、
+      与次佳的间隔 >= PROBE_MIN_MARGIN，且不超出一副牌中该标签的张数（同一标签被更多样本选中时
+      只计得分最高的几张）。只看间隔时，缩放截图上错误模板集的间隔并不更小，会选中较弱的模板集
+    - 胜出结果按 (模板库, 卡片尺寸) 记忆：同尺寸的后续截图直接复用，不再探测，
+      向后兼容 API 在给出同一卡片尺寸时对选中的模板集也不再逐张回退其他模板集
+    """
+    _cache: Dict[Tuple[str, Tuple[int, int]], str] = {}
+    # (模板库, 卡片尺寸) -> 选中模板集解析出的目录（含对应的花色模板集）
+    _dirs: Dict[Tuple[str, Tuple[int, int]], set] = {}
+    
+    @classmethod
+    def lookup(cls, template_base: str, card_size: Tuple[int, int]) -> Optional[str]:
+        """已记忆的模板集名称，未探测过返回 None"""
+        return cls._cache.get((template_base, tuple(card_size)))
+    
+    @classmethod
+    def is_selected(cls, template_dir: str, card_size: Optional[Tuple[int, int]]) -> bool:
+        """template_dir 是否为 card_size 探测选中的模板集（或其对应的花色模板集）；card_size 为 None 时为 False"""
+        if card_size is None:
+            return False
+        return any(template_dir in dirs for (_, size), dirs in cls._dirs.items()
+                   if size == tuple(card_size))
+    
+    @classmethod
+    def remember(cls, template_base: str, card_size: Tuple[int, int],
+                 template_dirs: Iterable[Optional[str]]):
+        """记录 (模板库, 卡片尺寸) 选中模板集解析出的目录"""
+        cls._dirs.setdefault((template_base, tuple(card_size)), set()).update(
+            d for d in template_dirs if d)
+    
+    @classmethod
+    def select(cls, template_base: str, card_size: Tuple[int, int],
+               samples: List[Tuple[np.ndarray, str]]) -> Optional[str]:
+        """
+        为 card_size 选择模板集并记忆，返回模板集名称（没有可用模板集或样本时返回 None，不记忆）。
+        samples: [(图像, 颜色)]，点数库为 (点数图像, '_r'/'_b')，整体库为 (信息图像, 任意)；
+        只使用前 PROBE_SAMPLE_COUNT 张
+        """
+        key = (template_base, tuple(card_size))
+        if key in cls._cache:
+            return cls._cache[key]
+        candidates = [d for d in LegacyTemplateCache.set_dirs(template_base) if os.listdir(d)]
+        samples = [(image, color) for image, color in samples[:PROBE_SAMPLE_COUNT] if image is not None]
+        if not candidates or not samples:
+            return None
+        # (可信 top-1 数, 平均间隔) 按字典序比较
+        scores = [probe_score(template_dir, samples) for template_dir in candidates]
+        best = max(range(len(candidates)), key=lambda i: scores[i])
+        cls._cache[key] = os.path.basename(candidates[best])
+        return cls._cache[key]
+    
+    @classmethod
+    def clear(cls):
+        cls._cache.clear()
+        cls._dirs.clear()
+
+
+def probe_score(template_dir: str, samples: List[Tuple[np.ndarray, str]]) -> Tuple[int, float]:
+    """
+    样本在 template_dir 上的 (可信 top-1 数, 平均得分间隔)，间隔 = 最佳标签 - 次佳标签（得分含尺寸相似度）。
+    同一颜色的样本堆叠后一次矩阵乘法打分；没有可比较的标签时该样本间隔记为 0，不计为可信。
+    一副牌中每个整体标签只有 1 张，每个点数在同一颜色下有 2 张（两种花色），超出的 top-1 不计为可信。
+    """
+    kind = CANONICAL_KINDS[os.path.basename(os.path.dirname(os.path.normpath(template_dir)))]
+    canonical = is_canonical_set(template_dir)
+    groups: Dict[str, List[np.ndarray]] = {}
+    for image, color in samples:
+        image = canonicalize_glyph(image, kind) if canonical else _to_gray(image)
+        groups.setdefault(color if kind == 'rank' else '', []).append(image)
+    
+    margins, confident = [], 0
+    for color, images in groups.items():
+        if kind == 'rank':
+            # 与识别时同一个模板管理器（含对应花色模板集），避免重复加载
+            _, suit_dir = resolve_template_dirs(os.path.basename(template_dir))
+            engine = TemplateCache.get(template_dir, suit_dir or '').get_engine('rank', color)
+            label_space = sorted(RANK_CHARS)
+        else:
+            engine = CombinedTemplateCache.get(template_dir).get_engine()
+            label_space = DECK_LABELS
+        scores = _label_score_matrix(engine, images, label_space, 0.0)
+        if scores.shape[1] < 2:
+            margins.extend(0.0 for _ in images)
+            continue
+        top2 = -np.sort(-scores, axis=1)[:, :2]
+        margin = np.where(np.isfinite(top2).all(axis=1), top2[:, 0] - top2[:, 1], 0.0)
+        margins.extend(margin.tolist())
+        per_label = 2 if kind == 'rank' else 1
+        eligible = (top2[:, 0] >= PROBE_MIN_SCORE) & (margin >= PROBE_MIN_MARGIN)
+        labels = np.argmax(scores, axis=1)[eligible]
+        if labels.size:
+            confident += int(np.minimum(np.bincount(labels), per_label).sum())
+    return confident, (float(np.mean(margins)) if margins else 0.0)
+
+
+def select_template_set(mode: str, card_size: Tuple[int, int],
+                        samples: List[Tuple[np.ndarray, str]]) -> str:
+    """
+    按模式探测选择模板集名称（'legacy' 在点数模板库中选择，'combined' 在整体模板库中选择），
+    可直接传给 resolve_template_dirs / resolve_info_template_dir。
+    没有可用模板集时返回 'auto'（即规范化模板集）。
+    """
+    template_base = 'Card_Rank_Templates' if mode == 'legacy' else 'Card_Info_Templates'
+    template_set = TemplateSetSelector.select(template_base, card_size, samples)
+    if mode == 'legacy':
+        dirs = resolve_template_dirs(template_set) if template_set else ()
+    else:
+        dirs = (resolve_info_template_dir(template_set),) if template_set else ()
+    TemplateSetSelector.remember(template_base, card_size, dirs)
+    return template_set or 'auto'
+
+
 # ============================================================
 # 向后兼容 API（原有接口保持不变）
 # ============================================================
@@ -365,11 +1498,13 @@ class TemplateManager:
         self.template_dir = template_dir
         self.templates: Dict[str, List[Tuple[np.ndarray, str]]] = {'_r': [], '_b': []}
         self._load()
+        self.groups: Dict[str, ShapeGroups] = {c: _group_by_shape(t) for c, t in self.templates.items()}
     
     def _load(self):
         if not os.path.exists(self.template_dir):
             return
-        for file in os.listdir(self.template_dir):
+        reader = TemplateDirReader(self.template_dir)
+        for file in reader.files:
             if not file.endswith('.png'):
                 continue
             parts = file.split('_')
@@ -378,7 +1513,7 @@ class TemplateManager:
             rank, color = parts[0], f"_{parts[1]}"
             if rank not in RANK_CHARS:
                 continue
-            img = cv2.imread(os.path.join(self.template_dir, file), cv2.IMREAD_GRAYSCALE)
+            img = reader.read(file)
             if img is not None:
                 self.templates[color].append((img, rank))
 
@@ -389,11 +1524,13 @@ class SuitTemplateManager:
         self.template_dir = template_dir
         self.templates: Dict[str, List[Tuple[np.ndarray, str]]] = {'_r': [], '_b': []}
         self._load()
+        self.groups: Dict[str, ShapeGroups] = {c: _group_by_shape(t) for c, t in self.templates.items()}
     
     def _load(self):
         if not os.path.exists(self.template_dir):
             return
-        for file in os.listdir(self.template_dir):
+        reader = TemplateDirReader(self.template_dir)
+        for file in reader.files:
             if not file.endswith('.png'):
                 continue
             parts = file.split('_')
@@ -402,7 +1539,7 @@ class SuitTemplateManager:
             suit, color = parts[0], f"_{parts[1]}"
             if suit not in SUIT_CHARS:
                 continue
-            img = cv2.imread(os.path.join(self.template_dir, file), cv2.IMREAD_GRAYSCALE)
+            img = reader.read(file)
             if img is not None:
                 self.templates[color].append((img, suit))
 
@@ -413,7 +1550,9 @@ class RankMatcher:
         self.tm = template_manager
     
     def match_rank(self, image: np.ndarray, color: str) -> Tuple[Optional[str], float, int]:
-        return _match_against_templates(image, self.tm.templates[color])
+        if is_canonical_set(self.tm.template_dir):
+            image = canonicalize_glyph(image, 'rank')
+        return _match_against_groups(image, self.tm.groups[color])
 
 
 class SuitMatcher:
@@ -422,12 +1561,54 @@ class SuitMatcher:
         self.tm = template_manager
     
     def match_suit(self, image: np.ndarray, color: str) -> Tuple[Optional[str], float, int]:
-        return _match_against_templates(image, self.tm.templates[color],
-                                        size_threshold=0.1, match_threshold=0.5)
+        if is_canonical_set(self.tm.template_dir):
+            image = canonicalize_glyph(image, 'suit')
+        return _match_against_groups(image, self.tm.groups[color],
+                                     size_threshold=0.1, match_threshold=0.5)
+
+
+class LegacyTemplateCache:
+    """向后兼容 API 的进程级模板注册表：每个点数/花色模板集（含回退集）只加载一次"""
+    _rank: Dict[str, TemplateManager] = {}
+    _suit: Dict[str, SuitTemplateManager] = {}
+    _set_dirs: Dict[str, List[str]] = {}
+    
+    @classmethod
+    def get_rank(cls, template_dir: str) -> TemplateManager:
+        if template_dir not in cls._rank:
+            cls._rank[template_dir] = TemplateManager(template_dir)
+        return cls._rank[template_dir]
+    
+    @classmethod
+    def get_suit(cls, template_dir: str) -> SuitTemplateManager:
+        if template_dir not in cls._suit:
+            cls._suit[template_dir] = SuitTemplateManager(template_dir)
+        return cls._suit[template_dir]
+    
+    @classmethod
+    def set_dirs(cls, template_base: str) -> List[str]:
+        """template_base 下所有 set_* 模板集目录（按名称排序，扫描一次）"""
+        if template_base not in cls._set_dirs:
+            dirs = []
+            if os.path.exists(template_base):
+                for d in sorted(os.listdir(template_base)):
+                    dir_path = os.path.join(template_base, d)
+                    if d.startswith('set_') and os.path.isdir(dir_path):
+                        dirs.append(dir_path)
+            cls._set_dirs[template_base] = dirs
+        return cls._set_dirs[template_base]
+    
+    @classmethod
+    def clear(cls):
+        cls._rank.clear()
+        cls._suit.clear()
+        cls._set_dirs.clear()
 
 
-def match_card_rank(image_path: str, template_dir: str = 'Card_Rank_Templates/set_1') -> Tuple[Optional[str], float, int, int]:
-    """向后兼容：匹配单张卡片点数"""
+def match_card_rank(image_path: str, template_dir: str = 'Card_Rank_Templates/set_1',
+                    card_size: Optional[Tuple[int, int]] = None) -> Tuple[Optional[str], float, int, int]:
+    """向后兼容：匹配单张卡片点数
+    card_size: 卡片尺寸；template_dir 为该尺寸探测选中的模板集时不再回退其他模板集"""
     start_time = time.time()
     try:
         image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
@@ -436,28 +1617,24 @@ def match_card_rank(image_path: str, template_dir: str = 'Card_Rank_Templates/se
         
         color = '_r' if '_r.' in image_path else '_b'
         
-        # 尝试首选模板集
-        tm = TemplateManager(template_dir)
-        matcher = RankMatcher(tm)
+        # 尝试首选模板集（模板集经 LegacyTemplateCache 只加载一次）
+        matcher = RankMatcher(LegacyTemplateCache.get_rank(template_dir))
         result, confidence, match_count = matcher.match_rank(image, color)
         
-        # 回退：尝试其他模板集
-        if result is None:
-            template_base = 'Card_Rank_Templates'
-            if os.path.exists(template_base):
-                for d in sorted(os.listdir(template_base)):
-                    alt_dir = os.path.join(template_base, d)
-                    if d.startswith('set_') and os.path.isdir(alt_dir) and alt_dir != template_dir:
-                        try:
-                            alt_tm = TemplateManager(alt_dir)
-                            alt_matcher = RankMatcher(alt_tm)
-                            alt_result, alt_conf, alt_count = alt_matcher.match_rank(image, color)
-                            match_count += alt_count
-                            if alt_result is not None:
-                                result, confidence = alt_result, alt_conf
-                                break
-                        except:
-                            continue
+        # 回退：尝试其他模板集（探测选中的模板集已比较过全部模板集，不再回退）
+        if result is None and not TemplateSetSelector.is_selected(template_dir, card_size):
+            for alt_dir in LegacyTemplateCache.set_dirs('Card_Rank_Templates'):
+                if alt_dir == template_dir:
+                    continue
+                try:
+                    alt_matcher = RankMatcher(LegacyTemplateCache.get_rank(alt_dir))
+                    alt_result, alt_conf, alt_count = alt_matcher.match_rank(image, color)
+                    match_count += alt_count
+                    if alt_result is not None:
+                        result, confidence = alt_result, alt_conf
+                        break
+                except:
+                    continue
         
         process_time = int((time.time() - start_time) * 1000)
         return result, confidence, match_count, process_time
@@ -466,8 +1643,10 @@ def match_card_rank(image_path: str, template_dir: str = 'Card_Rank_Templates/se
         return None, 0.0, 0, int((time.time() - start_time) * 1000)
 
 
-def match_card_suit(image_path: str, template_dir: str = 'Card_Suit_Templates/set_1') -> Tuple[Optional[str], float, int, int]:
-    """向后兼容：匹配单张卡片花色"""
+def match_card_suit(image_path: str, template_dir: str = 'Card_Suit_Templates/set_1',
+                    card_size: Optional[Tuple[int, int]] = None) -> Tuple[Optional[str], float, int, int]:
+    """向后兼容：匹配单张卡片花色
+    card_size: 卡片尺寸；template_dir 为该尺寸探测选中的模板集时不再回退其他模板集"""
     start_time = time.time()
     try:
         image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
@@ -476,26 +1655,22 @@ def match_card_suit(image_path: str, template_dir: str = 'Card_Suit_Templates/se
         
         color = '_r' if '_r.' in image_path else '_b'
         
-        tm = SuitTemplateManager(template_dir)
-        matcher = SuitMatcher(tm)
+        matcher = SuitMatcher(LegacyTemplateCache.get_suit(template_dir))
         result, confidence, match_count = matcher.match_suit(image, color)
         
-        if result is None:
-            template_base = 'Card_Suit_Templates'
-            if os.path.exists(template_base):
-                for d in sorted(os.listdir(template_base)):
-                    alt_dir = os.path.join(template_base, d)
-                    if d.startswith('set_') and os.path.isdir(alt_dir) and alt_dir != template_dir:
-                        try:
-                            alt_tm = SuitTemplateManager(alt_dir)
-                            alt_matcher = SuitMatcher(alt_tm)
-                            alt_result, alt_conf, alt_count = alt_matcher.match_suit(image, color)
-                            match_count += alt_count
-                            if alt_result is not None:
-                                result, confidence = alt_result, alt_conf
-                                break
-                        except:
-                            continue
+        if result is None and not TemplateSetSelector.is_selected(template_dir, card_size):
+            for alt_dir in LegacyTemplateCache.set_dirs('Card_Suit_Templates'):
+                if alt_dir == template_dir:
+                    continue
+                try:
+                    alt_matcher = SuitMatcher(LegacyTemplateCache.get_suit(alt_dir))
+                    alt_result, alt_conf, alt_count = alt_matcher.match_suit(image, color)
+                    match_count += alt_count
+                    if alt_result is not None:
+                        result, confidence = alt_result, alt_conf
+                        break
+                except:
+                    continue
         
         process_time = int((time.time() - start_time) * 1000)
         return result, confidence, match_count, process_time
@@ -508,9 +1683,127 @@ def match_card_suit(image_path: str, template_dir: str = 'Card_Suit_Templates/se
 # 新 API：批量处理（推荐使用）
 # ============================================================
 
+def _map_cards(func, items: List, workers: Optional[int] = None, executor: str = 'thread',
+               initializer=None, initargs: Tuple = ()) -> List:
+    """
+    按卡片分发任务，结果顺序与 items 一致。
+    workers 为 None 或 <= 1 时在当前线程串行执行；
+    executor: 'thread'（OpenCV 运算释放 GIL）或 'process'（每个进程通过 initializer 预热模板缓存）
+    """
+    if not workers or workers <= 1 or len(items) <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        return [func(item) for item in items]
+    
+    if executor == 'thread':
+        # 线程共享进程内的模板缓存，先在主线程预热一次
+        if initializer is not None:
+            initializer(*initargs)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(func, items))
+    if executor == 'process':
+        chunksize = max(1, len(items) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=initializer,
+                                 initargs=initargs) as pool:
+            return list(pool.map(func, items, chunksize=chunksize))
+    raise ValueError(f"未知的执行器: {executor}，可选: thread, process")
+
+
+def _warm_batch_matcher(rank_template_dir: str, suit_template_dir: str):
+    """工作进程初始化：加载一次点数/花色模板到 TemplateCache"""
+    TemplateCache.get(rank_template_dir, suit_template_dir)
+
+
+def _warm_combined_matcher(template_dir: str):
+    """工作进程初始化：加载一次整体模板到 CombinedTemplateCache"""
+    CombinedTemplateCache.get(template_dir)
+
+
+def _match_info_file(task: Tuple[str, str, str, str]) -> Optional[Dict]:
+    """process_all_cards_v2 的单卡任务：(rank_dir, suit_dir, info_dir, filename)"""
+    rank_template_dir, suit_template_dir, info_dir, filename = task
+    card_start = time.time()
+    color = '_r' if '_r.' in filename else '_b'
+    
+    info_img = cv2.imread(os.path.join(info_dir, filename), cv2.IMREAD_GRAYSCALE)
+    if info_img is None:
+        return None
+    
+    matcher = BatchCardMatcher(rank_template_dir, suit_template_dir)
+    match_result = matcher.match_info_card(info_img, color)
+    
+    number = match_result['rank']
+    suit = match_result['suit']
+    if suit is None:
+        suit = 'H' if color == '_r' else 'S'
+    
+    card_time = int((time.time() - card_start) * 1000)
+    return {
+        'number': number, 'suit': suit, 'color': color, 'filename': filename,
+        'rank_confidence': match_result['rank_confidence'],
+        'suit_confidence': match_result['suit_confidence'],
+        'time_ms': card_time,
+    }
+
+
+def _match_rank_suit_files(task: Tuple[str, str, str, str, str]) -> Tuple[Dict, np.ndarray, Optional[np.ndarray]]:
+    """process_all_cards_v2_legacy 的单卡任务：(rank_dir, suit_dir, rank_img_dir, suit_img_dir, filename)
+    返回 (result, rank_img, suit_img)，图像供整副牌指派使用"""
+    rank_template_dir, suit_template_dir, rank_dir, suit_dir, filename = task
+    card_start = time.time()
+    suit_path = os.path.join(suit_dir, filename)
+    color = '_r' if '_r.' in filename else '_b'
+    
+    rank_img = cv2.imread(os.path.join(rank_dir, filename), cv2.IMREAD_GRAYSCALE)
+    suit_img = None
+    if os.path.exists(suit_path):
+        suit_img = cv2.imread(suit_path, cv2.IMREAD_GRAYSCALE)
+    
+    matcher = BatchCardMatcher(rank_template_dir, suit_template_dir)
+    return _match_rank_suit(matcher, filename, color, rank_img, suit_img, card_start), rank_img, suit_img
+
+
+def _match_rank_suit(matcher: 'BatchCardMatcher', filename: str, color: str,
+                     rank_img: np.ndarray, suit_img: Optional[np.ndarray],
+                     card_start: float, used_labels: Optional[set] = None) -> Dict:
+    """匹配一张卡片的点数+花色图像，生成批量接口的结果字典
+    used_labels: 惰性花色模式的已用标签（见 BatchCardMatcher.match_card），跳过花色时结果含 'suit_skipped'"""
+    match_result = matcher.match_card(rank_img, suit_img, color, used_labels)
+    
+    number = match_result['rank']
+    suit = match_result['suit']
+    if suit is None:
+        suit = 'H' if color == '_r' else 'S'
+    
+    card_time = int((time.time() - card_start) * 1000)
+    result = {
+        'number': number, 'suit': suit, 'color': color, 'filename': filename,
+        'rank_confidence': match_result['rank_confidence'],
+        'suit_confidence': match_result['suit_confidence'],
+        'time_ms': card_time,
+    }
+    if match_result['suit_skipped']:
+        result['suit_skipped'] = True
+    return result
+
+
+def _prepare_card_file(card_path: str) -> Optional[Tuple[np.ndarray, float]]:
+    """process_all_cards_combined 的单卡读图任务，返回 (左上角 25% 宽度的信息区域, 耗时秒)
+    二值化在读完整副牌后由 binarize_batch 一次完成"""
+    card_start = time.time()
+    card_img = cv2.imread(card_path)
+    if card_img is None:
+        return None
+    info_region = card_img[:, :int(card_img.shape[1] * 0.25)]
+    return info_region, time.time() - card_start
+
+
 def process_all_cards_v2(rank_template_dir: str,
-                         suit_template_dir: str) -> Tuple[List[Dict], int]:
+                         suit_template_dir: str,
+                         workers: Optional[int] = None,
+                         executor: str = 'thread') -> Tuple[List[Dict], int]:
     """批量处理所有卡片（使用统一模板管理器）。
+    workers: 并行工作数（None/1 为串行）；executor: 'thread' 或 'process'
     返回: (results, total_time_ms)
     """
     start_time = time.time()
@@ -520,41 +1813,24 @@ def process_all_cards_v2(rank_template_dir: str,
         print(f"{info_dir}目录不存在")
         return [], 0
     
-    matcher = BatchCardMatcher(rank_template_dir, suit_template_dir)
-    
     image_files = sorted([f for f in os.listdir(info_dir) if f.endswith('.png')])
-    results = []
-    
-    for filename in image_files:
-        card_start = time.time()
-        info_path = os.path.join(info_dir, filename)
-        color = '_r' if '_r.' in filename else '_b'
-        
-        info_img = cv2.imread(info_path, cv2.IMREAD_GRAYSCALE)
-        if info_img is None:
-            continue
-        
-        match_result = matcher.match_info_card(info_img, color)
-        
-        number = match_result['rank']
-        suit = match_result['suit']
-        if suit is None:
-            suit = 'H' if color == '_r' else 'S'
-        
-        card_time = int((time.time() - card_start) * 1000)
-        results.append({
-            'number': number, 'suit': suit, 'color': color, 'filename': filename,
-            'rank_confidence': match_result['rank_confidence'],
-            'suit_confidence': match_result['suit_confidence'],
-            'time_ms': card_time,
-        })
+    tasks = [(rank_template_dir, suit_template_dir, info_dir, f) for f in image_files]
+    results = _map_cards(_match_info_file, tasks, workers, executor,
+                         _warm_batch_matcher, (rank_template_dir, suit_template_dir))
+    results = [r for r in results if r is not None]
     
     return results, int((time.time() - start_time) * 1000)
 
 
 def process_all_cards_v2_legacy(rank_template_dir: str,
-                                suit_template_dir: str) -> Tuple[List[Dict], int]:
+                                suit_template_dir: str,
+                                deck_constraint: bool = False,
+                                workers: Optional[int] = None,
+                                executor: str = 'thread') -> Tuple[List[Dict], int]:
     """批量处理所有卡片（从 Card_Rank_Images 和 Card_Suit_Images）。
+    deck_constraint: 逐张匹配后在整副牌上做一对一指派，消除重复牌，
+                     结果额外包含 'margin'
+    workers: 并行工作数（None/1 为串行）；executor: 'thread' 或 'process'
     返回: (results, total_time_ms)
     """
     start_time = time.time()
@@ -565,42 +1841,44 @@ def process_all_cards_v2_legacy(rank_template_dir: str,
         print(f"{rank_dir}目录不存在")
         return [], 0
     
-    matcher = BatchCardMatcher(rank_template_dir, suit_template_dir)
-    
     image_files = sorted([f for f in os.listdir(rank_dir) if f.endswith('.png')])
-    results = []
+    tasks = [(rank_template_dir, suit_template_dir, rank_dir, suit_dir, f) for f in image_files]
+    outputs = _map_cards(_match_rank_suit_files, tasks, workers, executor,
+                         _warm_batch_matcher, (rank_template_dir, suit_template_dir))
+    results = [result for result, _, _ in outputs]
     
-    for filename in image_files:
-        card_start = time.time()
-        rank_path = os.path.join(rank_dir, filename)
-        suit_path = os.path.join(suit_dir, filename)
-        color = '_r' if '_r.' in filename else '_b'
-        
-        rank_img = cv2.imread(rank_path, cv2.IMREAD_GRAYSCALE)
-        suit_img = None
-        if os.path.exists(suit_path):
-            suit_img = cv2.imread(suit_path, cv2.IMREAD_GRAYSCALE)
-        
-        match_result = matcher.match_card(rank_img, suit_img, color)
-        
-        number = match_result['rank']
-        suit = match_result['suit']
-        if suit is None:
-            suit = 'H' if color == '_r' else 'S'
-        
-        card_time = int((time.time() - card_start) * 1000)
-        results.append({
-            'number': number, 'suit': suit, 'color': color, 'filename': filename,
-            'rank_confidence': match_result['rank_confidence'],
-            'suit_confidence': match_result['suit_confidence'],
-            'time_ms': card_time,
-        })
+    if deck_constraint and results:
+        matcher = BatchCardMatcher(rank_template_dir, suit_template_dir)
+        _apply_deck_assignment(
+            results, matcher.deck_scores([o[1] for o in outputs], [o[2] for o in outputs],
+                                         [r['color'] for r in results]))
     
     return results, int((time.time() - start_time) * 1000)
 
 
-def process_all_cards_combined(template_dir: str) -> Tuple[List[Dict], int]:
+def _apply_deck_assignment(results: List[Dict], scores: np.ndarray) -> None:
+    """按整副牌指派结果改写 results 中的 number/suit，并写入 margin；
+    指派耗时均摊到每张卡片的 time_ms"""
+    assign_start = time.time()
+    labels, _, margins = solve_deck_assignment(scores, DECK_LABELS)
+    share = int((time.time() - assign_start) * 1000 / len(results))
+    for result, label, margin in zip(results, labels, margins):
+        if label is not None:
+            result['number'], result['suit'] = label[0], label[1]
+        result['margin'] = margin * 100
+        result['time_ms'] += share
+
+
+def process_all_cards_combined(template_dir: str,
+                               deck_constraint: bool = False,
+                               workers: Optional[int] = None,
+                               executor: str = 'thread',
+                               glyph_cache: Optional[GlyphCache] = None) -> Tuple[List[Dict], int]:
     """批量处理所有卡片（使用整体模板）。
+    deck_constraint: 使用整副牌一对一指派代替逐张取最优，结果额外包含 'margin'
+    workers: 读图的并行工作数（None/1 为串行）；executor: 'thread' 或 'process'
+             二值化和匹配阶段始终是整副牌一次运算
+    glyph_cache: 字形缓存（跨批次复用时传入同一实例）
     返回: (results, total_time_ms)
     """
     start_time = time.time()
@@ -610,47 +1888,156 @@ def process_all_cards_combined(template_dir: str) -> Tuple[List[Dict], int]:
         print(f"{cards_dir}目录不存在")
         return [], 0
     
-    matcher = CombinedCardMatcher(template_dir)
+    matcher = CombinedCardMatcher(template_dir, glyph_cache=glyph_cache)
     
     image_files = sorted([f for f in os.listdir(cards_dir) if f.endswith('.png')])
-    results = []
-    
-    for filename in image_files:
-        card_start = time.time()
-        card_path = os.path.join(cards_dir, filename)
-        
-        card_img = cv2.imread(card_path)
-        if card_img is None:
+    prepared = _map_cards(_prepare_card_file,
+                          [os.path.join(cards_dir, f) for f in image_files],
+                          workers, executor)
+    filenames, info_images, prep_times = [], [], []
+    for filename, item in zip(image_files, prepared):
+        if item is None:
             continue
-        
-        h, w = card_img.shape[:2]
-        crop_w = int(w * 0.25)
-        info_region = card_img[0:h, 0:crop_w]
-        gray = cv2.cvtColor(info_region, cv2.COLOR_BGR2GRAY)
-        _, binary = cv2.threshold(gray, 128, 255, cv2.THRESH_BINARY_INV)
-        kernel = np.ones((2, 2), np.uint8)
-        binary = cv2.dilate(binary, kernel, iterations=1)
-        binary = cv2.erode(binary, kernel, iterations=1)
-        info_img = cv2.bitwise_not(binary)
-        info_img[info_img < 128] = 0
-        info_img[info_img >= 128] = 255
-        
-        match_result = matcher.match_card(info_img)
-        
-        number = match_result['rank'] or '?'
-        suit = match_result['suit'] or '?'
-        
-        card_time = int((time.time() - card_start) * 1000)
-        results.append({
-            'number': number, 'suit': suit, 'color': '', 'filename': filename,
-            'rank_confidence': match_result['confidence'],
-            'suit_confidence': match_result['confidence'],
-            'time_ms': card_time,
-        })
+        filenames.append(filename)
+        info_images.append(item[0])
+        prep_times.append(item[1])
     
+    binarize_start = time.time()
+    info_images = binarize_batch(info_images)
+    binarize_share = (time.time() - binarize_start) / max(1, len(info_images))
+    prep_times = [t + binarize_share for t in prep_times]
+    
+    results = _match_combined(matcher, filenames, info_images, prep_times, deck_constraint)
     return results, int((time.time() - start_time) * 1000)
 
 
+def _match_combined(matcher: CombinedCardMatcher, filenames: List[str],
+                    info_images: List[np.ndarray], prep_times: List[float],
+                    deck_constraint: bool) -> List[Dict]:
+    """整副牌一次矩阵匹配并生成批量接口的结果字典，匹配耗时按卡片均摊"""
+    match_start = time.time()
+    colors = [_name_color(filename) for filename in filenames]
+    if deck_constraint:
+        match_results = matcher.match_deck(info_images, colors)
+    else:
+        match_results = matcher.match_cards(info_images, colors)
+    match_share = (time.time() - match_start) / max(1, len(match_results))
+    
+    return [_combined_result(filename, match_result, prep_time + match_share)
+            for filename, match_result, prep_time in zip(filenames, match_results, prep_times)]
+
+
+def _combined_result(filename: str, match_result: Dict, seconds: float) -> Dict:
+    """整体模板匹配结果 → 批量接口的结果字典"""
+    result = {
+        'number': match_result['rank'] or '?',
+        'suit': match_result['suit'] or '?',
+        'color': '', 'filename': filename,
+        'rank_confidence': match_result['confidence'],
+        'suit_confidence': match_result['confidence'],
+        'time_ms': int(seconds * 1000),
+    }
+    if 'margin' in match_result:
+        result['margin'] = match_result['margin']
+    return result
+
+
+# ============================================================
+# 内存接口：直接匹配图像数组（无中间目录）
+# ============================================================
+
+def match_rank_suit_images(cards: List[Tuple[str, str, np.ndarray, Optional[np.ndarray]]],
+                           rank_template_dir: str, suit_template_dir: str,
+                           deck_constraint: bool = False,
+                           lazy_suit: bool = False) -> List[Dict]:
+    """内存版 process_all_cards_v2_legacy。
+    cards: [(filename, color, rank_img, suit_img), ...]，filename 形如 '11_r.png'
+    lazy_suit: 惰性花色模式（见 iter_match_rank_suit_images）
+    返回格式同 process_all_cards_v2_legacy 的 results
+    """
+    return list(iter_match_rank_suit_images(cards, rank_template_dir, suit_template_dir,
+                                            deck_constraint, lazy_suit))
+
+
+def iter_match_rank_suit_images(cards: Iterable[Tuple[str, str, np.ndarray, Optional[np.ndarray]]],
+                                rank_template_dir: str, suit_template_dir: str,
+                                deck_constraint: bool = False,
+                                lazy_suit: bool = False) -> Iterator[Dict]:
+    """流式版 match_rank_suit_images：每匹配完一张卡片立即产出结果字典。
+    suit_img 可以是调用时才提取花色的无参函数（extract_legacy_from_card(lazy_suit=True)）
+    deck_constraint: 全部卡片产出后做整副牌一对一指派，就地改写已产出的结果字典
+    lazy_suit: 按前面卡片已确定的标签跳过不需要的花色提取和匹配，被跳过的结果含 'suit_skipped'；
+               花色置信度达到 suit_settle_confidence（或由已确定标签推出）的标签才算确定，
+               避免一张花色匹配不可靠的卡片连带推错同点数的另一张；
+               整副牌指派时被跳过卡片的花色得分为 0，由一对一约束决定
+    """
+    matcher = BatchCardMatcher(rank_template_dir, suit_template_dir)
+    used_labels = set() if lazy_suit else None
+    results, rank_images, suit_images = [], [], []
+    for filename, color, rank_img, suit_img in cards:
+        card_start = time.time()
+        rank_img = _to_gray(rank_img)
+        if callable(suit_img):
+            suit_img = lru_cache(maxsize=None)(suit_img)
+        elif suit_img is not None:
+            suit_img = _to_gray(suit_img)
+        result = _match_rank_suit(matcher, filename, color, rank_img, suit_img, card_start,
+                                  used_labels)
+        if callable(suit_img):
+            suit_img = None if result.get('suit_skipped') else suit_img()
+            suit_img = None if suit_img is None else _to_gray(suit_img)
+        if used_labels is not None and result['number'] is not None and (
+                result.get('suit_skipped') or result['suit_confidence'] >= matcher.suit_settle_confidence):
+            used_labels.add(result['number'] + result['suit'])
+        results.append(result)
+        rank_images.append(rank_img)
+        suit_images.append(suit_img)
+        yield result
+    if deck_constraint and results:
+        _apply_deck_assignment(
+            results, matcher.deck_scores(rank_images, suit_images, [r['color'] for r in results]))
+
+
+def match_info_images(cards: List[Tuple[str, np.ndarray]], template_dir: str,
+                      deck_constraint: bool = False,
+                      glyph_cache: Optional[GlyphCache] = None) -> List[Dict]:
+    """内存版 process_all_cards_combined。
+    cards: [(filename, info_img), ...]，info_img 为白底黑字二值图
+    返回格式同 process_all_cards_combined 的 results
+    """
+    matcher = CombinedCardMatcher(template_dir, glyph_cache=glyph_cache)
+    return _match_combined(matcher, [c[0] for c in cards], [c[1] for c in cards],
+                           [0.0] * len(cards), deck_constraint)
+
+
+def iter_match_info_images(cards: Iterable[Tuple[str, np.ndarray]], template_dir: str,
+                           deck_constraint: bool = False,
+                           glyph_cache: Optional[GlyphCache] = None) -> Iterator[Dict]:
+    """流式版 match_info_images：逐张匹配并立即产出结果字典。
+    deck_constraint: 全部卡片产出后做整副牌一对一指派，就地改写已产出的结果字典
+    """
+    matcher = CombinedCardMatcher(template_dir, glyph_cache=glyph_cache)
+    results, info_images, colors = [], [], []
+    for filename, info_img in cards:
+        card_start = time.time()
+        # 单张也走矩阵引擎（1 × 全部模板），比逐模板 matchTemplate 快
+        color = _name_color(filename)
+        match_result = matcher.match_cards([info_img], [color])[0]
+        result = _combined_result(filename, match_result, time.time() - card_start)
+        results.append(result)
+        info_images.append(info_img)
+        colors.append(color)
+        yield result
+    if deck_constraint and results:
+        assign_start = time.time()
+        deck_results = matcher.match_deck(info_images, colors)
+        share = (time.time() - assign_start) / len(results)
+        for result, match_result in zip(results, deck_results):
+            time_ms = result['time_ms']
+            result.update(_combined_result(result['filename'], match_result, share))
+            result['time_ms'] += time_ms
+
+
 def process_all_cards(rank_template_dir: str = 'Card_Rank_Templates/set_1920x1080',
                       suit_template_dir: str = 'Card_Suit_Templates/set_1'):
     """向后兼容：处理所有卡片"""
@@ -768,6 +2155,7 @@ def validate_cards(columns):
 
 
 def results_to_columns(results):
+    """按文件名（列号 + 行号，行号可能两位）把结果排成 8 列，每列至少 7 行"""
     columns = [["  " for _ in range(7)] for _ in range(8)]
     
     for result in sorted(results, key=lambda x: x['filename']):
@@ -782,14 +2170,45 @@ def results_to_columns(results):
             number = result['number']
             suit = result.get('suit', 'H')
             
-            if 0 <= col < 8 and 0 <= row < 7:
+            if 0 <= col < 8 and 0 <= row < MAX_COLUMN_CARDS:
+                if row >= len(columns[col]):
+                    columns[col].extend("  " for _ in range(row + 1 - len(columns[col])))
                 columns[col][row] = f"{number}{suit}"
     
     return columns
 
 
-def format_columns_to_text(columns, include_validation=True):
-    """将列布局格式化为文本"""
+# 整副牌指派总能给出 52 张不重复的标签，完整性验证因此总能通过；
+# 指派得分低于匹配阈值或明显放弃单卡最优（margin 很负）的卡片视为不可信
+DECK_MIN_CONFIDENCE = 40.0
+DECK_MIN_MARGIN = -15.0
+
+
+def deck_confidence_errors(results: List[Dict],
+                           min_confidence: float = DECK_MIN_CONFIDENCE,
+                           min_margin: float = DECK_MIN_MARGIN) -> List[str]:
+    """
+    整副牌指派结果（带 'margin'）的低置信度检查，返回错误信息（无问题时为空列表）。
+    置信度取 rank_confidence（整体匹配时即指派得分）。
+    """
+    low = []
+    for result in results:
+        if 'margin' not in result:
+            continue
+        confidence = float(result.get('rank_confidence', 0.0))
+        margin = float(result['margin'])
+        if confidence < min_confidence or margin < min_margin:
+            card = result['filename'].split('_')[0].split('.')[0]
+            low.append(f"{card}={result['number']}{result['suit']}({confidence:.0f}%,{margin:+.1f})")
+    if not low:
+        return []
+    shown = ', '.join(low[:8]) + (' 等' if len(low) > 8 else '')
+    return [f"低置信度指派 {len(low)} 张: {shown}"]
+
+
+def format_columns_to_text(columns, include_validation=True, extra_errors=None):
+    """将列布局格式化为文本
+    extra_errors: 附加的错误信息（如 deck_confidence_errors），有则验证不通过"""
     layout_lines = []
     layout_lines.append("# MS Freecell Game Layout")
     layout_lines.append("#")
@@ -800,6 +2219,9 @@ def format_columns_to_text(columns, include_validation=True):
         layout_lines.append(line)
     
     is_valid, errors = validate_cards(columns)
+    if extra_errors:
+        errors = errors + list(extra_errors)
+        is_valid = False
     
     if include_validation:
         layout_lines.append("")
@@ -0,0 +1,328 @@
+"""
+FreeCell识别服务（常驻进程）
+
+启动一次即可常驻：cv2/NumPy 只导入一次，全部模板集预加载并常驻内存，
+结果缓存和字形缓存跨请求复用，GUI / 命令行作为瘦客户端把截图交给服务识别。
+
+用法:
+    python recognition_server.py                      # http://127.0.0.1:8765
+    python recognition_server.py --unix /tmp/freecell.sock -j 4
+
+接口:
+    POST /recognize?mode=legacy&template_set=auto&deck=1
+        请求体为 PNG/JPEG 文件字节，或原始 BGR 像素（请求头 X-Image-Shape: 高,宽,3）
+        返回 card_pipeline.outcome_to_record() 格式的 JSON
+    GET  /health
+        返回服务状态、已加载模板集和缓存命中计数
+
+客户端: RecognitionClient('http://127.0.0.1:8765') 或 RecognitionClient('unix:/tmp/freecell.sock')；
+环境变量 FREECELL_SERVER 指定地址时 GUI 和 freecell_match.py --server 自动使用服务。
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import socketserver
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import cv2
+import numpy as np
+
+import card_pipeline
+import match_numbers
+from result_cache import ResultCache
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+SERVER_ENV = 'FREECELL_SERVER'
+
+
+def preload_template_sets() -> List[str]:
+    """预加载全部点数/花色/整体模板集到进程级缓存，返回已加载的目录"""
+    loaded = []
+    rank_base = 'Card_Rank_Templates'
+    if os.path.isdir(rank_base):
+        for d in sorted(os.listdir(rank_base)):
+            rank_dir, suit_dir = match_numbers.resolve_template_dirs(d)
+            if rank_dir is not None:
+                match_numbers.TemplateCache.get(rank_dir, suit_dir or '')
+                loaded.append(rank_dir)
+                if suit_dir:
+                    loaded.append(suit_dir)
+    info_base = 'Card_Info_Templates'
+    if os.path.isdir(info_base):
+        for d in sorted(os.listdir(info_base)):
+            info_dir = os.path.join(info_base, d)
+            if d.startswith('set_') and os.path.isdir(info_dir):
+                match_numbers.CombinedTemplateCache.get(info_dir)
+                loaded.append(info_dir)
+    return sorted(set(loaded))
+
+
+def decode_request_image(body: bytes, shape_header: Optional[str]) -> np.ndarray:
+    """请求体 → BGR 图像：带 X-Image-Shape 时按原始像素解释（零解码），否则按图像文件解码"""
+    if shape_header:
+        shape = tuple(int(v) for v in shape_header.split(','))
+        if len(shape) != 3 or shape[2] != 3 or len(body) != shape[0] * shape[1] * 3:
+            raise ValueError(f"像素数据与形状不符: {shape_header}")
+        return np.frombuffer(body, dtype=np.uint8).reshape(shape)
+    image = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("无法解码图像")
+    return image
+
+
+# ============================================================
+# 服务端
+# ============================================================
+
+class RecognitionService:
+    """识别服务：工作线程池 + 常驻模板集 / 结果缓存 / 字形缓存"""
+    
+    def __init__(self, workers: int = 4, cache_dir: Optional[str] = '.result_cache',
+                 glyph_cache: bool = True, glyph_cache_path: Optional[str] = None):
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.workers = workers
+        self.cache = ResultCache(cache_dir) if cache_dir else None
+        # 指定 glyph_cache_path 时启动时加载（文件存在时），close() 时保存
+        self.glyph_cache = match_numbers.GlyphCache(glyph_cache_path) if glyph_cache else None
+        self.template_dirs = preload_template_sets()
+        self.requests = 0
+    
+    def _recognize(self, image: np.ndarray, params: Dict) -> Dict:
+        start_time = time.time()
+        outcome = card_pipeline.recognize(image, cache=self.cache,
+                                          glyph_cache=self.glyph_cache, **params)
+        record = card_pipeline.outcome_to_record(outcome)
+        record['timings']['server'] = int((time.time() - start_time) * 1000)
+        return record
+    
+    def recognize(self, image: np.ndarray, params: Dict) -> Dict:
+        """在线程池中识别一张截图（阻塞直到完成）"""
+        self.requests += 1
+        return self.pool.submit(self._recognize, image, params).result()
+    
+    def close(self):
+        """停止线程池，保存字形缓存（指定了路径时）"""
+        self.pool.shutdown()
+        if self.glyph_cache is not None and self.glyph_cache.path:
+            self.glyph_cache.save()
+    
+    def health(self) -> Dict:
+        status = {
+            'status': 'ok',
+            'pid': os.getpid(),
+            'workers': self.workers,
+            'requests': self.requests,
+            'template_dirs': self.template_dirs,
+        }
+        if self.cache is not None:
+            status['result_cache'] = {'hits': self.cache.hits, 'misses': self.cache.misses}
+        if self.glyph_cache is not None:
+            status['glyph_cache'] = self.glyph_cache.stats()
+        return status
+
+
+def _parse_params(query: str) -> Dict:
+    qs = parse_qs(query)
+    params = {
+        'mode': qs.get('mode', ['legacy'])[0],
+        'template_set': qs.get('template_set', ['auto'])[0],
+        'deck_constraint': None,
+    }
+    if 'deck' in qs:
+        params['deck_constraint'] = qs['deck'][0] not in ('0', 'false', 'no')
+    if params['mode'] not in card_pipeline.RECOGNIZE_MODES:
+        raise ValueError(f"未知的识别模式: {params['mode']}")
+    return params
+
+
+class RecognitionHandler(BaseHTTPRequestHandler):
+    service: RecognitionService = None  # 由 serve() 设置
+    protocol_version = 'HTTP/1.1'
+    
+    def _send_json(self, status: int, data: Dict):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        if urlparse(self.path).path == '/health':
+            self._send_json(200, self.service.health())
+        else:
+            self._send_json(404, {'error': f"未知路径: {self.path}"})
+    
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if url.path != '/recognize':
+            self._send_json(404, {'error': f"未知路径: {self.path}"})
+            return
+        try:
+            params = _parse_params(url.query)
+            image = decode_request_image(body, self.headers.get('X-Image-Shape'))
+            record = self.service.recognize(image, params)
+        except Exception as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        self._send_json(200, record)
+    
+    def address_string(self):
+        # Unix 套接字没有客户端地址
+        return self.client_address[0] if self.client_address else 'unix'
+    
+    def log_message(self, format, *args):
+        print(f"[{self.log_date_time_string()}] {format % args}", file=sys.stderr)
+
+
+if hasattr(socket, 'AF_UNIX'):
+    class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+        
+        def server_bind(self):
+            socketserver.UnixStreamServer.server_bind(self)
+            self.server_name, self.server_port = 'localhost', 0
+
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, unix_path: Optional[str] = None,
+          workers: int = 4, cache_dir: Optional[str] = '.result_cache', glyph_cache: bool = True,
+          glyph_cache_path: Optional[str] = None):
+    """启动识别服务（阻塞）"""
+    RecognitionHandler.service = RecognitionService(workers, cache_dir, glyph_cache, glyph_cache_path)
+    if unix_path:
+        if not hasattr(socket, 'AF_UNIX'):
+            raise ValueError("当前系统不支持 Unix 套接字")
+        if os.path.exists(unix_path):
+            os.remove(unix_path)
+        server = ThreadingUnixHTTPServer(unix_path, RecognitionHandler)
+        address = f"unix:{unix_path}"
+    else:
+        server = ThreadingHTTPServer((host, port), RecognitionHandler)
+        address = f"http://{host}:{port}"
+    print(f"识别服务已启动: {address}（{workers} 个工作线程，"
+          f"已加载 {len(RecognitionHandler.service.template_dirs)} 个模板集）", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        RecognitionHandler.service.close()
+        if unix_path and os.path.exists(unix_path):
+            os.remove(unix_path)
+
+
+# ============================================================
+# 客户端
+# ============================================================
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__('localhost', timeout=timeout)
+        self.unix_path = path
+    
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+class RecognitionClient:
+    """识别服务的瘦客户端。address: 'http://主机:端口' 或 'unix:/套接字路径'"""
+    
+    def __init__(self, address: str = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}",
+                 timeout: float = 30.0):
+        self.address = address
+        self.timeout = timeout
+    
+    @classmethod
+    def from_env(cls) -> Optional['RecognitionClient']:
+        """环境变量 FREECELL_SERVER 指定服务地址时返回客户端，否则返回 None"""
+        address = os.environ.get(SERVER_ENV)
+        return cls(address) if address else None
+    
+    def _connection(self, timeout: float) -> http.client.HTTPConnection:
+        if self.address.startswith('unix:'):
+            return _UnixHTTPConnection(self.address[len('unix:'):], timeout)
+        url = urlparse(self.address)
+        return http.client.HTTPConnection(url.hostname, url.port or DEFAULT_PORT, timeout=timeout)
+    
+    def _request(self, method: str, path: str, body: Optional[bytes] = None,
+                 headers: Optional[Dict] = None, timeout: Optional[float] = None) -> Dict:
+        conn = self._connection(self.timeout if timeout is None else timeout)
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            return json.loads(conn.getresponse().read().decode('utf-8'))
+        finally:
+            conn.close()
+    
+    def available(self) -> bool:
+        """服务是否可用（短超时健康检查）"""
+        try:
+            return self._request('GET', '/health', timeout=0.5).get('status') == 'ok'
+        except (OSError, ValueError, http.client.HTTPException):
+            return False
+    
+    def close(self):
+        """停止线程池，保存字形缓存（指定了路径时）"""
+        self.pool.shutdown()
+        if self.glyph_cache is not None and self.glyph_cache.path:
+            self.glyph_cache.save()
+    
+    def health(self) -> Dict:
+        return self._request('GET', '/health')
+    
+    def _recognize(self, body: bytes, headers: Dict, template_set: str, mode: str,
+                   deck_constraint: Optional[bool]) -> Dict:
+        query = {'mode': mode, 'template_set': template_set}
+        if deck_constraint is not None:
+            query['deck'] = int(deck_constraint)
+        return self._request('POST', f"/recognize?{urlencode(query)}", body, headers)
+    
+    def recognize_image(self, image: np.ndarray, template_set: str = 'auto', mode: str = 'legacy',
+                        deck_constraint: Optional[bool] = None) -> Dict:
+        """发送原始 BGR 像素（免编码/解码），返回识别记录；失败时记录含 'error'"""
+        image = np.ascontiguousarray(image)
+        headers = {'Content-Type': 'application/octet-stream',
+                   'X-Image-Shape': ','.join(str(v) for v in image.shape)}
+        return self._recognize(image.tobytes(), headers, template_set, mode, deck_constraint)
+    
+    def recognize_file(self, path: str, template_set: str = 'auto', mode: str = 'legacy',
+                       deck_constraint: Optional[bool] = None) -> Dict:
+        """发送图像文件字节（服务端解码），返回识别记录；失败时记录含 'error'"""
+        with open(path, 'rb') as f:
+            body = f.read()
+        return self._recognize(body, {'Content-Type': 'application/octet-stream'},
+                               template_set, mode, deck_constraint)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="FreeCell识别服务（常驻进程，HTTP / Unix 套接字）")
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f"监听地址（默认 {DEFAULT_HOST}）")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"监听端口（默认 {DEFAULT_PORT}）")
+    parser.add_argument('--unix', metavar='PATH', default=None, help="改为监听 Unix 套接字")
+    parser.add_argument('-j', '--workers', type=int, default=4, help="工作线程数（默认 4）")
+    parser.add_argument('--cache', metavar='DIR', default='.result_cache',
+                        help="结果缓存目录（默认 .result_cache，空字符串为关闭）")
+    parser.add_argument('--no-glyph-cache', action='store_true', help="关闭字形缓存")
+    parser.add_argument('--glyph-cache-file', metavar='PATH', default=None,
+                        help="字形缓存文件（启动时加载，退出时保存；默认只保存在内存中）")
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, args.unix, args.workers, args.cache or None,
+          not args.no_glyph_cache, args.glyph_cache_file)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+识别结果缓存模块
+
+同一张截图重复识别时直接返回上次的结果：
+- 缓存键 = 解码后像素缓冲区的哈希 + 识别参数 + 模板集指纹
+- 模板集指纹由模板 PNG 的路径、大小、修改时间计算，模板变化后旧结果自动失效
+- 每条结果存为 cache_dir 下一个 JSON 文件，命中时刷新修改时间，
+  超过 max_entries 时按修改时间淘汰最久未使用的条目（LRU）
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+TEMPLATE_ROOTS = ('Card_Rank_Templates', 'Card_Suit_Templates', 'Card_Info_Templates')
+
+
+def pixel_hash(image: np.ndarray) -> str:
+    """图像像素缓冲区哈希（含形状和类型，与文件编码格式无关）
+    SHA-256 在多数 CPU 上有硬件加速，1080p 截图约 5ms"""
+    h = hashlib.sha256()
+    h.update(f"{image.shape}{image.dtype}".encode())
+    h.update(np.ascontiguousarray(image).data)
+    return h.hexdigest()
+
+
+def file_hash(path: str) -> str:
+    """文件内容哈希"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def template_fingerprint(roots: Tuple[str, ...] = TEMPLATE_ROOTS) -> str:
+    """模板集指纹：所有模板 PNG 的相对路径、大小和修改时间
+    （预编译包由 PNG 生成，不参与指纹）"""
+    h = hashlib.sha256()
+    for root in roots:
+        if not os.path.isdir(root):
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if not filename.endswith('.png'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                st = os.stat(path)
+                h.update(f"{path}|{st.st_size}|{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+class ResultCache:
+    """识别结果持久化缓存（内容寻址 + LRU 淘汰）"""
+    
+    def __init__(self, cache_dir: str = '.result_cache', max_entries: int = 256):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+    
+    def key(self, image: np.ndarray, **params) -> str:
+        """缓存键：像素哈希 + 识别参数 + 模板集指纹"""
+        h = hashlib.sha256()
+        h.update(pixel_hash(image).encode())
+        h.update(json.dumps(params, sort_keys=True).encode())
+        h.update(template_fingerprint().encode())
+        return h.hexdigest()
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+    
+    def get(self, key: str) -> Optional[Dict]:
+        """读取缓存结果，未命中返回 None"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                outcome = json.load(f)
+            os.utime(path)  # 刷新 LRU 顺序
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        outcome['card_size'] = tuple(outcome['card_size'])
+        outcome['template_dirs'] = tuple(outcome['template_dirs'])
+        return outcome
+    
+    def put(self, key: str, outcome: Dict):
+        """写入识别结果（不含用时），并按 LRU 淘汰多余条目"""
+        entry = {k: v for k, v in outcome.items() if k not in ('timings', 'cached')}
+        tmp_path = self._path(key) + f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False, default=float)
+        os.replace(tmp_path, self._path(key))
+        self._evict()
+    
+    def _evict(self):
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith('.json'):
+                path = os.path.join(self.cache_dir, filename)
+                try:
+                    entries.append((os.stat(path).st_mtime_ns, path))
+                except OSError:
+                    continue
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort()
+        for _, path in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    def clear(self):
+        """清空缓存"""
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith('.json'):
+                os.remove(os.path.join(self.cache_dir, filename))
@@ -37,17 +37,23 @@ print("数字提取完成")
 print("\n[步骤3/3] 识别数字并生成布局...")
 card_dir = "Single_Card_Images"
 card_files = [f for f in os.listdir(card_dir) if f.endswith('.png')]
-template_set = "set_1"
+template_set = match_numbers.CANONICAL_SET_NAME
+card_size = None
 if card_files:
     first_card = os.path.join(card_dir, card_files[0])
     img = cv2.imread(first_card)
     if img is not None:
         h, w = img.shape[:2]
         print(f"单张纸牌尺寸: {w}x{h}")
-        if w >= 200 or h >= 80:
-            template_set = "set_2880x1800"
-        else:
-            template_set = "set_1920x1080"
+        card_size = (w, h)
+        # 用点数图像探测各模板集（同 'auto'）
+        rank_files = sorted(f for f in os.listdir('Card_Rank_Images') if f.endswith('.png'))
+        samples = [(cv2.imread(os.path.join('Card_Rank_Images', f), cv2.IMREAD_GRAYSCALE),
+                    '_r' if '_r.' in f else '_b') for f in rank_files]
+        rank_dir, _ = match_numbers.resolve_template_dirs(
+            match_numbers.select_template_set('legacy', card_size, samples))
+        if rank_dir:
+            template_set = os.path.basename(rank_dir)
 
 template_dir = os.path.join('Card_Rank_Templates', template_set)
 print(f"使用模板集: {template_set}")
@@ -60,7 +66,7 @@ fail_count = 0
 
 for filename in image_files:
     fpath = os.path.join(input_dir, filename)
-    number, confidence, match_count, process_time = match_numbers.match_card_rank(fpath, template_dir)
+    number, confidence, match_count, process_time = match_numbers.match_card_rank(fpath, template_dir, card_size)
     color_simple = 'r' if '_r.' in filename else 'b'
     if number:
         results.append({'number': number, 'color': color_simple, 'filename': filename})